@@ -1,4 +1,5 @@
 from .server import app
 from .client import SteamWatchlistAPIClient
+from .direct_client import DirectWatchlistAPIClient
 
-__all__ = ['app', 'SteamWatchlistAPIClient']
\ No newline at end of file
+__all__ = ['app', 'SteamWatchlistAPIClient', 'DirectWatchlistAPIClient']
\ No newline at end of file
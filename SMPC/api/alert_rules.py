@@ -0,0 +1,295 @@
+"""
+Правила алертов по относительному движению цены (изменение на X% за окно, отклонение на K сигм
+от среднего за окно), проверяемые по скользящим окнам в памяти процесса API
+"""
+import logging
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Deque, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+from uuid import UUID
+
+from SMPC.api.analytics import PriceRow
+from SMPC.api.threshold_index import normalize_currency
+
+logger = logging.getLogger(__name__)
+
+RULE_TYPES = ('pct_move', 'zscore')
+
+# Меньше точек в окне - z-score не считается (среднее и разброс еще не устоялись)
+ZSCORE_MIN_POINTS = 10
+
+# Точки истории в формате PriceRow, отсортированные по item_id и времени
+PricePoints = Iterable[PriceRow]
+
+
+class AlertRule(NamedTuple):
+    """Правило алерта элемента watchlist с валютой владельца"""
+    rule_id: UUID
+    watchlist_id: UUID
+    user_id: UUID
+    item_id: UUID
+    currency: str
+    rule_type: str
+    threshold: float
+    window_minutes: int
+    armed: bool
+
+
+class RunningWindow:
+    """
+    Цены предмета за последние span: точки в deque, суммы и суммы квадратов по USD и RUB.
+    Добавление точки и вытеснение устаревших - O(1) амортизированно, среднее и разброс - O(1).
+    Суммы считаются от первой цены окна (сдвиг), чтобы разность E[x^2] - E[x]^2 не теряла точность.
+    """
+    
+    __slots__ = ('span', 'points', 'shift', 'sums', 'squares')
+    
+    def __init__(self, span: timedelta):
+        self.span = span
+        self.points: Deque[Tuple[datetime, float, float]] = deque()
+        self.shift = (0.0, 0.0)
+        self.sums = [0.0, 0.0]
+        self.squares = [0.0, 0.0]
+    
+    def _reset(self) -> None:
+        """Пересчитать суммы заново (при пустом или одноточечном окне, чтобы не копить ошибку округления)"""
+        if self.points:
+            self.shift = self.points[0][1:]
+        self.sums = [0.0, 0.0]
+        self.squares = [0.0, 0.0]
+        for point in self.points:
+            self._account(point, 1.0)
+    
+    def _account(self, point: Tuple[datetime, float, float], sign: float) -> None:
+        for index in (0, 1):
+            delta = point[index + 1] - self.shift[index]
+            self.sums[index] += sign * delta
+            self.squares[index] += sign * delta * delta
+    
+    def push(self, at: datetime, usd: float, rub: float) -> None:
+        """Добавить точку и вытеснить точки старше at - span"""
+        if self.points and at < self.points[-1][0]:
+            # Часы БД и API могут немного расходиться - время в окне не убывает
+            at = self.points[-1][0]
+        point = (at, float(usd), float(rub))
+        self.points.append(point)
+        if len(self.points) == 1:
+            self._reset()
+        else:
+            self._account(point, 1.0)
+        
+        horizon = at - self.span
+        evicted = False
+        while self.points[0][0] < horizon:
+            self._account(self.points.popleft(), -1.0)
+            evicted = True
+        if evicted and len(self.points) == 1:
+            self._reset()
+    
+    def first(self, index: int) -> Optional[float]:
+        """Самая старая цена в окне (0 - USD, 1 - RUB)"""
+        return self.points[0][index + 1] if self.points else None
+    
+    def mean_std(self, index: int) -> Tuple[float, float]:
+        """Среднее и стандартное отклонение (ddof=0) цен окна (0 - USD, 1 - RUB)"""
+        count = len(self.points)
+        mean = self.sums[index] / count
+        variance = max(self.squares[index] / count - mean * mean, 0.0)
+        return mean + self.shift[index], variance ** 0.5
+    
+    def __len__(self) -> int:
+        return len(self.points)
+
+
+class AlertRuleEngine:
+    """
+    Правила алертов всех элементов watchlist и скользящие окна цен предметов, на которые они ссылаются
+    (одно окно на пару предмет/длина окна, общее для всех правил с этим окном).
+    
+    Каждая новая цена предмета (observe) сдвигает его окна и проверяет только его правила - O(1) на правило,
+    без запросов истории при каждой проверке. Сработавшее взведенное правило попадает в pending и
+    отдается в рассылку, пока бот не подтвердит отправку (ack); после этого правило не срабатывает,
+    пока условие не перестанет выполняться.
+    
+    pct_move: |цена / самая старая цена окна - 1| * 100 >= threshold.
+    zscore: |цена - среднее окна| / стандартное отклонение окна >= threshold, окно - без новой точки.
+    """
+    
+    def __init__(self, zscore_min_points: int = ZSCORE_MIN_POINTS):
+        self.zscore_min_points = zscore_min_points
+        self._rules: Dict[UUID, AlertRule] = {}
+        self._by_item: Dict[UUID, Set[UUID]] = {}
+        self._windows: Dict[Tuple[UUID, int], RunningWindow] = {}
+        self._pending: Dict[UUID, Dict[str, Any]] = {}
+        # False, пока правила не загружены при старте
+        self.ready = False
+    
+    def build(self, rules: Iterable[AlertRule], points: PricePoints) -> None:
+        """Загрузить правила и заполнить окна историей цен (без проверки правил)"""
+        for index in (self._rules, self._by_item, self._windows, self._pending):
+            index.clear()
+        for rule in rules:
+            self._register(rule)
+        for item_id, at, usd, rub in points:
+            self._push(item_id, at, usd, rub)
+        self.ready = True
+        logger.info(f"Alert rules loaded: {len(self._rules)} rules, {len(self._windows)} price windows")
+    
+    def _register(self, rule: AlertRule) -> AlertRule:
+        rule = rule._replace(currency=normalize_currency(rule.currency))
+        self._rules[rule.rule_id] = rule
+        self._by_item.setdefault(rule.item_id, set()).add(rule.rule_id)
+        key = (rule.item_id, rule.window_minutes)
+        if key not in self._windows:
+            self._windows[key] = RunningWindow(timedelta(minutes=rule.window_minutes))
+        return rule
+    
+    def _push(self, item_id: UUID, at: datetime, usd: float, rub: float) -> None:
+        # Окно общее для правил с одинаковой длиной - точка добавляется в него один раз
+        for window_minutes in {self._rules[rule_id].window_minutes for rule_id in self._by_item.get(item_id, ())}:
+            self._windows[(item_id, window_minutes)].push(at, usd, rub)
+    
+    def has_window(self, item_id: UUID, window_minutes: int) -> bool:
+        """Есть ли уже окно цен предмета такой длины (тогда новому правилу не нужна история)"""
+        return (item_id, window_minutes) in self._windows
+    
+    def add(self, rule: AlertRule, points: PricePoints = ()) -> None:
+        """Добавить правило; points заполняют его окно, если окна такой длины у предмета еще не было"""
+        self.discard(rule.rule_id)
+        key = (rule.item_id, rule.window_minutes)
+        is_new_window = key not in self._windows
+        rule = self._register(rule)
+        if is_new_window:
+            window = self._windows[key]
+            for _, at, usd, rub in points:
+                window.push(at, usd, rub)
+    
+    def discard(self, rule_id: UUID) -> Optional[AlertRule]:
+        """Удалить правило и окно, если на него больше не ссылаются правила"""
+        rule = self._rules.pop(rule_id, None)
+        if rule is None:
+            return None
+        self._pending.pop(rule_id, None)
+        item_rules = self._by_item[rule.item_id]
+        item_rules.discard(rule_id)
+        if not item_rules:
+            del self._by_item[rule.item_id]
+        if not any(self._rules[other].window_minutes == rule.window_minutes for other in item_rules):
+            del self._windows[(rule.item_id, rule.window_minutes)]
+        return rule
+    
+    def discard_user_item(self, user_id: UUID, item_id: UUID) -> int:
+        """Удалить правила элемента watchlist по пользователю и предмету (каскадное удаление в БД)"""
+        rule_ids = [
+            rule_id for rule_id in self._by_item.get(item_id, ())
+            if self._rules[rule_id].user_id == user_id
+        ]
+        for rule_id in rule_ids:
+            self.discard(rule_id)
+        return len(rule_ids)
+    
+    def set_user_currency(self, user_id: UUID, currency: str) -> int:
+        """Перевести правила пользователя на другую валюту"""
+        currency = normalize_currency(currency)
+        moved = 0
+        for rule_id, rule in list(self._rules.items()):
+            if rule.user_id == user_id and rule.currency != currency:
+                self._rules[rule_id] = rule._replace(currency=currency)
+                self._pending.pop(rule_id, None)
+                moved += 1
+        return moved
+    
+    def _check(self, rule: AlertRule, window: RunningWindow, price: float,
+               zscore_stats: Optional[Tuple[float, float]]) -> Optional[Tuple[float, float]]:
+        """(значение, опорная цена), если условие правила выполняется"""
+        if rule.rule_type == 'pct_move':
+            reference = window.first(1 if rule.currency == 'rub' else 0)
+            if not reference or reference <= 0:
+                return None
+            value = (price / reference - 1.0) * 100.0
+        else:
+            if zscore_stats is None:
+                return None
+            reference, std = zscore_stats
+            if std <= 0:
+                return None
+            value = (price - reference) / std
+        return (value, reference) if abs(value) >= rule.threshold else None
+    
+    def observe(self, item_id: UUID, usd: float, rub: float, at: datetime) -> List[UUID]:
+        """
+        Новая цена предмета: сдвинуть его окна и проверить его правила.
+        Возвращает правила, которые снова взведены (условие перестало выполняться после отправки)
+        """
+        rule_ids = self._by_item.get(item_id)
+        if not rule_ids:
+            return []
+        
+        # z-score считается относительно окна до новой точки
+        before: Dict[Tuple[int, int], Optional[Tuple[float, float]]] = {}
+        for rule_id in rule_ids:
+            rule = self._rules[rule_id]
+            index = 1 if rule.currency == 'rub' else 0
+            window = self._windows[(item_id, rule.window_minutes)]
+            if rule.rule_type == 'zscore' and (rule.window_minutes, index) not in before:
+                before[(rule.window_minutes, index)] = (
+                    window.mean_std(index) if len(window) >= self.zscore_min_points else None
+                )
+        self._push(item_id, at, usd, rub)
+        
+        rearmed = []
+        for rule_id in rule_ids:
+            rule = self._rules[rule_id]
+            index = 1 if rule.currency == 'rub' else 0
+            price = rub if index else usd
+            window = self._windows[(item_id, rule.window_minutes)]
+            result = self._check(rule, window, price, before.get((rule.window_minutes, index)))
+            if result is None:
+                # Условие ушло до отправки - алерт неактуален
+                self._pending.pop(rule_id, None)
+                if not rule.armed:
+                    self._rules[rule_id] = rule._replace(armed=True)
+                    rearmed.append(rule_id)
+            elif rule.armed:
+                value, reference = result
+                self._pending[rule_id] = {
+                    'rule_id': rule_id,
+                    'watchlist_id': rule.watchlist_id,
+                    'item_id': item_id,
+                    'rule_type': rule.rule_type,
+                    'threshold': rule.threshold,
+                    'window_minutes': rule.window_minutes,
+                    'value': value,
+                    'reference': reference,
+                    'triggered_at': at,
+                }
+        return rearmed
+    
+    def observe_batch(self, prices: Iterable[Dict[str, Any]], at: datetime) -> List[UUID]:
+        """observe для строк пакетного обновления цен (id, new_usd, new_rub)"""
+        rearmed = []
+        for row in prices:
+            rearmed.extend(self.observe(row['id'], row['new_usd'], row['new_rub'], at))
+        return rearmed
+    
+    def pending(self, item_ids: Optional[Iterable[UUID]] = None) -> List[Dict[str, Any]]:
+        """Сработавшие правила, отправка которых еще не подтверждена (только по item_ids, если переданы)"""
+        if item_ids is None:
+            return list(self._pending.values())
+        item_ids = set(item_ids)
+        return [trigger for trigger in self._pending.values() if trigger['item_id'] in item_ids]
+    
+    def ack(self, rule_ids: Iterable[UUID]) -> List[Dict[str, Any]]:
+        """Отметить правила как отправленные: до ухода условия они не сработают снова"""
+        acked = []
+        for rule_id in rule_ids:
+            trigger = self._pending.pop(rule_id, None)
+            # Условие ушло до подтверждения - правило остается взведенным
+            if trigger is None:
+                continue
+            self._rules[rule_id] = self._rules[rule_id]._replace(armed=False)
+            acked.append(trigger)
+        return acked
+    
+    def __len__(self) -> int:
+        return len(self._rules)
@@ -0,0 +1,231 @@
+"""
+Аналитика по истории цен: скользящие средние, волатильность, изменение цены и z-score на NumPy
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+from uuid import UUID
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Размер блока при векторном расчете EMA: decay ** -BLOCK не должен переполнять float64
+EMA_BLOCK = 128
+
+# (item_id, время, цена USD, цена RUB)
+PriceRow = Tuple[UUID, datetime, float, float]
+# Строки истории, отсортированные по item_id и времени
+PriceRows = List[PriceRow]
+PriceLoader = Callable[[Optional[List[UUID]], datetime], Awaitable[PriceRows]]
+
+
+def rolling_mean_std(values: np.ndarray, window: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Скользящие среднее и стандартное отклонение (ddof=0) по окну window через кумулятивные суммы"""
+    sums = np.cumsum(np.insert(values, 0, 0.0))
+    squares = np.cumsum(np.insert(values * values, 0, 0.0))
+    mean = (sums[window:] - sums[:-window]) / window
+    variance = (squares[window:] - squares[:-window]) / window - mean * mean
+    return mean, np.sqrt(np.maximum(variance, 0.0))
+
+
+def ema(values: np.ndarray, span: int) -> np.ndarray:
+    """
+    Экспоненциальное среднее с alpha = 2 / (span + 1), начиная с первого значения.
+    Внутри блока: ema_i = decay^(i+1) * prev + alpha * decay^i * sum_{k<=i} x_k * decay^-k
+    """
+    if span <= 1 or len(values) == 0:
+        return values.astype(np.float64, copy=True)
+    alpha = 2.0 / (span + 1)
+    decay = 1.0 - alpha
+    result = np.empty(len(values), dtype=np.float64)
+    previous = float(values[0])
+    for start in range(0, len(values), EMA_BLOCK):
+        block = values[start:start + EMA_BLOCK]
+        powers = decay ** np.arange(len(block))
+        result[start:start + len(block)] = (
+            decay * powers * previous + alpha * powers * np.cumsum(block / powers)
+        )
+        previous = result[start + len(block) - 1]
+    return result
+
+
+def series_stats(values: np.ndarray, window: int, pct_periods: int, zscore_threshold: float) -> Dict[str, Any]:
+    """
+    Статистика ряда цен за один векторный проход: последняя цена, SMA и EMA по window,
+    волатильность (стандартное отклонение лог-доходностей за window периодов, в долях),
+    изменение цены за pct_periods периодов и z-score последней цены относительно окна
+    """
+    stats: Dict[str, Any] = {
+        'points': int(len(values)), 'last': None, 'sma': None, 'ema': None,
+        'volatility': None, 'pct_change': None, 'zscore': None, 'anomaly': False,
+    }
+    if len(values) == 0:
+        return stats
+    stats['last'] = float(values[-1])
+    stats['ema'] = float(ema(values, window)[-1])
+    
+    effective_window = min(window, len(values))
+    mean, std = rolling_mean_std(values, effective_window)
+    stats['sma'] = float(mean[-1])
+    if std[-1] > 0:
+        stats['zscore'] = float((values[-1] - mean[-1]) / std[-1])
+        stats['anomaly'] = abs(stats['zscore']) >= zscore_threshold
+    
+    positive = values[values > 0]
+    if len(positive) >= 3:
+        returns = np.diff(np.log(positive))
+        stats['volatility'] = float(rolling_mean_std(returns, min(window, len(returns)))[1][-1])
+    if len(values) > pct_periods and values[-1 - pct_periods] > 0:
+        stats['pct_change'] = float(values[-1] / values[-1 - pct_periods] - 1.0)
+    return stats
+
+
+class ItemSeries:
+    """Ряд цен предмета в непрерывных массивах и кэш посчитанной статистики"""
+    
+    __slots__ = ('times', 'usd', 'rub', 'version', 'stats')
+    
+    def __init__(self, times: np.ndarray, usd: np.ndarray, rub: np.ndarray, version: int):
+        self.times = times
+        self.usd = usd
+        self.rub = rub
+        self.version = version
+        self.stats: Optional[Dict[str, Any]] = None
+    
+    def extend(self, times: np.ndarray, usd: np.ndarray, rub: np.ndarray, since: np.datetime64) -> None:
+        """Дописать новые точки; последняя точка кэша заменяется, если ее бакет пересчитан"""
+        keep = self.times < times[0] if len(times) else slice(None)
+        self.times = np.concatenate([self.times[keep], times])
+        self.usd = np.concatenate([self.usd[keep], usd])
+        self.rub = np.concatenate([self.rub[keep], rub])
+        start = np.searchsorted(self.times, since)
+        if start:
+            self.times, self.usd, self.rub = self.times[start:], self.usd[start:], self.rub[start:]
+        self.stats = None
+
+
+class PriceAnalytics:
+    """
+    Кэш статистики цен по предметам поверх часовых сверток истории.
+    
+    Ряды загружаются в массивы NumPy один раз, дальше при появлении новых сверток (invalidate)
+    догружается только хвост после последней точки, и статистика пересчитывается при следующем запросе.
+    """
+    
+    def __init__(self, loader: PriceLoader, lookback_days: int = 30, window: int = 24,
+                 pct_periods: int = 24, zscore_threshold: float = 2.5):
+        """
+        Args:
+            loader: Загрузка точек (item_id, время, USD, RUB) по списку предметов (None - все) начиная с момента
+            lookback_days: Глубина истории в днях
+            window: Окно SMA/EMA/волатильности/z-score в периодах
+            pct_periods: Число периодов для изменения цены
+            zscore_threshold: Порог |z-score| для аномалии
+        """
+        self.loader = loader
+        self.lookback = timedelta(days=lookback_days)
+        self.window = window
+        self.pct_periods = pct_periods
+        self.zscore_threshold = zscore_threshold
+        self.version = 0
+        self._series: Dict[UUID, ItemSeries] = {}
+        self._all_loaded = False
+        # Загрузка пересобирает и дописывает ряды между await: запросы обслуживаются по одному
+        self._lock = asyncio.Lock()
+    
+    def invalidate(self) -> None:
+        """Отметить, что в истории появились новые точки (дозагрузка - лениво, при следующем запросе)"""
+        self.version += 1
+    
+    @staticmethod
+    def _split(rows: PriceRows) -> Iterable[Tuple[UUID, np.ndarray, np.ndarray, np.ndarray]]:
+        """Разбить строки, отсортированные по item_id, на массивы по предметам"""
+        if not rows:
+            return
+        item_ids, times, usd, rub = zip(*rows)
+        times = np.array([np.datetime64(moment.astimezone(timezone.utc).replace(tzinfo=None), 'us') for moment in times])
+        usd = np.asarray(usd, dtype=np.float64)
+        rub = np.asarray(rub, dtype=np.float64)
+        boundaries = [0] + [i for i in range(1, len(item_ids)) if item_ids[i] != item_ids[i - 1]] + [len(item_ids)]
+        for start, end in zip(boundaries, boundaries[1:]):
+            yield item_ids[start], times[start:end], usd[start:end], rub[start:end]
+    
+    async def _load_full(self, item_ids: Optional[List[UUID]], horizon: datetime) -> None:
+        """Загрузить ряды целиком (None - все предметы)"""
+        rows = await self.loader(item_ids, horizon)
+        if item_ids is None:
+            self._series = {}
+        for item_id, times, usd, rub in self._split(rows):
+            self._series[item_id] = ItemSeries(times, usd, rub, self.version)
+        for item_id in item_ids or ():
+            if item_id not in self._series:
+                # Истории нет - пустой ряд, чтобы не ходить в БД до следующего invalidate
+                self._series[item_id] = ItemSeries(
+                    np.array([], dtype='datetime64[us]'), np.array([]), np.array([]), self.version
+                )
+    
+    async def _load_tail(self, item_ids: Optional[List[UUID]], stale: List[UUID], horizon: datetime) -> None:
+        """Догрузить точки после последней точки устаревших рядов (None - по всем предметам, включая новые)"""
+        tail_since = min(
+            (self._series[item_id].times[-1] for item_id in stale if len(self._series[item_id].times)),
+            default=None
+        )
+        since = tail_since.astype(datetime).replace(tzinfo=timezone.utc) if tail_since is not None else horizon
+        rows = await self.loader(item_ids, since)
+        horizon64 = np.datetime64(horizon.astimezone(timezone.utc).replace(tzinfo=None), 'us')
+        for item_id, times, usd, rub in self._split(rows):
+            series = self._series.get(item_id)
+            if series is None:
+                self._series[item_id] = ItemSeries(times, usd, rub, self.version)
+            else:
+                series.extend(times, usd, rub, horizon64)
+        for item_id in stale:
+            self._series[item_id].version = self.version
+    
+    async def _refresh(self, item_ids: Optional[List[UUID]]) -> None:
+        """Загрузить отсутствующие ряды целиком, устаревшие - только хвостом"""
+        horizon = datetime.now(timezone.utc) - self.lookback
+        if item_ids is None and not self._all_loaded:
+            await self._load_full(None, horizon)
+            self._all_loaded = True
+            return
+        
+        targets = list(self._series) if item_ids is None else item_ids
+        missing = [item_id for item_id in targets if item_id not in self._series]
+        if missing:
+            await self._load_full(missing, horizon)
+        stale = [item_id for item_id in targets if self._series[item_id].version < self.version]
+        if stale:
+            await self._load_tail(None if item_ids is None else stale, stale, horizon)
+    
+    def _stats(self, item_id: UUID, series: ItemSeries) -> Dict[str, Any]:
+        if series.stats is None:
+            series.stats = {
+                'item_id': item_id,
+                'as_of': series.times[-1].astype(datetime).replace(tzinfo=timezone.utc) if len(series.times) else None,
+                'window': self.window,
+                'pct_periods': self.pct_periods,
+                'usd': series_stats(series.usd, self.window, self.pct_periods, self.zscore_threshold),
+                'rub': series_stats(series.rub, self.window, self.pct_periods, self.zscore_threshold),
+            }
+        return series.stats
+    
+    async def get(self, item_ids: List[UUID]) -> Dict[UUID, Dict[str, Any]]:
+        """Статистика по предметам (из кэша, с дозагрузкой новых точек)"""
+        async with self._lock:
+            await self._refresh(item_ids)
+            return {item_id: self._stats(item_id, self._series[item_id]) for item_id in item_ids}
+    
+    async def anomalies(self, currency: str = 'usd', limit: int = 50) -> List[Dict[str, Any]]:
+        """Предметы с аномальной последней ценой (|z-score| >= порога) по всем предметам, по убыванию |z|"""
+        async with self._lock:
+            await self._refresh(None)
+            currency = currency.lower()
+            found = [
+                stats for stats in (self._stats(item_id, series) for item_id, series in self._series.items())
+                if stats[currency]['anomaly']
+            ]
+        found.sort(key=lambda stats: abs(stats[currency]['zscore']), reverse=True)
+        return found[:limit]
@@ -1,22 +1,85 @@
 import httpx
 import asyncio
 import json
+import logging
+import importlib.util
 from uuid import UUID
-from typing import Optional, List, Dict, Any
+from datetime import datetime
+from typing import Optional, List, Dict, Any, AsyncIterator, Tuple
+
+logger = logging.getLogger(__name__)
 
 
 class SteamWatchlistAPIClient:
-    """Клиент для работы с Steam Watchlist API"""
+    """
+    Клиент для работы с Steam Watchlist API.
+    
+    Пул соединений ограничен (max_connections, ожидание свободного соединения - pool_timeout), простаивающие
+    keep-alive соединения закрываются через keepalive_expiry. У коротких запросов таймаут timeout,
+    у пакетных запросов и потоков алертов - long_timeout. Внутри процесса клиент общий (shared()),
+    открывается в start() и закрывается в close() при остановке бота.
+    """
+    
+    # Общие клиенты процесса по base_url и настройкам пула
+    _shared: Dict[Tuple, 'SteamWatchlistAPIClient'] = {}
     
-    def __init__(self, base_url: str = "http://localhost:8000"):
+    def __init__(self, base_url: str = "http://localhost:8000", max_connections: int = 20,
+                 max_keepalive_connections: int = 10, keepalive_expiry: float = 30.0, http2: bool = False,
+                 timeout: float = 10.0, connect_timeout: float = 5.0, pool_timeout: float = 5.0,
+                 long_timeout: float = 120.0):
+        """
+        Args:
+            base_url: Адрес API
+            max_connections: Максимум одновременных соединений
+            max_keepalive_connections: Сколько простаивающих соединений держать открытыми
+            keepalive_expiry: Через сколько секунд простоя закрывать соединение
+            http2: HTTP/2 (нужен пакет h2, иначе HTTP/1.1; по http:// без TLS uvicorn отвечает по HTTP/1.1)
+            timeout: Таймаут чтения/записи коротких запросов (секунды)
+            connect_timeout: Таймаут установки соединения
+            pool_timeout: Сколько ждать свободного соединения из пула
+            long_timeout: Таймаут пакетных запросов и потоков алертов
+        """
         self.base_url = base_url.rstrip("/")
-        self.client = httpx.AsyncClient()
+        if http2 and importlib.util.find_spec("h2") is None:
+            logger.warning("HTTP/2 requested but the h2 package is not installed, using HTTP/1.1")
+            http2 = False
+        self.http2 = http2
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout, pool=pool_timeout)
+        self.long_timeout = httpx.Timeout(long_timeout, connect=connect_timeout, pool=pool_timeout)
+        self._shared_key = None
+        self.client = self._create_client()
+    
+    def _create_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(limits=self.limits, timeout=self.timeout, http2=self.http2)
+    
+    @classmethod
+    def shared(cls, base_url: str = "http://localhost:8000", **options) -> 'SteamWatchlistAPIClient':
+        """Общий для процесса клиент с такими base_url и настройками (создается при первом вызове)"""
+        key = (base_url.rstrip("/"), tuple(sorted(options.items())))
+        client = cls._shared.get(key)
+        if client is None:
+            client = cls._shared[key] = cls(base_url, **options)
+            client._shared_key = key
+        return client
+    
+    async def start(self):
+        """Открыть пул соединений заново, если клиент был закрыт"""
+        if self.client.is_closed:
+            self.client = self._create_client()
     
     async def close(self):
-        """Закрыть соединение"""
+        """Закрыть соединения пула"""
         await self.client.aclose()
+        if self._shared_key is not None and SteamWatchlistAPIClient._shared.get(self._shared_key) is self:
+            del SteamWatchlistAPIClient._shared[self._shared_key]
     
     async def __aenter__(self):
+        await self.start()
         return self
     
     async def __aexit__(self, exc_type, exc_val, exc_tb):
@@ -57,19 +120,75 @@ class SteamWatchlistAPIClient:
         response.raise_for_status()
         return response.json()
     
+    async def create_items(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Создать или обновить множество товаров одним запросом.
+        
+        Каждый элемент: listing_id, name, current_price_usd, current_price_rub, url.
+        Возвращает item_id, listing_id, name в порядке запроса
+        """
+        data = {"items": [
+            {
+                "listing_id": int(item["listing_id"]),
+                "name": item["name"],
+                "current_price_usd": item["current_price_usd"],
+                "current_price_rub": item["current_price_rub"],
+                "url": item["url"]
+            }
+            for item in items
+        ]}
+        response = await self.client.post(f"{self.base_url}/items:batch", json=data, timeout=self.long_timeout)
+        response.raise_for_status()
+        return response.json()["items"]
+    
     async def get_item(self, item_id: UUID) -> Dict[str, Any]:
         """Получить товар по ID"""
         response = await self.client.get(f"{self.base_url}/items/{item_id}")
         response.raise_for_status()
         return response.json()
     
-    async def update_item_price(self, name: str, new_price_usd: float, new_price_rub: float) -> Dict[str, Any]:
-        """Обновить цены товара по имени"""
-        data = {"name": name, "new_price_usd": new_price_usd, "new_price_rub": new_price_rub}
+    async def update_item_price(self, name: str, new_price_usd: float, new_price_rub: float,
+                                price_rub_fx_calibrated_at: Optional[datetime] = None,
+                                price_rub_fx_error: Optional[float] = None,
+                                listing_id: Optional[int] = None) -> Dict[str, Any]:
+        """Обновить цены товара по имени (и listing_id, если известен)"""
+        data = {
+            "name": name,
+            "listing_id": listing_id,
+            "new_price_usd": new_price_usd,
+            "new_price_rub": new_price_rub,
+            "price_rub_fx_calibrated_at": price_rub_fx_calibrated_at.isoformat() if price_rub_fx_calibrated_at else None,
+            "price_rub_fx_error": price_rub_fx_error
+        }
         response = await self.client.put(f"{self.base_url}/items/price", json=data)
         response.raise_for_status()
         return response.json()
     
+    async def update_item_prices_batch(self, updates: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Обновить цены множества товаров одним запросом.
+        
+        Каждый элемент: id или name, new_price_usd, new_price_rub и
+        необязательные price_rub_fx_calibrated_at, price_rub_fx_error
+        """
+        data = {"updates": [
+            {
+                "id": str(update["id"]) if update.get("id") is not None else None,
+                "name": update.get("name"),
+                "new_price_usd": update["new_price_usd"],
+                "new_price_rub": update["new_price_rub"],
+                "price_rub_fx_calibrated_at": (
+                    update["price_rub_fx_calibrated_at"].isoformat()
+                    if update.get("price_rub_fx_calibrated_at") else None
+                ),
+                "price_rub_fx_error": update.get("price_rub_fx_error")
+            }
+            for update in updates
+        ]}
+        response = await self.client.put(f"{self.base_url}/items/prices:batch", json=data, timeout=self.long_timeout)
+        response.raise_for_status()
+        return response.json()
+    
     async def check_item_exists(self, item_name: str) -> Dict[str, Any]:
         """Проверить существование товара по имени"""
         response = await self.client.get(f"{self.base_url}/items/exists/{item_name}")
@@ -108,6 +227,57 @@ class SteamWatchlistAPIClient:
         response.raise_for_status()
         return response.json()
     
+    async def iter_subscriber_alerts(self) -> AsyncIterator[Dict[str, Any]]:
+        """Потоково получить сработавшие алерты всех подписчиков (по одному пользователю)"""
+        async with self.client.stream("GET", f"{self.base_url}/alerts/subscribers", timeout=self.long_timeout) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line:
+                    yield json.loads(line)
+    
+    async def iter_item_alerts(self, changes: List[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Потоково получить новые алерты наблюдателей изменившихся товаров (по одному пользователю).
+        changes - элементы с id, old_usd, old_rub, new_usd, new_rub
+        """
+        data = {"changes": [
+            {
+                "id": str(change["id"]),
+                "old_usd": change["old_usd"],
+                "old_rub": change["old_rub"],
+                "new_usd": change["new_usd"],
+                "new_rub": change["new_rub"],
+            }
+            for change in changes
+        ]}
+        async with self.client.stream("POST", f"{self.base_url}/alerts/evaluate", json=data, timeout=self.long_timeout) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line:
+                    yield json.loads(line)
+    
+    async def ack_alerts(self, acks: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Отметить алерты как отправленные: элементы с watchlist_id, side и price (для правил - side='rule' и rule_id)"""
+        data = {"acks": [
+            {
+                "watchlist_id": str(ack["watchlist_id"]),
+                "side": ack["side"],
+                "price": ack["price"],
+                "rule_id": str(ack["rule_id"]) if ack.get("rule_id") is not None else None,
+            }
+            for ack in acks
+        ]}
+        response = await self.client.post(f"{self.base_url}/alerts/ack", json=data)
+        response.raise_for_status()
+        return response.json()
+    
+    async def lookup_watchlist_item(self, user_id: UUID, listing_id: int, name: str) -> Dict[str, Any]:
+        """Найти товар по listing_id и имени и проверить, есть ли он в watchlist пользователя"""
+        params = {"listing_id": int(listing_id), "name": name}
+        response = await self.client.get(f"{self.base_url}/users/{user_id}/watchlist/lookup", params=params)
+        response.raise_for_status()
+        return response.json()
+    
     async def check_item_in_watchlist(self, user_id: UUID, item_id: UUID) -> Dict[str, Any]:
         """Проверить, есть ли предмет в watchlist пользователя"""
         response = await self.client.get(f"{self.base_url}/users/{user_id}/watchlist/check/{item_id}")
@@ -116,7 +286,14 @@ class SteamWatchlistAPIClient:
     
     async def get_all_items(self) -> List[Dict[str, Any]]:
         """Получить все товары"""
-        response = await self.client.get(f"{self.base_url}/items/")
+        response = await self.client.get(f"{self.base_url}/items/", timeout=self.long_timeout)
+        response.raise_for_status()
+        return response.json()
+    
+    async def get_items_stats(self, item_ids: List[UUID]) -> List[Dict[str, Any]]:
+        """Получить статистику цен товаров (SMA/EMA, волатильность, изменение, z-score)"""
+        data = {"item_ids": [str(item_id) for item_id in item_ids]}
+        response = await self.client.post(f"{self.base_url}/items/stats:batch", json=data, timeout=self.long_timeout)
         response.raise_for_status()
         return response.json()
 
@@ -142,6 +319,30 @@ class SteamWatchlistAPIClient:
         response.raise_for_status()
         return response.json()
     
+    async def create_alert_rule(self, user_id: UUID, watchlist_id: UUID, rule_type: str,
+                                threshold: float, window_minutes: int) -> Dict[str, Any]:
+        """Добавить правило алерта элементу watchlist (rule_type: pct_move - threshold в %, zscore - в сигмах)"""
+        data = {
+            "rule_type": rule_type,
+            "threshold": threshold,
+            "window_minutes": window_minutes
+        }
+        response = await self.client.post(f"{self.base_url}/users/{user_id}/watchlist/{watchlist_id}/rules", json=data)
+        response.raise_for_status()
+        return response.json()
+    
+    async def get_alert_rules(self, user_id: UUID) -> List[Dict[str, Any]]:
+        """Получить правила алертов пользователя"""
+        response = await self.client.get(f"{self.base_url}/users/{user_id}/rules")
+        response.raise_for_status()
+        return response.json()
+    
+    async def delete_alert_rule(self, user_id: UUID, rule_id: UUID) -> Dict[str, Any]:
+        """Удалить правило алерта пользователя"""
+        response = await self.client.delete(f"{self.base_url}/users/{user_id}/rules/{rule_id}")
+        response.raise_for_status()
+        return response.json()
+    
     # Служебные методы
     async def health_check(self) -> Dict[str, Any]:
         """Проверка состояния API"""
@@ -0,0 +1,341 @@
+"""
+Клиент Steam Watchlist API без HTTP: обработчики API вызываются в том же процессе
+"""
+import json
+import inspect
+from contextlib import AsyncExitStack, asynccontextmanager
+from uuid import UUID
+from datetime import datetime
+from typing import Optional, List, Dict, Any, AsyncIterator, Tuple
+
+import httpx
+from fastapi import HTTPException, params as fastapi_params
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from fastapi.routing import APIRoute
+from pydantic import TypeAdapter, ValidationError
+
+from SMPC.api import server
+
+
+class DirectWatchlistAPIClient:
+    """
+    Клиент с интерфейсом SteamWatchlistAPIClient, который вызывает обработчики API напрямую:
+    без TCP, middleware и JSON в запросах. Обработчики работают с CRUD на движке SQLAlchemy этого процесса,
+    ответы сериализуются по response_model маршрута в те же dict, что и по HTTP, а HTTPException
+    превращается в httpx.HTTPStatusError - вызывающий код не отличает транспорты.
+    
+    Состояние API (индекс порогов, правила алертов, кэш аналитики) поднимается в этом процессе в start(),
+    поэтому изменения через этот клиент видит только он: HTTP-сервер остается для health-check и
+    внешних клиентов, а маршруты с этим состоянием по HTTP отклоняет (server.require_api_state).
+    """
+    
+    def __init__(self, base_url: str = "http://direct"):
+        # base_url нужен только для URL в ошибках
+        self.base_url = base_url.rstrip("/")
+        self._routes: Dict[Tuple[str, str], APIRoute] = {
+            (method, route.path): route
+            for route in server.app.routes if isinstance(route, APIRoute)
+            for method in route.methods
+        }
+        self._adapters: Dict[Any, TypeAdapter] = {}
+        self._dependencies: Dict[Any, Dict[str, Any]] = {}
+        self._started = False
+    
+    async def start(self):
+        """Подключиться к БД и построить состояние API (как при старте сервера)"""
+        if not self._started:
+            await server.startup_event(owns_state=True)
+            self._started = True
+    
+    async def close(self):
+        """Остановить фоновые задачи API"""
+        if self._started:
+            await server.shutdown_event()
+            self._started = False
+    
+    async def __aenter__(self):
+        await self.start()
+        return self
+    
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+    
+    def _param_adapter(self, endpoint: Any, name: str) -> TypeAdapter:
+        """Валидатор аргумента обработчика по его аннотации (строится один раз)"""
+        adapter = self._adapters.get((endpoint, name))
+        if adapter is None:
+            annotation = inspect.signature(endpoint).parameters[name].annotation
+            adapter = self._adapters[(endpoint, name)] = TypeAdapter(annotation)
+        return adapter
+    
+    def _endpoint_dependencies(self, endpoint: Any) -> Dict[str, Any]:
+        """Зависимости обработчика (Depends с yield, например сессия запроса) по именам аргументов"""
+        dependencies = self._dependencies.get(endpoint)
+        if dependencies is None:
+            dependencies = self._dependencies[endpoint] = {
+                name: asynccontextmanager(parameter.default.dependency)
+                for name, parameter in inspect.signature(endpoint).parameters.items()
+                if isinstance(parameter.default, fastapi_params.Depends)
+            }
+        return dependencies
+    
+    def _response_adapter(self, route: APIRoute) -> TypeAdapter:
+        """Сериализатор ответа по response_model маршрута (строится один раз)"""
+        adapter = self._adapters.get(route.endpoint)
+        if adapter is None:
+            adapter = self._adapters[route.endpoint] = TypeAdapter(route.response_model)
+        return adapter
+    
+    def _status_error(self, method: str, path: str, status_code: int, detail: Any) -> httpx.HTTPStatusError:
+        """Ошибка в том виде, в каком ее вернул бы raise_for_status() HTTP-клиента"""
+        request = httpx.Request(method, f"{self.base_url}{path}")
+        response = httpx.Response(status_code, json={"detail": detail}, request=request)
+        return httpx.HTTPStatusError(f"Error {status_code} for {method} {path}: {detail}", request=request, response=response)
+    
+    async def _call(self, method: str, path: str, **params) -> Any:
+        """
+        Вызвать обработчик маршрута method path (шаблон пути FastAPI) с параметрами по именам аргументов.
+        Параметры валидируются по аннотациям обработчика (dict -> модель, str -> UUID и т.п.)
+        """
+        route = self._routes[(method, path)]
+        url_path = path.format(**params)
+        try:
+            kwargs = {
+                name: self._param_adapter(route.endpoint, name).validate_python(value)
+                for name, value in params.items()
+            }
+        except (ValidationError, ValueError) as e:
+            raise self._status_error(method, url_path, 422, str(e))
+        
+        try:
+            async with AsyncExitStack() as stack:
+                for name, dependency in self._endpoint_dependencies(route.endpoint).items():
+                    kwargs[name] = await stack.enter_async_context(dependency())
+                result = await route.endpoint(**kwargs)
+        except HTTPException as e:
+            raise self._status_error(method, url_path, e.status_code, e.detail)
+        
+        if isinstance(result, StreamingResponse) or route.response_model is None:
+            return result
+        adapter = self._response_adapter(route)
+        return adapter.dump_python(adapter.validate_python(result, from_attributes=True), mode='json')
+    
+    async def _stream(self, method: str, path: str, **params) -> AsyncIterator[Dict[str, Any]]:
+        """Построчно прочитать NDJSON-ответ обработчика"""
+        response = await self._call(method, path, **params)
+        async for chunk in response.body_iterator:
+            for line in chunk.splitlines():
+                if line:
+                    yield json.loads(line)
+    
+    # Методы для работы с пользователями
+    async def create_user(self, id: UUID, telegram_id: int, subscriber: bool = True, currency: str = "USD") -> Dict[str, Any]:
+        """Создать нового пользователя"""
+        data = {"id": id, "telegram_id": telegram_id, "subscriber": subscriber, "currency": currency}
+        return await self._call("POST", "/users/", user_data=data)
+    
+    async def get_user(self, user_id: UUID) -> Dict[str, Any]:
+        """Получить пользователя по ID"""
+        return await self._call("GET", "/users/{user_id}", user_id=user_id)
+    
+    async def get_subscribers(self) -> List[Dict[str, Any]]:
+        """Получить список всех пользователей-подписчиков"""
+        return await self._call("GET", "/users/subscribers")
+    
+    # Методы для работы с товарами
+    async def create_item(self, listing_id: int, name: str, current_price_usd: float, current_price_rub: float, url: str) -> Dict[str, Any]:
+        """Создать товар или получить существующий"""
+        data = {
+            "listing_id": listing_id,
+            "name": name,
+            "current_price_usd": current_price_usd,
+            "current_price_rub": current_price_rub,
+            "url": url
+        }
+        return await self._call("POST", "/items/", item_data=data)
+    
+    async def create_items(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Создать или обновить множество товаров одним запросом.
+        
+        Каждый элемент: listing_id, name, current_price_usd, current_price_rub, url.
+        Возвращает item_id, listing_id, name в порядке запроса
+        """
+        data = {"items": [
+            {
+                "listing_id": int(item["listing_id"]),
+                "name": item["name"],
+                "current_price_usd": item["current_price_usd"],
+                "current_price_rub": item["current_price_rub"],
+                "url": item["url"]
+            }
+            for item in items
+        ]}
+        return (await self._call("POST", "/items:batch", batch=data))["items"]
+    
+    async def get_item(self, item_id: UUID) -> Dict[str, Any]:
+        """Получить товар по ID"""
+        return await self._call("GET", "/items/{item_id}", item_id=item_id)
+    
+    async def update_item_price(self, name: str, new_price_usd: float, new_price_rub: float,
+                                price_rub_fx_calibrated_at: Optional[datetime] = None,
+                                price_rub_fx_error: Optional[float] = None,
+                                listing_id: Optional[int] = None) -> Dict[str, Any]:
+        """Обновить цены товара по имени (и listing_id, если известен)"""
+        data = {
+            "name": name,
+            "listing_id": listing_id,
+            "new_price_usd": new_price_usd,
+            "new_price_rub": new_price_rub,
+            "price_rub_fx_calibrated_at": price_rub_fx_calibrated_at,
+            "price_rub_fx_error": price_rub_fx_error
+        }
+        return await self._call("PUT", "/items/price", price_update=data)
+    
+    async def update_item_prices_batch(self, updates: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Обновить цены множества товаров одним запросом.
+        
+        Каждый элемент: id или name, new_price_usd, new_price_rub и
+        необязательные price_rub_fx_calibrated_at, price_rub_fx_error
+        """
+        data = {"updates": [
+            {
+                "id": update.get("id"),
+                "name": update.get("name"),
+                "new_price_usd": update["new_price_usd"],
+                "new_price_rub": update["new_price_rub"],
+                "price_rub_fx_calibrated_at": update.get("price_rub_fx_calibrated_at"),
+                "price_rub_fx_error": update.get("price_rub_fx_error")
+            }
+            for update in updates
+        ]}
+        return await self._call("PUT", "/items/prices:batch", batch=data)
+    
+    async def check_item_exists(self, item_name: str) -> Dict[str, Any]:
+        """Проверить существование товара по имени"""
+        return await self._call("GET", "/items/exists/{item_name}", item_name=item_name)
+    
+    async def add_to_watchlist(self, user_id: UUID, item_id: UUID,
+                              buy_target_price: float, sell_target_price: float, url: str) -> Dict[str, Any]:
+        """Добавить товар в watchlist пользователя"""
+        data = {
+            "item_id": item_id,
+            "buy_target_price": buy_target_price,
+            "sell_target_price": sell_target_price,
+            "url": url
+        }
+        return await self._call("POST", "/users/{user_id}/watchlist", user_id=user_id, watchlist_item=data)
+    
+    async def get_watchlist(self, user_id: UUID) -> List[Dict[str, Any]]:
+        """Получить watchlist пользователя"""
+        return await self._call("GET", "/users/{user_id}/watchlist", user_id=user_id)
+    
+    async def remove_from_watchlist(self, user_id: UUID, item_id: UUID) -> Dict[str, Any]:
+        """Удалить товар из watchlist пользователя"""
+        return await self._call("DELETE", "/users/{user_id}/watchlist/{item_id}", user_id=user_id, item_id=item_id)
+    
+    async def get_watchlist_alerts(self, user_id: UUID, currency: str = 'usd') -> Dict[str, Any]:
+        """Получить алерты по ценам из watchlist пользователя"""
+        return await self._call("GET", "/users/{user_id}/watchlist/alerts", user_id=user_id, currency=currency)
+    
+    async def iter_subscriber_alerts(self) -> AsyncIterator[Dict[str, Any]]:
+        """Потоково получить сработавшие алерты всех подписчиков (по одному пользователю)"""
+        async for user_alerts in self._stream("GET", "/alerts/subscribers"):
+            yield user_alerts
+    
+    async def iter_item_alerts(self, changes: List[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Потоково получить новые алерты наблюдателей изменившихся товаров (по одному пользователю).
+        changes - элементы с id, old_usd, old_rub, new_usd, new_rub
+        """
+        data = {"changes": [
+            {
+                "id": change["id"],
+                "old_usd": change["old_usd"],
+                "old_rub": change["old_rub"],
+                "new_usd": change["new_usd"],
+                "new_rub": change["new_rub"],
+            }
+            for change in changes
+        ]}
+        async for user_alerts in self._stream("POST", "/alerts/evaluate", request=data):
+            yield user_alerts
+    
+    async def ack_alerts(self, acks: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Отметить алерты как отправленные: элементы с watchlist_id, side и price (для правил - side='rule' и rule_id)"""
+        data = {"acks": [
+            {
+                "watchlist_id": ack["watchlist_id"],
+                "side": ack["side"],
+                "price": ack["price"],
+                "rule_id": ack.get("rule_id"),
+            }
+            for ack in acks
+        ]}
+        return await self._call("POST", "/alerts/ack", request=data)
+    
+    async def lookup_watchlist_item(self, user_id: UUID, listing_id: int, name: str) -> Dict[str, Any]:
+        """Найти товар по listing_id и имени и проверить, есть ли он в watchlist пользователя"""
+        return await self._call(
+            "GET", "/users/{user_id}/watchlist/lookup", user_id=user_id, listing_id=listing_id, name=name
+        )
+    
+    async def check_item_in_watchlist(self, user_id: UUID, item_id: UUID) -> Dict[str, Any]:
+        """Проверить, есть ли предмет в watchlist пользователя"""
+        return await self._call("GET", "/users/{user_id}/watchlist/check/{item_id}", user_id=user_id, item_id=item_id)
+    
+    async def get_all_items(self) -> List[Dict[str, Any]]:
+        """Получить все товары"""
+        return await self._call("GET", "/items/")
+    
+    async def get_items_stats(self, item_ids: List[UUID]) -> List[Dict[str, Any]]:
+        """Получить статистику цен товаров (SMA/EMA, волатильность, изменение, z-score)"""
+        return await self._call("POST", "/items/stats:batch", request={"item_ids": item_ids})
+    
+    async def change_user_subscription(self, user_id: UUID, subscriber: bool) -> Dict[str, Any]:
+        """Изменить статус подписки пользователя"""
+        return await self._call("PUT", "/subscription/{user_id}", user_id=user_id, request={"subscriber": subscriber})
+    
+    async def change_user_currency(self, user_id: UUID, currency: str) -> Dict[str, Any]:
+        """Изменить валюту пользователя"""
+        return await self._call("PUT", "/users/{user_id}/currency", user_id=user_id, request={"currency": currency})
+    
+    async def update_watchlist_item_prices(self, user_id: UUID, watchlist_id: UUID, buy_target_price: float, sell_target_price: float) -> Dict[str, Any]:
+        """Обновить цены покупки и продажи для элемента watchlist"""
+        data = {
+            "buy_target_price": buy_target_price,
+            "sell_target_price": sell_target_price
+        }
+        return await self._call(
+            "PUT", "/users/{user_id}/watchlist/{watchlist_id}/prices",
+            user_id=user_id, watchlist_id=watchlist_id, request=data
+        )
+    
+    async def create_alert_rule(self, user_id: UUID, watchlist_id: UUID, rule_type: str,
+                                threshold: float, window_minutes: int) -> Dict[str, Any]:
+        """Добавить правило алерта элементу watchlist (rule_type: pct_move - threshold в %, zscore - в сигмах)"""
+        data = {
+            "rule_type": rule_type,
+            "threshold": threshold,
+            "window_minutes": window_minutes
+        }
+        return await self._call(
+            "POST", "/users/{user_id}/watchlist/{watchlist_id}/rules",
+            user_id=user_id, watchlist_id=watchlist_id, rule=data
+        )
+    
+    async def get_alert_rules(self, user_id: UUID) -> List[Dict[str, Any]]:
+        """Получить правила алертов пользователя"""
+        return await self._call("GET", "/users/{user_id}/rules", user_id=user_id)
+    
+    async def delete_alert_rule(self, user_id: UUID, rule_id: UUID) -> Dict[str, Any]:
+        """Удалить правило алерта пользователя"""
+        return await self._call("DELETE", "/users/{user_id}/rules/{rule_id}", user_id=user_id, rule_id=rule_id)
+    
+    # Служебные методы
+    async def health_check(self) -> Dict[str, Any]:
+        """Проверка состояния API"""
+        result = await self._call("GET", "/health")
+        return jsonable_encoder(result)
@@ -1,20 +1,26 @@
 from fastapi import FastAPI, HTTPException, Depends, Request
+from fastapi.responses import StreamingResponse
 from starlette.middleware.base import BaseHTTPMiddleware
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import AsyncIterator, List, Literal, Optional
 from uuid import UUID, uuid4
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import asyncio
+import json
 import sys
 import os
 import time
 import logging
 import traceback
 from asyncpg.exceptions import UniqueViolationError
+from sqlalchemy.ext.asyncio import AsyncSession
 
 
-from SMPC.database import CRUD, create_session_factory, models
+from SMPC.database import CRUD, NotFoundError, create_session_factory, models
 from SMPC.database.models import User, Item, UserItemWatchlist
+from SMPC.api.threshold_index import ThresholdIndex, WatchlistThreshold
+from SMPC.api.alert_rules import AlertRuleEngine, AlertRule
+from SMPC.api.analytics import PriceAnalytics
 
 
 # Configure logging
@@ -89,6 +95,20 @@ class ItemCreate(BaseModel):
     url: str
 
 
+class ItemBatchCreate(BaseModel):
+    items: List[ItemCreate]
+
+
+class ItemBatchEntry(BaseModel):
+    item_id: UUID
+    listing_id: int
+    name: str
+
+
+class ItemBatchResponse(BaseModel):
+    items: List[ItemBatchEntry]
+
+
 class ItemResponse(BaseModel):
     id: UUID
     listing_id: int
@@ -96,6 +116,8 @@ class ItemResponse(BaseModel):
     current_price_usd: float
     current_price_rub: float
     url: str
+    price_rub_fx_calibrated_at: Optional[datetime] = None
+    price_rub_fx_error: Optional[float] = None
     
     
     class Config:
@@ -125,8 +147,40 @@ class WatchlistItemResponse(BaseModel):
 
 class ItemPriceUpdate(BaseModel):
     name: str
+    # Имя уникально только вместе с listing_id; без него обновляется товар с наименьшим listing_id
+    listing_id: Optional[int] = None
     new_price_usd: float
     new_price_rub: float
+    price_rub_fx_calibrated_at: Optional[datetime] = None
+    price_rub_fx_error: Optional[float] = None
+
+
+class ItemPriceBatchEntry(BaseModel):
+    id: Optional[UUID] = None
+    name: Optional[str] = None
+    new_price_usd: float
+    new_price_rub: float
+    price_rub_fx_calibrated_at: Optional[datetime] = None
+    price_rub_fx_error: Optional[float] = None
+
+
+class ItemPriceBatchUpdate(BaseModel):
+    updates: List[ItemPriceBatchEntry]
+
+
+class ItemPriceChange(BaseModel):
+    id: UUID
+    old_usd: float
+    old_rub: float
+    new_usd: float
+    new_rub: float
+
+
+class ItemPriceBatchResponse(BaseModel):
+    updated: int
+    item_ids: List[UUID]
+    not_found: List[str]
+    changes: List[ItemPriceChange]
 
 
 class PriceAlertItem(BaseModel):
@@ -146,6 +200,114 @@ class PriceAlertsResponse(BaseModel):
     sell: List[PriceAlertItem]
 
 
+class RuleAlertItem(BaseModel):
+    rule_id: UUID
+    watchlist_id: UUID
+    item_id: UUID
+    item_name: str
+    listing_id: int
+    current_price_usd: float
+    current_price_rub: float
+    rule_type: str
+    threshold: float
+    window_minutes: int
+    # Изменение в % (pct_move) или z-score (zscore) и опорная цена: начало окна или среднее окна
+    value: float
+    reference: float
+    url: str
+
+
+class SubscriberAlerts(BaseModel):
+    user_id: UUID
+    telegram_id: int
+    currency: str
+    buy: List[PriceAlertItem]
+    sell: List[PriceAlertItem]
+    rules: List[RuleAlertItem] = []
+
+
+class AlertEvaluateRequest(BaseModel):
+    item_ids: List[UUID] = []
+    # Старые и новые цены: по ним кандидаты ищутся в индексе порогов
+    changes: Optional[List[ItemPriceChange]] = None
+
+
+class AlertAck(BaseModel):
+    watchlist_id: UUID
+    side: Literal['buy', 'sell', 'rule']
+    price: float
+    rule_id: Optional[UUID] = None
+
+
+class AlertAckRequest(BaseModel):
+    acks: List[AlertAck]
+
+
+class PricePoint(BaseModel):
+    time: datetime
+    open_usd: float
+    high_usd: float
+    low_usd: float
+    close_usd: float
+    open_rub: float
+    high_rub: float
+    low_rub: float
+    close_rub: float
+    samples: int
+
+
+class ItemPriceHistoryResponse(BaseModel):
+    item_id: UUID
+    granularity: Literal['raw', '1h', '1d']
+    start: datetime
+    end: datetime
+    points: List[PricePoint]
+
+
+class SeriesStats(BaseModel):
+    points: int
+    last: Optional[float] = None
+    sma: Optional[float] = None
+    ema: Optional[float] = None
+    volatility: Optional[float] = None
+    pct_change: Optional[float] = None
+    zscore: Optional[float] = None
+    anomaly: bool = False
+
+
+class ItemStatsResponse(BaseModel):
+    item_id: UUID
+    as_of: Optional[datetime] = None
+    window: int
+    pct_periods: int
+    usd: SeriesStats
+    rub: SeriesStats
+
+
+class ItemStatsRequest(BaseModel):
+    item_ids: List[UUID]
+
+
+class AlertRuleCreate(BaseModel):
+    rule_type: Literal['pct_move', 'zscore']
+    # Проценты для pct_move, сигмы для zscore
+    threshold: float
+    window_minutes: int
+
+
+class AlertRuleResponse(BaseModel):
+    id: UUID
+    watchlist_id: UUID
+    item_id: UUID
+    item_name: str
+    rule_type: str
+    threshold: float
+    window_minutes: int
+    armed: bool
+    last_triggered_value: Optional[float] = None
+    last_triggered_at: Optional[datetime] = None
+
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Steam Watchlist API",
@@ -156,10 +318,213 @@ app = FastAPI(
 # Add logging middleware
 app.add_middleware(LoggingMiddleware)
 
+# Пороги watchlist в памяти: строится при старте, поддерживается эндпоинтами watchlist
+threshold_index = ThresholdIndex()
+
+# Правила алертов по движению цены и окна цен для них: загружаются при старте, цены - из пакетного обновления
+alert_rules = AlertRuleEngine()
+
+# С API_TRANSPORT=direct бот вызывает обработчики в своем процессе и индекс порогов и правила алертов живут там;
+# HTTP-сервер их изменений не видит, поэтому маршруты, которые читают или меняют это состояние, по HTTP отклоняются
+API_TRANSPORT = os.getenv("API_TRANSPORT", "http").lower()
+
+
+def require_api_state() -> None:
+    """
+    Зависимость маршрутов с состоянием в памяти. Подключается через dependencies= маршрута,
+    поэтому выполняется только для HTTP-запросов: прямой клиент вызывает обработчик без нее.
+    С API_TRANSPORT=direct по HTTP недоступны запись цен, изменение watchlist (добавление, удаление,
+    целевые цены), смена валюты, правила алертов и проверка алертов - только чтение
+    """
+    if API_TRANSPORT == 'direct':
+        raise HTTPException(
+            status_code=409,
+            detail="Alert state is owned by the bot process (API_TRANSPORT=direct), use the bot for this request"
+        )
+
+
+# Относительный зазор, на который цена должна выйти из зоны алерта, чтобы он снова взвелся
+ALERT_HYSTERESIS = float(os.getenv("ALERT_HYSTERESIS", "0.02"))
+
+
+# Price history: хранение сырых цен и сверток, выбор гранулярности для графиков
+HISTORY_RAW_RETENTION_DAYS = int(os.getenv("HISTORY_RAW_RETENTION_DAYS", "14"))
+HISTORY_HOURLY_RETENTION_DAYS = int(os.getenv("HISTORY_HOURLY_RETENTION_DAYS", "180"))
+HISTORY_RAW_MAX_WINDOW_HOURS = int(os.getenv("HISTORY_RAW_MAX_WINDOW_HOURS", "48"))
+HISTORY_HOURLY_MAX_WINDOW_DAYS = int(os.getenv("HISTORY_HOURLY_MAX_WINDOW_DAYS", "90"))
+HISTORY_MAINTENANCE_INTERVAL = int(os.getenv("HISTORY_MAINTENANCE_INTERVAL", "300"))
+# Обслуживание истории выполняет один процесс (API и бот с API_TRANSPORT=direct поднимают его оба)
+HISTORY_MAINTENANCE_LOCK_KEY = 0x534d5043
+
+price_history_task: Optional[asyncio.Task] = None
+
+# Статистика по часовым сверткам истории (периоды - часы)
+price_analytics = PriceAnalytics(
+    CRUD.get_price_history_closes,
+    lookback_days=int(os.getenv("ANALYTICS_LOOKBACK_DAYS", "30")),
+    window=int(os.getenv("ANALYTICS_WINDOW", "24")),
+    pct_periods=int(os.getenv("ANALYTICS_PCT_PERIODS", "24")),
+    zscore_threshold=float(os.getenv("ANALYTICS_ZSCORE_THRESHOLD", "2.5"))
+)
+
+
+async def run_price_history_maintenance(rolled_up_until: Optional[datetime]) -> datetime:
+    """
+    Одна итерация обслуживания истории цен: партиции на ближайшие дни, свертки 1h/1d
+    с момента прошлой итерации и удаление данных старше сроков хранения.
+    Возвращает момент, до которого посчитаны свертки
+    """
+    now = datetime.now(timezone.utc)
+    try:
+        created = await CRUD.ensure_price_history_partitions(now.date(), days=3)
+        if created:
+            logger.info(f"🗂️ Created price history partitions: {created}")
+    except Exception as e:
+        # Новые цены попадут в default-партицию и будут перенесены следующей итерацией;
+        # свертки и удаление старых данных от этого не зависят
+        logger.error(f"❌ Error creating price history partitions: {str(e)}")
+        logger.error(f"Traceback: {traceback.format_exc()}")
+    
+    raw_horizon = now - timedelta(days=HISTORY_RAW_RETENTION_DAYS)
+    if rolled_up_until is None:
+        # После перезапуска продолжаем с последнего посчитанного часа
+        rolled_up_until = await CRUD.latest_price_rollup('1h', raw_horizon) or raw_horizon
+    hourly = await CRUD.rollup_price_history('1h', rolled_up_until, now)
+    daily = await CRUD.rollup_price_history('1d', rolled_up_until, now)
+    if hourly:
+        price_analytics.invalidate()
+    
+    dropped = await CRUD.drop_price_history_partitions(raw_horizon.date())
+    deleted = await CRUD.delete_price_rollups('1h', now - timedelta(days=HISTORY_HOURLY_RETENTION_DAYS))
+    logger.info(
+        f"📊 Price history rolled up: {hourly} hourly, {daily} daily buckets; "
+        f"dropped partitions: {dropped or 'none'}, deleted {deleted} hourly buckets"
+    )
+    return now
+
+
+async def price_history_maintenance_loop():
+    """Фоновое обслуживание истории цен каждые HISTORY_MAINTENANCE_INTERVAL секунд"""
+    rolled_up_until = None
+    while True:
+        try:
+            async with CRUD.advisory_lock(HISTORY_MAINTENANCE_LOCK_KEY) as acquired:
+                if acquired:
+                    rolled_up_until = await run_price_history_maintenance(rolled_up_until)
+                else:
+                    # Свертки считает другой процесс: продолжить с последней свертки, если он остановится
+                    rolled_up_until = None
+                    price_analytics.invalidate()
+        except Exception as e:
+            logger.error(f"❌ Error in price history maintenance: {str(e)}")
+            logger.error(f"Traceback: {traceback.format_exc()}")
+        await asyncio.sleep(HISTORY_MAINTENANCE_INTERVAL)
+
+
+def choose_history_granularity(start: datetime, end: datetime) -> str:
+    """Самая детальная гранулярность, которая покрывает окно и не дает слишком много точек"""
+    now = datetime.now(timezone.utc)
+    span = end - start
+    if span <= timedelta(hours=HISTORY_RAW_MAX_WINDOW_HOURS) and start >= now - timedelta(days=HISTORY_RAW_RETENTION_DAYS):
+        return 'raw'
+    if span <= timedelta(days=HISTORY_HOURLY_MAX_WINDOW_DAYS) and start >= now - timedelta(days=HISTORY_HOURLY_RETENTION_DAYS):
+        return '1h'
+    return '1d'
+
+
+def alert_rule_from_dict(rule: dict) -> AlertRule:
+    return AlertRule(
+        rule_id=rule['id'], watchlist_id=rule['watchlist_id'], user_id=rule['user_id'], item_id=rule['item_id'],
+        currency=rule['currency'], rule_type=rule['rule_type'], threshold=rule['threshold'],
+        window_minutes=rule['window_minutes'], armed=rule['armed']
+    )
+
+
+async def load_alert_rules() -> None:
+    """Загрузить правила алертов и заполнить их окна сырой историей цен"""
+    rules = [alert_rule_from_dict(rule) async for rule in CRUD.stream_alert_rules()]
+    points = []
+    if rules:
+        longest = max(rule.window_minutes for rule in rules)
+        since = datetime.now(timezone.utc) - timedelta(minutes=longest)
+        points = await CRUD.get_price_history_points(list({rule.item_id for rule in rules}), since)
+    alert_rules.build(rules, points)
+
+
+async def load_rule_alerts(item_ids: Optional[List[UUID]] = None) -> dict:
+    """
+    Сработавшие правила, ожидающие отправки, сгруппированные по подписчикам (в формате SubscriberAlerts).
+    С item_ids - только правила этих товаров
+    """
+    triggers = alert_rules.pending(item_ids)
+    if not triggers:
+        return {}
+    targets = await CRUD.get_alert_rule_targets(list({trigger['watchlist_id'] for trigger in triggers}))
+    groups = {}
+    for trigger in triggers:
+        target = targets.get(trigger['watchlist_id'])
+        if target is None:
+            continue
+        group = groups.get(target['user_id'])
+        if group is None:
+            group = groups[target['user_id']] = {
+                'user_id': target['user_id'],
+                'telegram_id': target['telegram_id'],
+                'currency': target['currency'],
+                'buy': [],
+                'sell': [],
+                'rules': []
+            }
+        group['rules'].append(RuleAlertItem(
+            rule_id=trigger['rule_id'],
+            watchlist_id=trigger['watchlist_id'],
+            item_id=target['item_id'],
+            item_name=target['item_name'],
+            listing_id=target['listing_id'],
+            current_price_usd=target['current_price_usd'],
+            current_price_rub=target['current_price_rub'],
+            rule_type=trigger['rule_type'],
+            threshold=trigger['threshold'],
+            window_minutes=trigger['window_minutes'],
+            value=trigger['value'],
+            reference=trigger['reference'],
+            url=target['url']
+        ))
+    return groups
+
+
+async def with_rule_alerts(stream, item_ids: Optional[List[UUID]] = None):
+    """
+    Добавить к потоку алертов по порогам сработавшие правила (пользователи без алертов по порогам - в конце).
+    item_ids ограничивает правила товарами потока; без них добавляются все ожидающие правила
+    """
+    rule_groups = await load_rule_alerts(item_ids)
+    async for user_alerts in stream:
+        user_alerts['rules'] = rule_groups.pop(user_alerts['user_id'], {}).get('rules', [])
+        yield user_alerts
+    for user_alerts in rule_groups.values():
+        yield user_alerts
+
+
+async def get_db_session() -> AsyncIterator[AsyncSession]:
+    """
+    Сессия запроса (unit of work): операции CRUD эндпоинта идут на одном соединении из пула и в одной транзакции.
+    Выход из зависимости выполняется после отправки ответа, поэтому изменяющие эндпоинты вызывают commit сами
+    """
+    async with CRUD.unit_of_work() as session:
+        yield session
+
 
 # Initialize database session on startup
 @app.on_event("startup")
-async def startup_event():
+async def startup_event(owns_state: Optional[bool] = None):
+    """
+    Подключение к БД, состояние в памяти и обслуживание истории цен.
+    owns_state - процесс держит индекс порогов и правила алертов; по умолчанию (HTTP-сервер) - если
+    API_TRANSPORT не direct, прямой клиент бота передает True
+    """
+    if owns_state is None:
+        owns_state = API_TRANSPORT != 'direct'
     logger.info("🚀 Starting Steam Watchlist API...")
     try:
         session_factory = create_session_factory()
@@ -168,6 +533,46 @@ async def startup_event():
     except Exception as e:
         logger.error(f"❌ Failed to initialize database: {str(e)}")
         raise
+    
+    if owns_state:
+        await load_api_state()
+    else:
+        logger.info("ℹ️ API_TRANSPORT=direct: threshold index and alert rules are owned by the bot process, not loading them")
+    
+    # Обслуживание идет под advisory lock; процесс без блокировки только сбрасывает свой кэш аналитики
+    global price_history_task
+    price_history_task = asyncio.create_task(price_history_maintenance_loop())
+
+
+async def load_api_state() -> None:
+    """Построить индекс порогов и загрузить правила алертов"""
+    try:
+        started = time.time()
+        rows = [WatchlistThreshold(*row) async for row in CRUD.stream_watchlist_thresholds()]
+        threshold_index.build(rows)
+        logger.info(f"✅ Threshold index built in {time.time() - started:.2f}s: {len(threshold_index)} watchlist entries")
+    except Exception as e:
+        # Без индекса алерты по событиям проверяются по всем наблюдателям изменившихся товаров
+        logger.error(f"❌ Failed to build threshold index: {str(e)}")
+    
+    try:
+        started = time.time()
+        await load_alert_rules()
+        logger.info(f"✅ Alert rules loaded in {time.time() - started:.2f}s: {len(alert_rules)} rules")
+    except Exception as e:
+        # Без правил алерты по порогам работают как обычно
+        logger.error(f"❌ Failed to load alert rules: {str(e)}")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    logger.info("🛑 Stopping Steam Watchlist API...")
+    if price_history_task is not None:
+        price_history_task.cancel()
+        try:
+            await price_history_task
+        except asyncio.CancelledError:
+            pass
 
 
 # User endpoints
@@ -258,6 +663,40 @@ async def create_or_get_item(item_data: ItemCreate):
         raise HTTPException(status_code=500, detail=f"Error creating/updating item: {str(e)}")
 
 
+@app.post("/items:batch", response_model=ItemBatchResponse)
+async def create_or_get_items(batch: ItemBatchCreate):
+    """Создать или обновить множество товаров одним запросом к БД (импорт)"""
+    logger.info(f"📦 Creating/getting {len(batch.items)} items")
+    
+    try:
+        item_ids = await CRUD.create_or_get_items([
+            Item(
+                listing_id=item_data.listing_id,
+                name=item_data.name,
+                current_price_usd=item_data.current_price_usd,
+                current_price_rub=item_data.current_price_rub,
+                url=item_data.url
+            )
+            for item_data in batch.items
+        ])
+        
+        logger.info(f"✅ Items processed successfully: {len(batch.items)} entries -> {len(item_ids)} items")
+        # В порядке запроса, повторы получают тот же id
+        return ItemBatchResponse(items=[
+            ItemBatchEntry(
+                item_id=item_ids[(item_data.listing_id, item_data.name)],
+                listing_id=item_data.listing_id,
+                name=item_data.name
+            )
+            for item_data in batch.items
+        ])
+        
+    except Exception as e:
+        logger.error(f"❌ Error creating/updating {len(batch.items)} items: {str(e)}")
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail=f"Error creating/updating items: {str(e)}")
+
+
 @app.get("/items/", response_model=List[ItemResponse])
 async def get_all_items():
     """Получить все товары"""
@@ -287,23 +726,146 @@ async def get_item(item_id: UUID):
         raise HTTPException(status_code=500, detail=f"Error reading item: {str(e)}")
 
 
-@app.put("/items/price", response_model=dict)
-async def update_item_price(price_update: ItemPriceUpdate):
-    """Обновить цены товара по имени"""
+@app.get("/items/{item_id}/history", response_model=ItemPriceHistoryResponse)
+async def get_item_price_history(item_id: UUID, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                                 granularity: Literal['auto', 'raw', '1h', '1d'] = 'auto',
+                                 session: AsyncSession = Depends(get_db_session)):
+    """
+    История цены товара за окно [start, end) (по умолчанию - последние 7 дней).
+    При granularity=auto данные берутся из сырой истории, часовых или дневных сверток в зависимости от окна
+    """
+    end = end or datetime.now(timezone.utc)
+    start = start or end - timedelta(days=7)
+    # Время без часового пояса считается UTC
+    start = start if start.tzinfo else start.replace(tzinfo=timezone.utc)
+    end = end if end.tzinfo else end.replace(tzinfo=timezone.utc)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be earlier than end")
+    if granularity == 'auto':
+        granularity = choose_history_granularity(start, end)
+    logger.info(f"📈 Fetching price history: item={item_id}, {start.isoformat()} - {end.isoformat()}, granularity={granularity}")
+    
+    try:
+        item = await CRUD.read_item(item_id, session=session)
+        if not item:
+            logger.warning(f"⚠️ Item not found for price history: {item_id}")
+            raise HTTPException(status_code=404, detail="Item not found")
+        
+        points = await CRUD.get_item_price_history(item_id, start, end, granularity, session=session)
+        logger.info(f"✅ Price history fetched: {len(points)} points for item {item.name}")
+        return ItemPriceHistoryResponse(
+            item_id=item_id, granularity=granularity, start=start, end=end,
+            points=[PricePoint(**point) for point in points]
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"❌ Error reading price history for item {item_id}: {str(e)}")
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail=f"Error reading price history: {str(e)}")
+
+
+@app.get("/items/{item_id}/stats", response_model=ItemStatsResponse)
+async def get_item_stats(item_id: UUID):
+    """Статистика цены товара по часовым сверткам: SMA/EMA, волатильность, изменение и z-score"""
+    logger.info(f"📊 Fetching price stats for item: {item_id}")
+    
+    try:
+        item = await CRUD.read_item(item_id)
+        if not item:
+            logger.warning(f"⚠️ Item not found for price stats: {item_id}")
+            raise HTTPException(status_code=404, detail="Item not found")
+        
+        stats = (await price_analytics.get([item_id]))[item_id]
+        logger.info(f"✅ Price stats computed for item {item.name} over {stats['usd']['points']} points")
+        return ItemStatsResponse(**stats)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"❌ Error computing price stats for item {item_id}: {str(e)}")
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail=f"Error computing price stats: {str(e)}")
+
+
+@app.post("/items/stats:batch", response_model=List[ItemStatsResponse])
+async def get_items_stats(request: ItemStatsRequest):
+    """Статистика цен нескольких товаров одним запросом (товары без истории возвращаются с points=0)"""
+    logger.info(f"📊 Fetching price stats for {len(request.item_ids)} items")
+    
+    try:
+        item_ids = list(dict.fromkeys(request.item_ids))
+        stats = await price_analytics.get(item_ids)
+        logger.info(f"✅ Price stats computed for {len(stats)} items")
+        return [ItemStatsResponse(**stats[item_id]) for item_id in item_ids]
+        
+    except Exception as e:
+        logger.error(f"❌ Error computing price stats for {len(request.item_ids)} items: {str(e)}")
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail=f"Error computing price stats: {str(e)}")
+
+
+@app.get("/stats/anomalies", response_model=List[ItemStatsResponse])
+async def get_price_anomalies(currency: Literal['usd', 'rub'] = 'usd', limit: int = 50):
+    """Товары, последняя цена которых аномально отклонилась от окна (|z-score| >= порога), по всем товарам"""
+    logger.info(f"📊 Fetching price anomalies: currency={currency}, limit={limit}")
+    
+    try:
+        anomalies = await price_analytics.anomalies(currency=currency, limit=limit)
+        logger.info(f"✅ Found {len(anomalies)} price anomalies")
+        return [ItemStatsResponse(**stats) for stats in anomalies]
+        
+    except Exception as e:
+        logger.error(f"❌ Error computing price anomalies: {str(e)}")
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail=f"Error computing price anomalies: {str(e)}")
+
+
+async def observe_prices(updated: List[dict], session: AsyncSession) -> None:
+    """
+    Передать записанные цены в окна правил алертов (после commit цен): каждая наблюдаемая цена,
+    изменившаяся или нет, - точка в окнах; правила, условие которых ушло, снова взводятся
+    """
+    rearmed = alert_rules.observe_batch(updated, datetime.now(timezone.utc))
+    if rearmed:
+        try:
+            await CRUD.set_alert_rules_armed(rearmed, True, session=session)
+            await session.commit()
+        except Exception as e:
+            await session.rollback()
+            # В памяти правила уже взведены, в БД состояние обновится при следующем ack
+            logger.error(f"❌ Failed to persist re-armed alert rules: {str(e)}")
+
+
+@app.put("/items/price", response_model=dict, dependencies=[Depends(require_api_state)])
+async def update_item_price(price_update: ItemPriceUpdate, session: AsyncSession = Depends(get_db_session)):
+    """
+    Обновить цены товара по имени: взвести алерты, цена которых вышла из зоны срабатывания,
+    и передать цену правилам алертов (как в /items/prices:batch)
+    """
     logger.info(f"💰 Updating prices for item: {price_update.name} -> USD: {price_update.new_price_usd}, RUB: {price_update.new_price_rub}")
     
     try:
-        success = await CRUD.update_item_price(
+        updated = await CRUD.update_item_price(
             name=price_update.name,
             new_price_usd=price_update.new_price_usd,
-            new_price_rub=price_update.new_price_rub
+            new_price_rub=price_update.new_price_rub,
+            price_rub_fx_calibrated_at=price_update.price_rub_fx_calibrated_at,
+            price_rub_fx_error=price_update.price_rub_fx_error,
+            listing_id=price_update.listing_id,
+            session=session
         )
-        if not success:
+        if updated is None:
             logger.warning(f"⚠️ Item not found for price update: {price_update.name}")
             raise HTTPException(status_code=404, detail="Item not found")
+        await CRUD.rearm_price_alerts(ALERT_HYSTERESIS, [updated['id']], session=session)
+        await session.commit()
+        await observe_prices([updated], session)
         
+        changes = [ItemPriceChange(**updated).model_dump(mode='json')] if updated['changed'] else []
         logger.info(f"✅ Prices updated successfully for: {price_update.name}")
-        return {"message": "Item prices updated successfully"}
+        return {"message": "Item prices updated successfully", "item_id": updated['id'], "changes": changes}
         
     except HTTPException:
         raise
@@ -313,6 +875,47 @@ async def update_item_price(price_update: ItemPriceUpdate):
         raise HTTPException(status_code=500, detail=f"Error updating item price: {str(e)}")
 
 
+@app.put("/items/prices:batch", response_model=ItemPriceBatchResponse, dependencies=[Depends(require_api_state)])
+async def update_item_prices_batch(batch: ItemPriceBatchUpdate, session: AsyncSession = Depends(get_db_session)):
+    """Обновить цены множества товаров (по id или имени) одним запросом к БД"""
+    logger.info(f"💰 Batch updating prices for {len(batch.updates)} items")
+    
+    missing_key = [index for index, entry in enumerate(batch.updates) if entry.id is None and not entry.name]
+    if missing_key:
+        logger.warning(f"⚠️ Batch price entries without id or name: {missing_key[:10]}")
+        raise HTTPException(status_code=422, detail=f"Entries without id or name: {missing_key[:10]}")
+    
+    try:
+        updated = await CRUD.update_item_prices_batch([entry.model_dump() for entry in batch.updates], session=session)
+        updated_ids = {row['id'] for row in updated}
+        # Алерты взводятся вместе с ценами: проверки алертов (в том числе GET /alerts/subscribers) только читают
+        if updated_ids:
+            await CRUD.rearm_price_alerts(ALERT_HYSTERESIS, list(updated_ids), session=session)
+        # Цены фиксируются сразу: ошибка сохранения взведенных правил ниже не должна их откатить
+        await session.commit()
+        updated_names = {row['name'] for row in updated}
+        changes = [ItemPriceChange(**row) for row in updated if row['changed']]
+        not_found = [
+            str(entry.id) if entry.id is not None else entry.name
+            for entry in batch.updates
+            if (entry.id not in updated_ids if entry.id is not None else entry.name not in updated_names)
+        ]
+        if not_found:
+            logger.warning(f"⚠️ {len(not_found)} items not found for batch price update")
+        
+        logger.info(f"✅ Batch prices updated: {len(updated)} items, {len(changes)} changed")
+        
+        await observe_prices(updated, session)
+        return ItemPriceBatchResponse(
+            updated=len(updated), item_ids=list(updated_ids), not_found=not_found, changes=changes
+        )
+        
+    except Exception as e:
+        logger.error(f"❌ Error batch updating prices for {len(batch.updates)} items: {str(e)}")
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail=f"Error batch updating item prices: {str(e)}")
+
+
 @app.get("/items/exists/{item_name}", response_model=dict)
 async def check_item_exists(item_name: str):
     """Проверить существование товара по имени"""
@@ -341,27 +944,14 @@ async def check_item_exists(item_name: str):
 
 
 # Watchlist endpoints
-@app.post("/users/{user_id}/watchlist", response_model=dict)
+@app.post("/users/{user_id}/watchlist", response_model=dict, dependencies=[Depends(require_api_state)])
 async def add_to_watchlist(user_id: UUID, watchlist_item: WatchlistItemCreate):
     """Добавить товар в watchlist пользователя"""
     logger.info(f"📝 Adding item to watchlist: user={user_id}, item={watchlist_item.item_id}, buy_target={watchlist_item.buy_target_price}, sell_target={watchlist_item.sell_target_price}")
     
     try:
-        # Проверяем существование пользователя
-        user = await CRUD.read_user(user_id)
-        if not user:
-            logger.warning(f"⚠️ User not found for watchlist operation: {user_id}")
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        # Проверяем существование товара
-        item = await CRUD.read_item(watchlist_item.item_id)
-        if not item:
-            logger.warning(f"⚠️ Item not found for watchlist operation: {watchlist_item.item_id}")
-            raise HTTPException(status_code=404, detail="Item not found")
-        
-        logger.info(f"📦 Adding item '{item.name}' to user {user_id} watchlist, url={watchlist_item.url}")
-        
-        watchlist_id, was_added = await CRUD.add_item_to_watchlist(
+        # Пользователь и товар проверяются внешними ключами в том же запросе, что и вставка
+        watchlist_id, was_added, currency = await CRUD.add_item_to_watchlist(
             watchlist_item=UserItemWatchlist(
                 user_id=user_id,
                 item_id=watchlist_item.item_id,
@@ -372,16 +962,25 @@ async def add_to_watchlist(user_id: UUID, watchlist_item: WatchlistItemCreate):
         )
         
         if was_added:
+            threshold_index.add(WatchlistThreshold(
+                watchlist_id=watchlist_id,
+                user_id=user_id,
+                item_id=watchlist_item.item_id,
+                currency=currency,
+                buy_target_price=watchlist_item.buy_target_price,
+                sell_target_price=watchlist_item.sell_target_price
+            ))
             message = "Item added to watchlist successfully"
-            logger.info(f"✅ Item added to watchlist: {item.name} -> {watchlist_id}")
+            logger.info(f"✅ Item added to watchlist: {watchlist_item.item_id} -> {watchlist_id}")
         else:
             message = "Item already in watchlist"
-            logger.info(f"ℹ️ Item already in watchlist: {item.name}")
+            logger.info(f"ℹ️ Item already in watchlist: {watchlist_item.item_id}")
             
         return {"watchlist_id": watchlist_id, "message": message}
         
-    except HTTPException:
-        raise
+    except NotFoundError as e:
+        logger.warning(f"⚠️ Watchlist operation for user {user_id} rejected: {str(e)}")
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         logger.error(f"❌ Error adding to watchlist for user {user_id}: {str(e)}")
         logger.error(f"Traceback: {traceback.format_exc()}")
@@ -389,18 +988,18 @@ async def add_to_watchlist(user_id: UUID, watchlist_item: WatchlistItemCreate):
 
 
 @app.get("/users/{user_id}/watchlist", response_model=List[WatchlistItemResponse])
-async def get_user_watchlist(user_id: UUID):
+async def get_user_watchlist(user_id: UUID, session: AsyncSession = Depends(get_db_session)):
     """Получить watchlist пользователя"""
     logger.info(f"📋 Fetching watchlist for user: {user_id}")
     
     try:
         # Проверяем существование пользователя
-        user = await CRUD.read_user(user_id)
+        user = await CRUD.read_user(user_id, session=session)
         if not user:
             logger.warning(f"⚠️ User not found for watchlist fetch: {user_id}")
             raise HTTPException(status_code=404, detail="User not found")
         
-        watchlist = await CRUD.read_user_watchlist(user_id)
+        watchlist = await CRUD.read_user_watchlist(user_id, session=session)
         logger.info(f"✅ Watchlist fetched: {len(watchlist)} items for user {user_id}")
         return watchlist
         
@@ -412,7 +1011,7 @@ async def get_user_watchlist(user_id: UUID):
         raise HTTPException(status_code=500, detail=f"Error reading watchlist: {str(e)}")
 
 
-@app.delete("/users/{user_id}/watchlist/{item_id}", response_model=dict)
+@app.delete("/users/{user_id}/watchlist/{item_id}", response_model=dict, dependencies=[Depends(require_api_state)])
 async def remove_from_watchlist(user_id: UUID, item_id: UUID):
     """Удалить товар из watchlist пользователя"""
     logger.info(f"🗑️ Removing item from watchlist: user={user_id}, item={item_id}")
@@ -423,6 +1022,8 @@ async def remove_from_watchlist(user_id: UUID, item_id: UUID):
             logger.warning(f"⚠️ Watchlist item not found for removal: user={user_id}, item={item_id}")
             raise HTTPException(status_code=404, detail="Watchlist item not found")
         
+        threshold_index.discard_user_item(user_id, item_id)
+        alert_rules.discard_user_item(user_id, item_id)
         logger.info(f"✅ Item removed from watchlist: user={user_id}, item={item_id}")
         return {"message": "Item removed from watchlist successfully"}
         
@@ -435,19 +1036,19 @@ async def remove_from_watchlist(user_id: UUID, item_id: UUID):
 
 
 @app.get("/users/{user_id}/watchlist/alerts", response_model=PriceAlertsResponse)
-async def get_watchlist_price_alerts(user_id: UUID, currency: str = 'usd'):
+async def get_watchlist_price_alerts(user_id: UUID, currency: str = 'usd', session: AsyncSession = Depends(get_db_session)):
     """Получить алерты по ценам из watchlist пользователя"""
     logger.info(f"🚨 Fetching price alerts for user: {user_id}, currency: {currency}")
     
     try:
         # Проверяем существование пользователя
-        user = await CRUD.read_user(user_id)
+        user = await CRUD.read_user(user_id, session=session)
         if not user:
             logger.warning(f"⚠️ User not found for price alerts: {user_id}")
             raise HTTPException(status_code=404, detail="User not found")
         
         # Получаем алерты по ценам
-        alerts_data = await CRUD.get_watchlist_price_alerts(user_id, currency=currency)
+        alerts_data = await CRUD.get_watchlist_price_alerts(user_id, currency=currency, session=session)
         
         # Преобразуем данные в Pydantic модели
         buy_alerts = [
@@ -481,7 +1082,6 @@ async def get_watchlist_price_alerts(user_id: UUID, currency: str = 'usd'):
             )
             for alert in alerts_data['sell']
         ]
-        print(sell_alerts)
         logger.info(f"✅ Price alerts fetched: {len(buy_alerts)} buy alerts, {len(sell_alerts)} sell alerts for user {user_id}")
         return PriceAlertsResponse(buy=buy_alerts, sell=sell_alerts)
         
@@ -493,26 +1093,149 @@ async def get_watchlist_price_alerts(user_id: UUID, currency: str = 'usd'):
         raise HTTPException(status_code=500, detail=f"Error getting price alerts: {str(e)}")
 
 
+@app.get("/alerts/subscribers", dependencies=[Depends(require_api_state)])
+async def stream_subscriber_alerts():
+    """
+    Новые сработавшие алерты всех подписчиков одним запросом к БД (NDJSON, строка на пользователя).
+    Уже отправленный алерт не возвращается, пока цена не выйдет из зоны алерта (см. /alerts/ack).
+    В rules - сработавшие правила по движению цены, ожидающие отправки
+    """
+    logger.info("🚨 Streaming price alerts for all subscribers")
+    
+    async def generate():
+        count = 0
+        try:
+            async for user_alerts in with_rule_alerts(CRUD.stream_subscriber_price_alerts(hysteresis=ALERT_HYSTERESIS)):
+                count += 1
+                yield SubscriberAlerts(**user_alerts).model_dump_json() + "\n"
+        except Exception as e:
+            # Статус уже отправлен, клиент увидит оборванный поток
+            logger.error(f"❌ Error streaming subscriber alerts after {count} users: {str(e)}")
+            logger.error(f"Traceback: {traceback.format_exc()}")
+            raise
+        logger.info(f"✅ Streamed price alerts for {count} subscribers")
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+@app.post("/alerts/evaluate", dependencies=[Depends(require_api_state)])
+async def evaluate_alerts(request: AlertEvaluateRequest):
+    """
+    Новые сработавшие алерты только по наблюдателям изменившихся товаров
+    (NDJSON в формате /alerts/subscribers).
+    Если переданы changes, проверяются только наблюдатели, чьи пороги пересекла цена (по индексу порогов);
+    повторные алерты при дальнейшем движении цены в этом случае находит периодическая проверка
+    """
+    item_ids = list(request.item_ids)
+    watchlist_ids = None
+    if request.changes is not None:
+        item_ids = list({*item_ids, *(change.id for change in request.changes)})
+        if threshold_index.ready:
+            watchlist_ids = list(threshold_index.crossed_by_changes(change.model_dump() for change in request.changes))
+    logger.info(
+        f"🚨 Evaluating price alerts for {len(item_ids)} changed items"
+        + (f", {len(watchlist_ids)} crossed thresholds" if watchlist_ids is not None else "")
+    )
+    
+    async def generate():
+        count = 0
+        try:
+            async for user_alerts in with_rule_alerts(CRUD.stream_subscriber_price_alerts(
+                hysteresis=ALERT_HYSTERESIS, item_ids=item_ids, watchlist_ids=watchlist_ids
+            ), item_ids=item_ids):
+                count += 1
+                yield SubscriberAlerts(**user_alerts).model_dump_json() + "\n"
+        except Exception as e:
+            logger.error(f"❌ Error evaluating alerts after {count} users: {str(e)}")
+            logger.error(f"Traceback: {traceback.format_exc()}")
+            raise
+        logger.info(f"✅ Evaluated price alerts: {count} subscribers to notify")
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+@app.post("/alerts/ack", response_model=dict, dependencies=[Depends(require_api_state)])
+async def ack_alerts(request: AlertAckRequest, session: AsyncSession = Depends(get_db_session)):
+    """Отметить алерты как отправленные (вызывается ботом после успешной отправки)"""
+    logger.info(f"📨 Acknowledging {len(request.acks)} sent alerts")
+    
+    try:
+        # Алерты по порогам и правилам подтверждаются одной транзакцией
+        acknowledged = await CRUD.ack_price_alerts(
+            [ack.model_dump() for ack in request.acks if ack.side != 'rule'], session=session
+        )
+        rule_ids = {ack.rule_id for ack in request.acks if ack.side == 'rule' and ack.rule_id is not None}
+        if rule_ids:
+            # Состояние в памяти меняется только после commit, поэтому значения берутся без снятия с ожидания
+            triggers = [trigger for trigger in alert_rules.pending() if trigger['rule_id'] in rule_ids]
+            acknowledged += await CRUD.ack_alert_rules(
+                [{'rule_id': trigger['rule_id'], 'value': trigger['value']} for trigger in triggers], session=session
+            )
+        await session.commit()
+        if rule_ids:
+            alert_rules.ack([trigger['rule_id'] for trigger in triggers])
+        logger.info(f"✅ Alerts acknowledged: {acknowledged}")
+        return {"acknowledged": acknowledged}
+        
+    except Exception as e:
+        logger.error(f"❌ Error acknowledging alerts: {str(e)}")
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail=f"Error acknowledging alerts: {str(e)}")
+
+
+@app.get("/users/{user_id}/watchlist/lookup", response_model=dict)
+async def lookup_watchlist_item(user_id: UUID, listing_id: int, name: str):
+    """
+    Найти товар по listing_id и имени и проверить, есть ли он в watchlist пользователя (один запрос к БД).
+    Возвращает и валюту пользователя; нет пользователя - 404
+    """
+    logger.info(f"🔍 Looking up item for watchlist: user={user_id}, listing_id={listing_id}, name={name}")
+    
+    try:
+        found = await CRUD.lookup_user_watchlist_item(user_id, listing_id, name)
+        if found['item_id'] is None:
+            logger.info(f"ℹ️ Item does not exist: {name}")
+            return {"exists": False, "in_watchlist": False, "currency": found['currency']}
+        
+        in_watchlist = found['watchlist_id'] is not None
+        logger.info(f"✅ Item exists: {name} (id: {found['item_id']}, in watchlist: {in_watchlist})")
+        return {
+            "exists": True,
+            "item_id": found['item_id'],
+            "in_watchlist": in_watchlist,
+            "watchlist_id": found['watchlist_id'],
+            "currency": found['currency']
+        }
+        
+    except NotFoundError as e:
+        logger.warning(f"⚠️ Watchlist lookup for user {user_id} rejected: {str(e)}")
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        logger.error(f"❌ Error looking up item {name} for user {user_id}: {str(e)}")
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail=f"Error looking up item: {str(e)}")
+
+
 @app.get("/users/{user_id}/watchlist/check/{item_id}", response_model=dict)
-async def check_item_in_watchlist(user_id: UUID, item_id: UUID):
+async def check_item_in_watchlist(user_id: UUID, item_id: UUID, session: AsyncSession = Depends(get_db_session)):
     """Проверить, есть ли предмет в watchlist пользователя"""
     logger.info(f"🔍 Checking if item is in watchlist: user={user_id}, item={item_id}")
     
     try:
         # Проверяем существование пользователя
-        user = await CRUD.read_user(user_id)
+        user = await CRUD.read_user(user_id, session=session)
         if not user:
             logger.warning(f"⚠️ User not found for watchlist check: {user_id}")
             raise HTTPException(status_code=404, detail="User not found")
         
         # Проверяем существование товара
-        item = await CRUD.read_item(item_id)
+        item = await CRUD.read_item(item_id, session=session)
         if not item:
             logger.warning(f"⚠️ Item not found for watchlist check: {item_id}")
             raise HTTPException(status_code=404, detail="Item not found")
         
         # Проверяем наличие в watchlist
-        watchlist_item = await CRUD.check_item_in_user_watchlist(user_id, item_id)
+        watchlist_item = await CRUD.check_item_in_user_watchlist(user_id, item_id, session=session)
         
         if watchlist_item:
             logger.info(f"✅ Item found in watchlist: {item.name} for user {user_id}")
@@ -554,7 +1277,7 @@ async def change_user_subscription(user_id: UUID, request: dict):
         raise HTTPException(status_code=500, detail=f"Error changing subscription status: {str(e)}")
 
 
-@app.put("/users/{user_id}/currency", response_model=dict)
+@app.put("/users/{user_id}/currency", response_model=dict, dependencies=[Depends(require_api_state)])
 async def change_user_currency(user_id: UUID, request: dict):
     """Изменить валюту пользователя"""
     currency = request.get("currency")
@@ -567,6 +1290,8 @@ async def change_user_currency(user_id: UUID, request: dict):
     logger.info(f"💱 Changing currency for user: {user_id} to {currency}")
     try:
         await CRUD.change_user_currency(user_id=user_id, currency=currency)
+        threshold_index.set_user_currency(user_id, currency)
+        alert_rules.set_user_currency(user_id, currency)
         logger.info(f"✅ Currency changed successfully for user: {user_id} to {currency}")
         return {"message": "Currency changed successfully"}
     except ValueError as e:
@@ -577,7 +1302,7 @@ async def change_user_currency(user_id: UUID, request: dict):
         raise HTTPException(status_code=500, detail=f"Error changing currency: {str(e)}")
 
 
-@app.put("/users/{user_id}/watchlist/{watchlist_id}/prices", response_model=dict)
+@app.put("/users/{user_id}/watchlist/{watchlist_id}/prices", response_model=dict, dependencies=[Depends(require_api_state)])
 async def update_watchlist_item_prices(user_id: UUID, watchlist_id: UUID, request: dict):
     """Обновить цены покупки и продажи для элемента watchlist"""
     buy_target_price = request.get("buy_target_price")
@@ -598,6 +1323,7 @@ async def update_watchlist_item_prices(user_id: UUID, watchlist_id: UUID, reques
             logger.warning(f"⚠️ Watchlist item not found: user={user_id}, watchlist_id={watchlist_id}")
             raise HTTPException(status_code=404, detail="Watchlist item not found")
         
+        threshold_index.update_targets(watchlist_id, float(buy_target_price), float(sell_target_price))
         logger.info(f"✅ Watchlist item prices updated successfully")
         return {"message": "Watchlist item prices updated successfully"}
     except HTTPException:
@@ -606,12 +1332,117 @@ async def update_watchlist_item_prices(user_id: UUID, watchlist_id: UUID, reques
         logger.error(f"❌ Error updating watchlist item prices: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error updating watchlist item prices: {str(e)}")
 
+# Alert rule endpoints
+@app.post("/users/{user_id}/watchlist/{watchlist_id}/rules", response_model=AlertRuleResponse, dependencies=[Depends(require_api_state)])
+async def create_alert_rule(user_id: UUID, watchlist_id: UUID, rule: AlertRuleCreate,
+                            session: AsyncSession = Depends(get_db_session)):
+    """Добавить правило алерта элементу watchlist: движение цены на threshold% или отклонение на threshold сигм за окно"""
+    logger.info(f"📐 Creating {rule.rule_type} alert rule: user={user_id}, watchlist_id={watchlist_id}, threshold={rule.threshold}, window={rule.window_minutes}m")
+    
+    if rule.threshold <= 0 or rule.window_minutes <= 0:
+        raise HTTPException(status_code=400, detail="threshold and window_minutes must be positive")
+    # Окна заполняются сырой историей цен - окно не может быть длиннее срока ее хранения
+    if rule.window_minutes > HISTORY_RAW_RETENTION_DAYS * 24 * 60:
+        raise HTTPException(status_code=400, detail=f"window_minutes must not exceed {HISTORY_RAW_RETENTION_DAYS * 24 * 60}")
+    
+    try:
+        created = await CRUD.create_alert_rule(
+            user_id=user_id,
+            watchlist_id=watchlist_id,
+            rule_type=rule.rule_type,
+            threshold=rule.threshold,
+            window_minutes=rule.window_minutes,
+            session=session
+        )
+        if created is None:
+            logger.warning(f"⚠️ Watchlist item not found for alert rule: user={user_id}, watchlist_id={watchlist_id}")
+            raise HTTPException(status_code=404, detail="Watchlist item not found")
+        
+        points = []
+        if not alert_rules.has_window(created['item_id'], created['window_minutes']):
+            since = datetime.now(timezone.utc) - timedelta(minutes=created['window_minutes'])
+            points = await CRUD.get_price_history_points([created['item_id']], since, session=session)
+        await session.commit()
+        alert_rules.add(alert_rule_from_dict(created), points)
+        
+        logger.info(f"✅ Alert rule created: {created['id']}")
+        return AlertRuleResponse(**created)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"❌ Error creating alert rule: user={user_id}, watchlist_id={watchlist_id}: {str(e)}")
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail=f"Error creating alert rule: {str(e)}")
+
+
+@app.get("/users/{user_id}/rules", response_model=List[AlertRuleResponse])
+async def get_user_alert_rules(user_id: UUID):
+    """Получить правила алертов всех элементов watchlist пользователя"""
+    logger.info(f"📐 Fetching alert rules for user: {user_id}")
+    
+    try:
+        rules = await CRUD.read_user_alert_rules(user_id)
+        logger.info(f"✅ Alert rules fetched: {len(rules)} rules for user {user_id}")
+        return [AlertRuleResponse(**rule) for rule in rules]
+        
+    except Exception as e:
+        logger.error(f"❌ Error reading alert rules for user {user_id}: {str(e)}")
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail=f"Error reading alert rules: {str(e)}")
+
+
+@app.delete("/users/{user_id}/rules/{rule_id}", response_model=dict, dependencies=[Depends(require_api_state)])
+async def delete_alert_rule(user_id: UUID, rule_id: UUID):
+    """Удалить правило алерта пользователя"""
+    logger.info(f"🗑️ Deleting alert rule: user={user_id}, rule_id={rule_id}")
+    
+    try:
+        success = await CRUD.delete_alert_rule(user_id=user_id, rule_id=rule_id)
+        if not success:
+            logger.warning(f"⚠️ Alert rule not found for removal: user={user_id}, rule_id={rule_id}")
+            raise HTTPException(status_code=404, detail="Alert rule not found")
+        
+        alert_rules.discard(rule_id)
+        logger.info(f"✅ Alert rule deleted: {rule_id}")
+        return {"message": "Alert rule deleted successfully"}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"❌ Error deleting alert rule: user={user_id}, rule_id={rule_id}: {str(e)}")
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail=f"Error deleting alert rule: {str(e)}")
+
+
 # Health check endpoint
+# Тот же путь по умолчанию, что у бота (BotConfig.parser_state_path), который пишет этот файл
+PARSER_STATE_PATH = os.getenv("PARSER_STATE_PATH", "parser_state.json")
+
+
+def read_parser_state() -> Optional[dict]:
+    """Прочитать состояние парсера цен, сохраненное ботом"""
+    try:
+        with open(PARSER_STATE_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"⚠️ Failed to read parser state from {PARSER_STATE_PATH}: {e}")
+        return None
+
+
 @app.get("/health")
 async def health_check():
-    """Проверка состояния сервиса"""
+    """Проверка состояния сервиса и парсера цен (circuit breaker'ы Steam)"""
     logger.debug("❤️ Health check requested")
-    return {"status": "healthy", "timestamp": datetime.now()}
+    parser_state = read_parser_state()
+    status = "healthy"
+    if parser_state and any(
+        breaker.get('state') != 'closed' for breaker in (parser_state.get('breakers') or {}).values()
+    ):
+        status = "degraded"
+    return {"status": status, "timestamp": datetime.now(), "parser": parser_state}
 
 
 if __name__ == "__main__":
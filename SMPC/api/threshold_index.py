@@ -0,0 +1,201 @@
+"""
+Индекс порогов watchlist в памяти процесса API для поиска сработавших алертов при изменении цены
+"""
+import logging
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+from uuid import UUID
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_currency(currency: Optional[str]) -> str:
+    """Валюта сравнения цен: все, кроме RUB, сравнивается в USD (как в SQL)"""
+    return 'rub' if (currency or '').lower() == 'rub' else 'usd'
+
+
+class WatchlistThreshold(NamedTuple):
+    """Пороги одного элемента watchlist"""
+    watchlist_id: UUID
+    user_id: UUID
+    item_id: UUID
+    currency: str
+    buy_target_price: float
+    sell_target_price: float
+
+
+class SortedThresholds:
+    """Отсортированные пороги с параллельным списком watchlist_id"""
+    
+    __slots__ = ('prices', 'ids')
+    
+    def __init__(self):
+        self.prices: List[float] = []
+        self.ids: List[UUID] = []
+    
+    def insert(self, price: float, watchlist_id: UUID) -> None:
+        position = bisect_right(self.prices, price)
+        self.prices.insert(position, price)
+        self.ids.insert(position, watchlist_id)
+    
+    def remove(self, price: float, watchlist_id: UUID) -> None:
+        position = bisect_left(self.prices, price)
+        end = bisect_right(self.prices, price, lo=position)
+        position = self.ids.index(watchlist_id, position, end)
+        del self.prices[position]
+        del self.ids[position]
+    
+    def sort(self) -> None:
+        order = sorted(range(len(self.prices)), key=self.prices.__getitem__)
+        self.prices = [self.prices[i] for i in order]
+        self.ids = [self.ids[i] for i in order]
+    
+    def __len__(self) -> int:
+        return len(self.prices)
+
+
+class ThresholdIndex:
+    """
+    Пороги покупки и продажи всех элементов watchlist, разложенные по (предмет, валюта пользователя)
+    в отсортированные массивы. По старой и новой цене предмета за O(log n + k) возвращает ровно
+    тех наблюдателей, чьи пороги цена пересекла, без перебора строк watchlist.
+    
+    Сравнение как в CRUD._price_alert_columns: цены и пороги округляются до 2 знаков,
+    покупка срабатывает при цене <= порога, продажа - при цене >= порога.
+    Индекс строится при старте API и поддерживается эндпоинтами watchlist;
+    изменения в обход API в него не попадают до перезапуска.
+    """
+    
+    def __init__(self):
+        self._buy: Dict[Tuple[UUID, str], SortedThresholds] = {}
+        self._sell: Dict[Tuple[UUID, str], SortedThresholds] = {}
+        self._entries: Dict[UUID, WatchlistThreshold] = {}
+        self._by_user_item: Dict[Tuple[UUID, UUID], UUID] = {}
+        self._by_user: Dict[UUID, Set[UUID]] = {}
+        # False, пока индекс не построен: тогда алерты проверяются без него
+        self.ready = False
+    
+    def build(self, rows: Iterable[WatchlistThreshold]) -> None:
+        """Перестроить индекс целиком (сортировка один раз вместо вставок по одному)"""
+        for index in (self._buy, self._sell, self._entries, self._by_user_item, self._by_user):
+            index.clear()
+        for row in rows:
+            entry = self._register(row)
+            key = (entry.item_id, entry.currency)
+            buy = self._buy.get(key)
+            if buy is None:
+                buy = self._buy[key] = SortedThresholds()
+                self._sell[key] = SortedThresholds()
+            sell = self._sell[key]
+            buy.prices.append(entry.buy_target_price)
+            buy.ids.append(entry.watchlist_id)
+            sell.prices.append(entry.sell_target_price)
+            sell.ids.append(entry.watchlist_id)
+        for thresholds in (*self._buy.values(), *self._sell.values()):
+            thresholds.sort()
+        self.ready = True
+        logger.info(f"Threshold index built: {len(self._entries)} watchlist entries, {len(self._buy)} item/currency pairs")
+    
+    def _register(self, entry: WatchlistThreshold) -> WatchlistThreshold:
+        watchlist_id, user_id, item_id, currency, buy_target_price, sell_target_price = entry
+        entry = WatchlistThreshold(
+            watchlist_id, user_id, item_id, normalize_currency(currency),
+            round(buy_target_price, 2), round(sell_target_price, 2)
+        )
+        self._entries[watchlist_id] = entry
+        self._by_user_item[(user_id, item_id)] = watchlist_id
+        user_entries = self._by_user.get(user_id)
+        if user_entries is None:
+            user_entries = self._by_user[user_id] = set()
+        user_entries.add(watchlist_id)
+        return entry
+    
+    def add(self, entry: WatchlistThreshold) -> None:
+        """Добавить (или заменить) элемент watchlist"""
+        self.discard(entry.watchlist_id)
+        entry = self._register(entry)
+        key = (entry.item_id, entry.currency)
+        self._buy.setdefault(key, SortedThresholds()).insert(entry.buy_target_price, entry.watchlist_id)
+        self._sell.setdefault(key, SortedThresholds()).insert(entry.sell_target_price, entry.watchlist_id)
+    
+    def discard(self, watchlist_id: UUID) -> Optional[WatchlistThreshold]:
+        """Удалить элемент watchlist, если он есть в индексе"""
+        entry = self._entries.pop(watchlist_id, None)
+        if entry is None:
+            return None
+        self._by_user_item.pop((entry.user_id, entry.item_id), None)
+        user_entries = self._by_user.get(entry.user_id)
+        if user_entries is not None:
+            user_entries.discard(watchlist_id)
+            if not user_entries:
+                del self._by_user[entry.user_id]
+        
+        key = (entry.item_id, entry.currency)
+        for side, price in ((self._buy, entry.buy_target_price), (self._sell, entry.sell_target_price)):
+            side[key].remove(price, watchlist_id)
+            if not side[key]:
+                del side[key]
+        return entry
+    
+    def discard_user_item(self, user_id: UUID, item_id: UUID) -> Optional[WatchlistThreshold]:
+        """Удалить элемент watchlist по пользователю и предмету"""
+        watchlist_id = self._by_user_item.get((user_id, item_id))
+        return self.discard(watchlist_id) if watchlist_id is not None else None
+    
+    def update_targets(self, watchlist_id: UUID, buy_target_price: float, sell_target_price: float) -> bool:
+        """Обновить пороги элемента watchlist"""
+        entry = self._entries.get(watchlist_id)
+        if entry is None:
+            return False
+        self.add(entry._replace(buy_target_price=buy_target_price, sell_target_price=sell_target_price))
+        return True
+    
+    def set_user_currency(self, user_id: UUID, currency: str) -> int:
+        """Перенести элементы watchlist пользователя в массивы другой валюты"""
+        currency = normalize_currency(currency)
+        moved = 0
+        for watchlist_id in list(self._by_user.get(user_id, ())):
+            entry = self._entries[watchlist_id]
+            if entry.currency != currency:
+                self.add(entry._replace(currency=currency))
+                moved += 1
+        return moved
+    
+    def crossed(self, item_id: UUID, currency: str, old_price: Optional[float],
+                new_price: float) -> Dict[str, List[UUID]]:
+        """
+        Наблюдатели предмета в валюте currency, чьи пороги пересечены при изменении цены old_price -> new_price.
+        
+        Покупка: old > target >= new, продажа: old < target <= new.
+        Без старой цены возвращаются все наблюдатели, для которых новая цена в зоне алерта.
+        """
+        key = (item_id, normalize_currency(currency))
+        new_price = round(new_price, 2)
+        old_price = round(old_price, 2) if old_price is not None else None
+        result = {'buy': [], 'sell': []}
+        
+        buy = self._buy.get(key)
+        if buy is not None and (old_price is None or new_price < old_price):
+            lo = bisect_left(buy.prices, new_price)
+            hi = bisect_left(buy.prices, old_price) if old_price is not None else len(buy.prices)
+            result['buy'] = buy.ids[lo:hi]
+        
+        sell = self._sell.get(key)
+        if sell is not None and (old_price is None or new_price > old_price):
+            lo = bisect_right(sell.prices, old_price) if old_price is not None else 0
+            hi = bisect_right(sell.prices, new_price)
+            result['sell'] = sell.ids[lo:hi]
+        return result
+    
+    def crossed_by_changes(self, changes: Iterable[Dict]) -> Set[UUID]:
+        """watchlist_id всех наблюдателей, чьи пороги пересекли изменения цен (old_usd/new_usd, old_rub/new_rub)"""
+        watchlist_ids: Set[UUID] = set()
+        for change in changes:
+            for currency in ('usd', 'rub'):
+                crossed = self.crossed(change['id'], currency, change[f'old_{currency}'], change[f'new_{currency}'])
+                watchlist_ids.update(crossed['buy'])
+                watchlist_ids.update(crossed['sell'])
+        return watchlist_ids
+    
+    def __len__(self) -> int:
+        return len(self._entries)
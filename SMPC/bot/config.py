@@ -17,6 +17,45 @@ class BotConfig:
     notify_interval: int = 180   # секунды
     max_retries: int = 3
     request_timeout: int = 30
+    nameid_cache_path: str = "nameid_cache.json"
+    price_workers: int = 4
+    steam_rate: float = 2.0  # начальная скорость запросов к Steam в секунду
+    steam_min_rate: float = 0.2
+    steam_max_rate: float = 10.0
+    price_cache_ttl: int = 30  # секунды
+    bulk_prices_enabled: bool = True
+    bulk_max_pages: int = 300
+    bulk_min_items: int = 50  # меньше предметов - только поштучный парсинг
+    bulk_pages_per_item: float = 1.0  # лимит страниц поиска на один предмет пакетного прохода
+    price_item_timeout: int = 60  # секунды
+    price_progress_every: int = 50
+    fx_derive_enabled: bool = False  # получать только USD, RUB пересчитывать по курсу
+    fx_max_age: int = 3600  # секунды
+    fx_sample_size: int = 10
+    retry_base_delay: float = 0.5  # секунды
+    retry_max_delay: float = 30.0  # секунды
+    retry_budget: int = 200  # повторов на цикл обновления, 0 - без ограничения
+    slow_lane_interval: int = 3600  # секунды между проверками "мертвых" предметов
+    breaker_failure_threshold: int = 5
+    breaker_recovery_timeout: int = 60  # секунды
+    parser_state_path: str = "parser_state.json"  # читает и API в /health (PARSER_STATE_PATH, тот же путь по умолчанию)
+    price_batch_size: int = 200  # цен в одном запросе PUT /items/prices:batch
+    price_flush_interval: float = 5.0  # секунды, дольше которых цена не ждет заполнения пакета
+    event_alerts_enabled: bool = True  # проверять алерты сразу при изменении цены
+    notify_workers: int = 8
+    notify_global_rate: float = 30.0  # сообщений в секунду на весь бот (лимит Telegram)
+    notify_chat_interval: float = 1.0  # секунды между сообщениями в один чат
+    notify_max_attempts: int = 5
+    notify_queue_path: str = "notification_queue.json"
+    api_transport: str = "http"  # http - запросы к API по HTTP, direct - вызовы обработчиков API в процессе бота
+    api_url: str = "http://localhost:8000"
+    api_max_connections: int = 20  # соединений в пуле HTTP-клиента API
+    api_max_keepalive: int = 10  # простаивающих keep-alive соединений
+    api_keepalive_expiry: float = 30.0  # секунды простоя до закрытия соединения
+    api_http2: bool = False  # нужен пакет h2 и API за TLS-прокси с HTTP/2
+    api_timeout: float = 10.0  # секунды, обычные запросы
+    api_pool_timeout: float = 5.0  # секунды ожидания свободного соединения
+    api_long_timeout: float = 120.0  # секунды, пакетные запросы и потоки алертов
     
     @classmethod
     def from_env(cls) -> 'BotConfig':
@@ -30,7 +69,46 @@ class BotConfig:
             update_interval=int(os.getenv("UPDATE_INTERVAL", "160")),
             notify_interval=int(os.getenv("NOTIFY_INTERVAL", "180")),
             max_retries=int(os.getenv("MAX_RETRIES", "3")),
-            request_timeout=int(os.getenv("REQUEST_TIMEOUT", "30"))
+            request_timeout=int(os.getenv("REQUEST_TIMEOUT", "30")),
+            nameid_cache_path=os.getenv("NAMEID_CACHE_PATH", "nameid_cache.json"),
+            price_workers=int(os.getenv("PRICE_WORKERS", "4")),
+            steam_rate=float(os.getenv("STEAM_RATE", "2.0")),
+            steam_min_rate=float(os.getenv("STEAM_MIN_RATE", "0.2")),
+            steam_max_rate=float(os.getenv("STEAM_MAX_RATE", "10.0")),
+            price_cache_ttl=int(os.getenv("PRICE_CACHE_TTL", "30")),
+            bulk_prices_enabled=os.getenv("BULK_PRICES_ENABLED", "true").lower() in ("1", "true", "yes"),
+            bulk_max_pages=int(os.getenv("BULK_MAX_PAGES", "300")),
+            bulk_min_items=int(os.getenv("BULK_MIN_ITEMS", "50")),
+            bulk_pages_per_item=float(os.getenv("BULK_PAGES_PER_ITEM", "1.0")),
+            price_item_timeout=int(os.getenv("PRICE_ITEM_TIMEOUT", "60")),
+            price_progress_every=int(os.getenv("PRICE_PROGRESS_EVERY", "50")),
+            fx_derive_enabled=os.getenv("FX_DERIVE_ENABLED", "false").lower() in ("1", "true", "yes"),
+            fx_max_age=int(os.getenv("FX_MAX_AGE", "3600")),
+            fx_sample_size=int(os.getenv("FX_SAMPLE_SIZE", "10")),
+            retry_base_delay=float(os.getenv("RETRY_BASE_DELAY", "0.5")),
+            retry_max_delay=float(os.getenv("RETRY_MAX_DELAY", "30.0")),
+            retry_budget=int(os.getenv("RETRY_BUDGET", "200")),
+            slow_lane_interval=int(os.getenv("SLOW_LANE_INTERVAL", "3600")),
+            breaker_failure_threshold=int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5")),
+            breaker_recovery_timeout=int(os.getenv("BREAKER_RECOVERY_TIMEOUT", "60")),
+            parser_state_path=os.getenv("PARSER_STATE_PATH", "parser_state.json"),
+            price_batch_size=int(os.getenv("PRICE_BATCH_SIZE", "200")),
+            price_flush_interval=float(os.getenv("PRICE_FLUSH_INTERVAL", "5")),
+            event_alerts_enabled=os.getenv("EVENT_ALERTS_ENABLED", "true").lower() in ("1", "true", "yes"),
+            notify_workers=int(os.getenv("NOTIFY_WORKERS", "8")),
+            notify_global_rate=float(os.getenv("NOTIFY_GLOBAL_RATE", "30.0")),
+            notify_chat_interval=float(os.getenv("NOTIFY_CHAT_INTERVAL", "1.0")),
+            notify_max_attempts=int(os.getenv("NOTIFY_MAX_ATTEMPTS", "5")),
+            notify_queue_path=os.getenv("NOTIFY_QUEUE_PATH", "notification_queue.json"),
+            api_transport=os.getenv("API_TRANSPORT", "http").lower(),
+            api_url=os.getenv("API_URL", "http://localhost:8000"),
+            api_max_connections=int(os.getenv("API_MAX_CONNECTIONS", "20")),
+            api_max_keepalive=int(os.getenv("API_MAX_KEEPALIVE", "10")),
+            api_keepalive_expiry=float(os.getenv("API_KEEPALIVE_EXPIRY", "30.0")),
+            api_http2=os.getenv("API_HTTP2", "false").lower() in ("1", "true", "yes"),
+            api_timeout=float(os.getenv("API_TIMEOUT", "10.0")),
+            api_pool_timeout=float(os.getenv("API_POOL_TIMEOUT", "5.0")),
+            api_long_timeout=float(os.getenv("API_LONG_TIMEOUT", "120.0"))
         )
 
 
@@ -57,7 +135,17 @@ class BotConstants:
         'BUY_PRICE_TOO_HIGH': 'Buy price must be less than sell price. Please try again.',
         'ENTER_URL': 'Enter the URL of the item you want to add to the watchlist:\nFor example: https://steamcommunity.com/market/listings/730/Fracture%20Case',
         'ENTER_SELL_PRICE': 'Enter the sell price of the item',
-        'ENTER_BUY_PRICE': 'Enter the buy price of the item'
+        'ENTER_BUY_PRICE': 'Enter the buy price of the item',
+        'NO_RULES': 'You have no alert rules. Use /add_rule to add one.',
+        'ADD_RULE_USAGE': (
+            'Usage: /add_rule <item number> <move|zscore> <threshold> <window>\n'
+            'move - price changes by threshold % within the window, '
+            'zscore - price deviates by threshold sigmas from the window mean.\n'
+            'Window: 30m, 4h, 7d. For example: /add_rule 1 move 10 24h'
+        ),
+        'DELETE_RULE_USAGE': 'Usage: /delete_rule <rule number from /rules>',
+        'RULE_ADDED': 'Alert rule added.',
+        'RULE_DELETED': 'Alert rule deleted.'
     }
     
     # Команды бота
@@ -65,13 +153,23 @@ class BotConstants:
         ("start", "Запустить бота и показать справку"),
         ("add", "Добавить товар в список отслеживания"),
         ("prices", "Показать текущие цены всех товаров"),
+        ("stats", "Показать статистику цен товаров"),
         ("help", "Показать справку по командам"),
         ("cancel", "Отменить текущую операцию"),
         ("subscribe", "Подписаться на уведомления"),
         ("unsubscribe", "Отписаться от уведомлений"),
-        ("change_currency", "Сменить валюту (USD/RUB)")
+        ("change_currency", "Сменить валюту (USD/RUB)"),
+        ("rules", "Показать правила алертов"),
+        ("add_rule", "Добавить правило алерта по движению цены"),
+        ("delete_rule", "Удалить правило алерта")
     ]
     
+    # Типы правил алертов в командах бота -> rule_type API
+    RULE_TYPES: Dict[str, str] = {
+        'move': 'pct_move',
+        'zscore': 'zscore'
+    }
+    
     # Лимиты
     MAX_PRICE = 10000.0
     MIN_PRICE = 0.01
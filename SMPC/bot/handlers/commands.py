@@ -7,7 +7,10 @@ from telegram.ext import ContextTypes
 
 from SMPC.bot.handlers.base import BaseHandler
 from SMPC.bot.config import BotConstants
-from SMPC.bot.utils.formatters import format_watchlist, format_help_message
+from SMPC.bot.utils.formatters import (
+    format_watchlist, format_stats, format_help_message, format_rules, format_watchlist_numbers
+)
+from SMPC.bot.utils.validators import parse_window
 
 logger = logging.getLogger(__name__)
 
@@ -83,6 +86,127 @@ class PricesCommandHandler(BaseHandler):
             await self._handle_error(update, e, "server_error")
 
 
+class StatsCommandHandler(BaseHandler):
+    """Обработчик команды /stats"""
+    
+    async def handle(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        user = update.effective_user
+        logger.info(f"Stats command called by user {user.id} (@{user.username})")
+        
+        try:
+            user_uuid = self._get_user_uuid(user)
+            watchlist = await self.api_service.get_watchlist(user_uuid)
+            logger.info(f"Retrieved {len(watchlist)} items from watchlist for user {user.id}")
+            
+            stats = []
+            if watchlist:
+                stats = await self.api_service.get_items_stats([item['item']['id'] for item in watchlist])
+            
+            db_user = await self.api_service.client.get_user(user_uuid)
+            currency = db_user['currency']
+            response = format_stats(watchlist, stats, currency)
+            await update.message.reply_text(response)
+            logger.info(f"Stats message sent successfully to user {user.id}")
+            
+        except Exception as e:
+            logger.error(f"Error in stats command for user {user.id}: {e}")
+            await self._handle_error(update, e, "server_error")
+
+
+class RulesCommandHandler(BaseHandler):
+    """Обработчик команды /rules"""
+    
+    async def _get_rules(self, user_uuid) -> list:
+        """Правила пользователя в порядке, в котором их нумерует /rules"""
+        rules = await self.api_service.get_alert_rules(user_uuid)
+        return sorted(rules, key=lambda rule: (rule['item_name'], rule['rule_type'], rule['window_minutes'], rule['threshold']))
+    
+    async def handle(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        user = update.effective_user
+        logger.info(f"Rules command called by user {user.id} (@{user.username})")
+        
+        try:
+            rules = await self._get_rules(self._get_user_uuid(user))
+            await update.message.reply_text(format_rules(rules))
+            logger.info(f"Rules message sent successfully to user {user.id}")
+        except Exception as e:
+            await self._handle_error(update, e, "server_error")
+
+
+class AddRuleCommandHandler(BaseHandler):
+    """Обработчик команды /add_rule <номер предмета> <move|zscore> <порог> <окно>"""
+    
+    async def handle(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        user = update.effective_user
+        logger.info(f"Add rule command called by user {user.id} (@{user.username}): {context.args}")
+        
+        try:
+            user_uuid = self._get_user_uuid(user)
+            watchlist = await self.api_service.get_watchlist(user_uuid)
+            if not watchlist:
+                await update.message.reply_text(BotConstants.MESSAGES['EMPTY_WATCHLIST'])
+                return
+            
+            rule = self._parse_args(context.args or [], len(watchlist))
+            if rule is None:
+                await update.message.reply_text(
+                    BotConstants.MESSAGES['ADD_RULE_USAGE'] + "\n\n" + format_watchlist_numbers(watchlist)
+                )
+                return
+            
+            number, rule_type, threshold, window_minutes = rule
+            await self.api_service.create_alert_rule(
+                user_uuid, watchlist[number - 1]['id'], rule_type, threshold, window_minutes
+            )
+            await update.message.reply_text(BotConstants.MESSAGES['RULE_ADDED'])
+            logger.info(f"Alert rule {rule_type} added for user {user.id}")
+        except Exception as e:
+            await self._handle_error(update, e, "server_error")
+    
+    @staticmethod
+    def _parse_args(args: list, watchlist_size: int):
+        """(номер предмета, rule_type, порог, окно в минутах) или None, если аргументы неверны"""
+        if len(args) != 4 or not args[0].isdigit():
+            return None
+        number = int(args[0])
+        rule_type = BotConstants.RULE_TYPES.get(args[1].lower())
+        window_minutes = parse_window(args[3])
+        try:
+            threshold = float(args[2].rstrip('%'))
+        except ValueError:
+            return None
+        if not 1 <= number <= watchlist_size or rule_type is None or window_minutes is None or threshold <= 0:
+            return None
+        return number, rule_type, threshold, window_minutes
+
+
+class DeleteRuleCommandHandler(RulesCommandHandler):
+    """Обработчик команды /delete_rule <номер правила>"""
+    
+    async def handle(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        user = update.effective_user
+        logger.info(f"Delete rule command called by user {user.id} (@{user.username}): {context.args}")
+        
+        try:
+            user_uuid = self._get_user_uuid(user)
+            rules = await self._get_rules(user_uuid)
+            args = context.args or []
+            if len(args) != 1 or not args[0].isdigit() or not 1 <= int(args[0]) <= len(rules):
+                await update.message.reply_text(
+                    BotConstants.MESSAGES['DELETE_RULE_USAGE'] + "\n\n" + format_rules(rules)
+                )
+                return
+            
+            rule = rules[int(args[0]) - 1]
+            if await self.api_service.delete_alert_rule(user_uuid, rule['id']):
+                await update.message.reply_text(BotConstants.MESSAGES['RULE_DELETED'])
+                logger.info(f"Alert rule {rule['id']} deleted by user {user.id}")
+            else:
+                await update.message.reply_text(BotConstants.MESSAGES['SOMETHING_WRONG'])
+        except Exception as e:
+            await self._handle_error(update, e, "server_error")
+
+
 class SubscribeCommandHandler(BaseHandler):
     """Обработчик команды /subscribe"""
     
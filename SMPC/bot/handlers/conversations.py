@@ -23,10 +23,6 @@ class AddItemConversationHandler(BaseHandler):
         user = update.effective_user
         context.user_data['user_id'] = self._get_user_uuid(update.effective_user)
         
-        db_user = await self.api_service.client.get_user(context.user_data['user_id'])
-        print(123, db_user)
-        context.user_data['currency'] = db_user['currency']
-        
         logger.info(f"Add item flow started by user {user.id} (@{user.username})")
         
         try:
@@ -59,22 +55,24 @@ class AddItemConversationHandler(BaseHandler):
             context.user_data['item_name'] = get_name_from_url(url)
             logger.info(f"Parsed item data for user {user.id}: listing_id={context.user_data['listing_id']}, name={context.user_data['item_name']}")
             
-            item_id = await self._get_or_create_item_id(context)
-            logger.info(f"Got/created item ID {item_id} for user {user.id}")
-            
-            context.user_data['item_id'] = item_id
-            
-            # Проверяем, есть ли уже предмет в списке отслеживания
-            in_watchlist = await self.api_service.check_item_in_watchlist(
-                context.user_data['user_id'], 
-                item_id
+            # Один запрос: валюта пользователя, есть ли предмет в базе и в списке отслеживания
+            lookup = await self.api_service.lookup_watchlist_item(
+                context.user_data['user_id'],
+                context.user_data['listing_id'],
+                context.user_data['item_name']
             )
-            if in_watchlist['in_watchlist']:
-                logger.info(f"Item {item_id} already in watchlist for user {user.id}")
+            context.user_data['currency'] = lookup['currency']
+            if lookup['in_watchlist']:
+                logger.info(f"Item {lookup['item_id']} already in watchlist for user {user.id}")
                 await update.message.reply_text(format_error_message('item_exists'))
                 context.user_data.clear()
                 return ConversationHandler.END
             
+            item_id = await self._get_or_create_item_id(context, lookup)
+            logger.info(f"Got/created item ID {item_id} for user {user.id}")
+            
+            context.user_data['item_id'] = item_id
+            
             await update.message.reply_text(BotConstants.MESSAGES['ENTER_SELL_PRICE'] + f" in ({context.user_data['currency']})")
             logger.info(f"Requesting sell price from user {user.id}")
             return BotConstants.ITEM_SELL_PRICE
@@ -144,17 +142,14 @@ class AddItemConversationHandler(BaseHandler):
         
         return ConversationHandler.END
     
-    async def _get_or_create_item_id(self, context: ContextTypes.DEFAULT_TYPE) -> UUID:
-        """Получить ID предмета из базы данных или создать новый"""
+    async def _get_or_create_item_id(self, context: ContextTypes.DEFAULT_TYPE, lookup: dict) -> UUID:
+        """Получить ID предмета из результата поиска или создать новый"""
         item_name = context.user_data['item_name']
-        logger.info(f"Checking if item exists: {item_name}")
         
         try:
-            item = await self.api_service.check_item_exists(item_name)
-            
-            if item['exists']:
-                logger.info(f"Item {item_name} already exists with ID: {item['item_id']}")
-                return UUID(item['item_id'])
+            if lookup['exists']:
+                logger.info(f"Item {item_name} already exists with ID: {lookup['item_id']}")
+                return UUID(str(lookup['item_id']))
             
             # Если предмет не существует, создаем новый
             logger.info(f"Item {item_name} doesn't exist, creating new item")
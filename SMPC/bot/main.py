@@ -1,6 +1,7 @@
 """
 Главный файл Steam Monitor Bot
 """
+import asyncio
 import logging
 from telegram import BotCommand
 from telegram.ext import (
@@ -9,12 +10,12 @@ from telegram.ext import (
 )
 
 from SMPC.bot.config import BotConfig, BotConstants
-from SMPC.bot.services import APIService, PriceService, NotificationService
+from SMPC.bot.services import APIService, PriceService, NotificationService, NotificationDispatcher
 from SMPC.bot.handlers.commands import (
-    StartCommandHandler, HelpCommandHandler, PricesCommandHandler,
+    StartCommandHandler, HelpCommandHandler, PricesCommandHandler, StatsCommandHandler,
     SubscribeCommandHandler, UnsubscribeCommandHandler, CurrencySelectionHandler,
     ChangeCurrencyCommandHandler, CurrencyChangeWarningHandler, CurrencyChangeHandler,
-    WatchlistPriceUpdateHandler
+    WatchlistPriceUpdateHandler, RulesCommandHandler, AddRuleCommandHandler, DeleteRuleCommandHandler
 )
 from SMPC.bot.handlers.conversations import AddItemConversationHandler
 
@@ -29,9 +30,32 @@ class SteamMonitorBot:
         self.app = Application.builder().token(config.token).build()
         
         # Инициализация сервисов
-        self.api_service = APIService()
-        self.price_service = PriceService(config)
-        self.notification_service = NotificationService(self.app.bot)
+        # События изменения цен передаются от PriceService в NotificationService в пределах процесса
+        price_events = asyncio.Queue() if config.event_alerts_enabled else None
+        self.api_service = APIService(
+            transport=config.api_transport,
+            base_url=config.api_url,
+            max_connections=config.api_max_connections,
+            max_keepalive_connections=config.api_max_keepalive,
+            keepalive_expiry=config.api_keepalive_expiry,
+            http2=config.api_http2,
+            timeout=config.api_timeout,
+            pool_timeout=config.api_pool_timeout,
+            long_timeout=config.api_long_timeout
+        )
+        self.price_service = PriceService(config, price_events=price_events)
+        dispatcher = NotificationDispatcher(
+            self.app.bot,
+            workers=config.notify_workers,
+            global_rate=config.notify_global_rate,
+            chat_interval=config.notify_chat_interval,
+            max_attempts=config.notify_max_attempts,
+            queue_path=config.notify_queue_path
+        )
+        self.notification_service = NotificationService(
+            self.app.bot, price_events=price_events, dispatcher=dispatcher
+        )
+        self._price_events_task = None
         
         # Инициализация обработчиков
         self._init_handlers()
@@ -47,9 +71,13 @@ class SteamMonitorBot:
             start_handler = StartCommandHandler(self.api_service, self.price_service, self.notification_service)
             help_handler = HelpCommandHandler(self.api_service, self.price_service, self.notification_service)
             prices_handler = PricesCommandHandler(self.api_service, self.price_service, self.notification_service)
+            stats_handler = StatsCommandHandler(self.api_service, self.price_service, self.notification_service)
             subscribe_handler = SubscribeCommandHandler(self.api_service, self.price_service, self.notification_service)
             unsubscribe_handler = UnsubscribeCommandHandler(self.api_service, self.price_service, self.notification_service)
             change_currency_handler = ChangeCurrencyCommandHandler(self.api_service, self.price_service, self.notification_service)
+            rules_handler = RulesCommandHandler(self.api_service, self.price_service, self.notification_service)
+            add_rule_handler = AddRuleCommandHandler(self.api_service, self.price_service, self.notification_service)
+            delete_rule_handler = DeleteRuleCommandHandler(self.api_service, self.price_service, self.notification_service)
             
             # Создаем обработчики валюты
             currency_handler = CurrencySelectionHandler(self.api_service, self.price_service, self.notification_service)
@@ -81,6 +109,7 @@ class SteamMonitorBot:
                     CommandHandler("cancel", add_item_handler.cancel),
                     CommandHandler("start", self._cancel_and_start),
                     CommandHandler("prices", self._cancel_and_prices),
+                    CommandHandler("stats", self._cancel_and_stats),
                     CommandHandler("help", self._cancel_and_help),
                     CommandHandler("add", add_item_handler.handle),
                     CommandHandler("subscribe", self._cancel_and_subscribe),
@@ -94,9 +123,13 @@ class SteamMonitorBot:
             self.app.add_handler(CommandHandler("start", start_handler.handle))
             self.app.add_handler(CommandHandler("help", help_handler.handle))
             self.app.add_handler(CommandHandler("prices", prices_handler.handle))
+            self.app.add_handler(CommandHandler("stats", stats_handler.handle))
             self.app.add_handler(CommandHandler("subscribe", subscribe_handler.handle))
             self.app.add_handler(CommandHandler("unsubscribe", unsubscribe_handler.handle))
             self.app.add_handler(CommandHandler("change_currency", change_currency_handler.handle))
+            self.app.add_handler(CommandHandler("rules", rules_handler.handle))
+            self.app.add_handler(CommandHandler("add_rule", add_rule_handler.handle))
+            self.app.add_handler(CommandHandler("delete_rule", delete_rule_handler.handle))
             
             # Добавляем обработчики callback'ов
             self.app.add_handler(CallbackQueryHandler(
@@ -150,6 +183,17 @@ class SteamMonitorBot:
         await prices_handler.handle(update, context)
         return ConversationHandler.END
     
+    async def _cancel_and_stats(self, update, context):
+        """Отменить текущий разговор и выполнить команду stats"""
+        user = update.effective_user
+        logger.info(f"Cancelling conversation and executing stats for user {user.id}")
+        context.user_data.clear()
+        await update.message.reply_text(BotConstants.MESSAGES['OPERATION_CANCELLED'])
+        
+        stats_handler = StatsCommandHandler(self.api_service, self.price_service, self.notification_service)
+        await stats_handler.handle(update, context)
+        return ConversationHandler.END
+    
     async def _cancel_and_help(self, update, context):
         """Отменить текущий разговор и выполнить команду help"""
         user = update.effective_user
@@ -237,12 +281,35 @@ class SteamMonitorBot:
         except Exception as e:
             logger.error(f"Error setting bot commands: {e}")
     
+    async def _post_init(self, application):
+        """Подготовить клиент API, настроить команды бота, запустить рассылку и обработку событий изменения цен"""
+        await self.api_service.start()
+        await self._setup_bot_commands(application)
+        await self.notification_service.dispatcher.start(self.api_service)
+        if self.notification_service.price_events is not None:
+            self._price_events_task = application.create_task(
+                self.notification_service.consume_price_events(self.api_service)
+            )
+            logger.info("Event-driven alerts enabled")
+    
+    async def _post_shutdown(self, application):
+        """Остановить обработку событий изменения цен, рассылку (очередь сохраняется в журнале) и клиент API"""
+        if self._price_events_task is not None:
+            self._price_events_task.cancel()
+            try:
+                await self._price_events_task
+            except asyncio.CancelledError:
+                pass
+        await self.notification_service.dispatcher.stop()
+        await self.api_service.close()
+    
     def run(self):
         """Запустить бота"""
         logger.info("Starting Steam Monitor Bot")
         try:
-            # Настраиваем команды бота
-            self.app.post_init = self._setup_bot_commands
+            # Настраиваем команды бота и фоновые задачи
+            self.app.post_init = self._post_init
+            self.app.post_shutdown = self._post_shutdown
             
             # Запускаем периодические задачи
             self.app.job_queue.run_repeating(
@@ -5,5 +5,7 @@
 from SMPC.bot.services.api_service import APIService
 from SMPC.bot.services.price_service import PriceService
 from SMPC.bot.services.notification_service import NotificationService
+from SMPC.bot.services.notification_dispatcher import NotificationDispatcher
+from SMPC.bot.services.fx_service import FxRateTable
 
-__all__ = ["APIService", "PriceService", "NotificationService"]
\ No newline at end of file
+__all__ = ["APIService", "PriceService", "NotificationService", "NotificationDispatcher", "FxRateTable"]
\ No newline at end of file
@@ -2,11 +2,11 @@
 Сервис для работы с API
 """
 import logging
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, AsyncIterator
 from uuid import UUID
 from httpx import HTTPStatusError
 
-from SMPC.api import SteamWatchlistAPIClient
+from SMPC.api import SteamWatchlistAPIClient, DirectWatchlistAPIClient
 from SMPC.bot.config import BotConstants
 
 logger = logging.getLogger(__name__)
@@ -15,8 +15,30 @@ logger = logging.getLogger(__name__)
 class APIService:
     """Сервис для работы с API Steam Watchlist"""
     
-    def __init__(self):
-        self.client = SteamWatchlistAPIClient()
+    def __init__(self, transport: str = "http", base_url: str = "http://localhost:8000", **client_options):
+        """
+        Args:
+            transport: http - запросы к API по HTTP, direct - вызовы обработчиков API в этом процессе
+                (бот и API в одном контейнере, без сетевого запроса и JSON на каждый вызов)
+            base_url: Адрес API (для http)
+            client_options: Настройки пула и таймаутов SteamWatchlistAPIClient (для http)
+        """
+        if transport == "direct":
+            self.client = DirectWatchlistAPIClient()
+        elif transport == "http":
+            # Один пул соединений на процесс
+            self.client = SteamWatchlistAPIClient.shared(base_url, **client_options)
+        else:
+            raise ValueError(f"Unknown API transport: {transport}")
+        logger.info(f"API transport: {transport}")
+    
+    async def start(self) -> None:
+        """Подготовить клиент к работе (для direct - подключение к БД и состояние API)"""
+        await self.client.start()
+    
+    async def close(self) -> None:
+        """Закрыть клиент (для http - соединения пула)"""
+        await self.client.close()
     
     async def create_user(self, user_uuid: UUID, telegram_id: int, currency: str = "USD") -> bool:
         """Создать или обновить пользователя"""
@@ -118,6 +140,14 @@ class APIService:
             logger.error(f"Unexpected error adding item {item_id} to watchlist: {e}")
             return BotConstants.MESSAGES['SOMETHING_WRONG']
     
+    async def lookup_watchlist_item(self, user_id: UUID, listing_id: str, name: str) -> Dict[str, Any]:
+        """Найти предмет, проверить, есть ли он в списке отслеживания, и получить валюту пользователя (один запрос)"""
+        try:
+            return await self.client.lookup_watchlist_item(user_id, int(listing_id), name)
+        except Exception as e:
+            logger.error(f"Error looking up item {name} for user {user_id}: {e}")
+            raise
+    
     async def check_item_in_watchlist(self, user_id: UUID, item_id: UUID) -> Dict[str, Any]:
         """Проверить, есть ли предмет в списке отслеживания"""
         try:
@@ -144,15 +174,40 @@ class APIService:
             logger.error(f"Error getting all items: {e}")
             raise
     
-    async def update_item_price(self, item_name: str, current_price_rub: float, current_price_usd: float) -> bool:
-        """Обновить цену предмета"""
+    async def get_items_stats(self, item_ids: List[UUID]) -> List[Dict[str, Any]]:
+        """Получить статистику цен предметов"""
         try:
-            await self.client.update_item_price(name = item_name, new_price_rub=current_price_rub, new_price_usd=current_price_usd)
+            return await self.client.get_items_stats(item_ids)
+        except Exception as e:
+            logger.error(f"Error getting stats for {len(item_ids)} items: {e}")
+            raise
+    
+    async def update_item_price(self, item_name: str, current_price_rub: float, current_price_usd: float,
+                                price_rub_fx_calibrated_at=None, price_rub_fx_error: Optional[float] = None,
+                                listing_id: Optional[str] = None) -> bool:
+        """Обновить цену предмета (с метаданными курса, если цена в RUB получена пересчетом)"""
+        try:
+            await self.client.update_item_price(
+                name=item_name,
+                listing_id=int(listing_id) if listing_id is not None else None,
+                new_price_rub=current_price_rub,
+                new_price_usd=current_price_usd,
+                price_rub_fx_calibrated_at=price_rub_fx_calibrated_at,
+                price_rub_fx_error=price_rub_fx_error
+            )
             return True
         except Exception as e:
             logger.error(f"Error updating price for item {item_name}: {e}")
             return False
     
+    async def update_item_prices_batch(self, updates: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Обновить цены пачки предметов одним запросом, None при ошибке"""
+        try:
+            return await self.client.update_item_prices_batch(updates)
+        except Exception as e:
+            logger.error(f"Error batch updating prices for {len(updates)} items: {e}")
+            return None
+    
     async def get_subscribers(self) -> List[Dict[str, Any]]:
         """Получить всех подписчиков"""
         try:
@@ -161,6 +216,62 @@ class APIService:
             logger.error(f"Error getting subscribers: {e}")
             raise
     
+    async def iter_subscriber_alerts(self) -> AsyncIterator[Dict[str, Any]]:
+        """Потоково получить алерты всех подписчиков, сгруппированные по пользователю"""
+        try:
+            async for user_alerts in self.client.iter_subscriber_alerts():
+                yield user_alerts
+        except Exception as e:
+            logger.error(f"Error streaming subscriber alerts: {e}")
+            raise
+    
+    async def iter_item_alerts(self, changes: List[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Потоково получить новые алерты по изменившимся предметам, сгруппированные по пользователю.
+        changes - изменения цен (id, old_usd, old_rub, new_usd, new_rub) из ответа пакетного обновления
+        """
+        try:
+            async for user_alerts in self.client.iter_item_alerts(changes):
+                yield user_alerts
+        except Exception as e:
+            logger.error(f"Error evaluating alerts for {len(changes)} items: {e}")
+            raise
+    
+    async def ack_alerts(self, acks: List[Dict[str, Any]]) -> bool:
+        """Отметить алерты как отправленные"""
+        try:
+            await self.client.ack_alerts(acks)
+            return True
+        except Exception as e:
+            logger.error(f"Error acknowledging {len(acks)} alerts: {e}")
+            return False
+    
+    async def create_alert_rule(self, user_id: UUID, watchlist_id: UUID, rule_type: str,
+                                threshold: float, window_minutes: int) -> Dict[str, Any]:
+        """Добавить правило алерта (движение цены в % или отклонение в сигмах за окно)"""
+        try:
+            return await self.client.create_alert_rule(user_id, watchlist_id, rule_type, threshold, window_minutes)
+        except Exception as e:
+            logger.error(f"Error creating {rule_type} alert rule for user {user_id}: {e}")
+            raise
+    
+    async def get_alert_rules(self, user_id: UUID) -> List[Dict[str, Any]]:
+        """Получить правила алертов пользователя"""
+        try:
+            return await self.client.get_alert_rules(user_id)
+        except Exception as e:
+            logger.error(f"Error getting alert rules for user {user_id}: {e}")
+            raise
+    
+    async def delete_alert_rule(self, user_id: UUID, rule_id: UUID) -> bool:
+        """Удалить правило алерта пользователя"""
+        try:
+            await self.client.delete_alert_rule(user_id, rule_id)
+            return True
+        except Exception as e:
+            logger.error(f"Error deleting alert rule {rule_id} for user {user_id}: {e}")
+            return False
+    
     async def get_watchlist_alerts(self, user_id: UUID, currency: str = "USD") -> Dict[str, List[Dict[str, Any]]]:
         """Получить алерты для пользователя"""
         try:
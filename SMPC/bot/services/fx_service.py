@@ -0,0 +1,67 @@
+"""
+Таблица курсов для получения цен во второй валюте без запросов к Steam
+"""
+import logging
+import statistics
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class FxRate:
+    """Курс валюты относительно базовой"""
+    rate: float
+    error: float  # относительная граница ошибки
+    calibrated_at: datetime
+    samples: int
+    
+    def age(self) -> float:
+        """Возраст курса в секундах"""
+        return (datetime.now(timezone.utc) - self.calibrated_at).total_seconds()
+
+
+class FxRateTable:
+    """Локальная таблица курсов, калибруемая по предметам с ценами в обеих валютах"""
+    
+    def __init__(self, max_age: int = 3600, min_samples: int = 3):
+        self.max_age = max_age
+        self.min_samples = min_samples
+        self.rates: Dict[str, FxRate] = {}
+    
+    def get(self, currency: str) -> Optional[FxRate]:
+        """Получить курс валюты, если он есть и не устарел"""
+        fx_rate = self.rates.get(currency.upper())
+        if fx_rate is None or fx_rate.age() > self.max_age:
+            return None
+        return fx_rate
+    
+    def is_stale(self, currency: str) -> bool:
+        """Нужна ли перекалибровка курса"""
+        return self.get(currency) is None
+    
+    def calibrate(self, currency: str, pairs: Iterable[Tuple[float, float]]) -> Optional[FxRate]:
+        """
+        Перекалибровать курс по парам (цена в базовой валюте, цена в валюте currency).
+        Курс - медиана отношений, граница ошибки - максимальное относительное отклонение от медианы.
+        """
+        ratios = [quote / base for base, quote in pairs if base and quote and base > 0 and quote > 0]
+        if len(ratios) < self.min_samples:
+            logger.warning(f"Not enough samples to calibrate {currency} rate: {len(ratios)}")
+            return None
+        
+        rate = statistics.median(ratios)
+        error = max(abs(ratio - rate) / rate for ratio in ratios)
+        fx_rate = FxRate(rate=rate, error=error, calibrated_at=datetime.now(timezone.utc), samples=len(ratios))
+        self.rates[currency.upper()] = fx_rate
+        logger.info(f"Calibrated {currency} rate: {rate:.4f} ±{error:.2%} from {len(ratios)} samples")
+        return fx_rate
+    
+    def convert(self, amount: float, currency: str) -> Optional[Tuple[float, FxRate]]:
+        """Перевести сумму из базовой валюты в currency"""
+        fx_rate = self.get(currency)
+        if fx_rate is None:
+            return None
+        return round(amount * fx_rate.rate, 2), fx_rate
@@ -0,0 +1,273 @@
+"""
+Очередь отправки уведомлений в Telegram с пулом воркеров и ограничением скорости
+"""
+import os
+import json
+import time
+import uuid
+import random
+import logging
+import asyncio
+from datetime import timedelta
+from typing import List, Dict, Any, Optional, Set, Tuple
+
+from telegram import Bot
+from telegram.error import RetryAfter, Forbidden, BadRequest, TelegramError
+from SMPC.price_parser import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationDispatcher:
+    """
+    Рассылка уведомлений пулом воркеров на пределе лимитов Telegram.
+    
+    Общая скорость ограничивается token bucket (около 30 сообщений в секунду на бота),
+    в один чат сообщения уходят не чаще раза в chat_interval секунд. RetryAfter и сетевые
+    ошибки не роняют рассылку: сообщение откладывается и отправляется повторно.
+    
+    Очередь хранится в журнале (JSON lines): задание записывается до постановки в очередь,
+    отправка и ack отмечаются отдельными записями, поэтому после перезапуска недоставленные
+    сообщения отправляются снова, а уже отправленные только подтверждаются.
+    Алерты из очереди не ставятся повторно (pending_keys), пока их отправка не подтверждена.
+    """
+    
+    def __init__(self, bot: Bot, workers: int = 8, global_rate: float = 30.0, chat_interval: float = 1.0,
+                 max_attempts: int = 5, queue_path: Optional[str] = "notification_queue.json"):
+        """
+        Args:
+            bot: Бот для отправки сообщений
+            workers: Число воркеров
+            global_rate: Сообщений в секунду на весь бот
+            chat_interval: Минимальный интервал между сообщениями в один чат (секунды)
+            max_attempts: Попыток отправки на сообщение (ack отправленного сообщения повторяется без ограничения)
+            queue_path: Путь к журналу очереди. None - хранить только в памяти
+        """
+        self.bot = bot
+        self.workers = workers
+        self.chat_interval = chat_interval
+        self.max_attempts = max_attempts
+        self.queue_path = queue_path
+        self.bucket = TokenBucket(global_rate)
+        
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._chat_ready_at: Dict[int, float] = {}
+        self._timers: Set[asyncio.TimerHandle] = set()
+        self._tasks: List[asyncio.Task] = []
+        self._journal_records = 0
+        self._api_service = None
+        self.stats = {'sent': 0, 'retried': 0, 'dropped': 0}
+        self._load()
+    
+    def _load(self) -> None:
+        """Восстановить незавершенные задания из журнала"""
+        if not self.queue_path or not os.path.exists(self.queue_path):
+            return
+        try:
+            with open(self.queue_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Оборванная последняя строка после падения
+                        logger.warning(f"Skipping corrupted record in {self.queue_path}")
+                        continue
+                    if record['op'] == 'add':
+                        self._jobs[record['job']['id']] = record['job']
+                    elif record['op'] == 'sent' and record['id'] in self._jobs:
+                        self._jobs[record['id']]['sent'] = True
+                    elif record['op'] == 'done':
+                        self._jobs.pop(record['id'], None)
+        except OSError as e:
+            logger.error(f"Failed to load notification queue from {self.queue_path}: {e}")
+            return
+        for job in self._jobs.values():
+            job['not_before'] = 0.0
+            self._queue.put_nowait(job)
+        logger.info(f"Restored {len(self._jobs)} pending notifications from {self.queue_path}")
+        self._compact()
+    
+    def _compact(self) -> None:
+        """Атомарно переписать журнал, оставив только незавершенные задания"""
+        if not self.queue_path:
+            return
+        tmp_path = f"{self.queue_path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for job in self._jobs.values():
+                    f.write(json.dumps({'op': 'add', 'job': job}, ensure_ascii=False) + "\n")
+            os.replace(tmp_path, self.queue_path)
+            self._journal_records = len(self._jobs)
+        except OSError as e:
+            logger.error(f"Failed to compact notification queue {self.queue_path}: {e}")
+    
+    def _append(self, record: Dict[str, Any]) -> None:
+        """Дописать запись в журнал"""
+        if not self.queue_path:
+            return
+        try:
+            with open(self.queue_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._journal_records += 1
+        except OSError as e:
+            logger.error(f"Failed to write notification queue {self.queue_path}: {e}")
+    
+    def pending_keys(self) -> Set[Tuple[str, str]]:
+        """(watchlist_id, side) алертов и (rule_id, 'rule') правил, отправка которых еще не подтверждена"""
+        return {
+            (str(ack.get('rule_id') or ack['watchlist_id']), ack['side'])
+            for job in self._jobs.values()
+            for ack in job['acks']
+        }
+    
+    def pending(self) -> int:
+        """Число незавершенных заданий"""
+        return len(self._jobs)
+    
+    def enqueue(self, telegram_id: int, text: str, acks: List[Dict[str, Any]]) -> None:
+        """Поставить сообщение в очередь; acks отправляются в API после успешной доставки"""
+        job = {
+            'id': uuid.uuid4().hex,
+            'telegram_id': telegram_id,
+            'text': text,
+            'acks': [
+                {**ack, **{key: str(ack[key]) for key in ('watchlist_id', 'rule_id') if ack.get(key) is not None}}
+                for ack in acks
+            ],
+            'attempts': 0,
+            'sent': False,
+            'not_before': 0.0,
+        }
+        self._append({'op': 'add', 'job': job})
+        self._jobs[job['id']] = job
+        self._queue.put_nowait(job)
+    
+    async def start(self, api_service) -> None:
+        """Запустить воркеры (восстановленные из журнала задания уже в очереди)"""
+        self._api_service = api_service
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"Notification dispatcher started: {self.workers} workers, {len(self._jobs)} pending")
+    
+    async def stop(self) -> None:
+        """Остановить воркеры; незавершенные задания остаются в журнале"""
+        for timer in self._timers:
+            timer.cancel()
+        self._timers.clear()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if not self._jobs:
+            self._compact()
+        logger.info(f"Notification dispatcher stopped: {len(self._jobs)} pending, stats {self.stats}")
+    
+    def _schedule(self, job: Dict[str, Any], delay: float) -> None:
+        """Вернуть задание в очередь через delay секунд"""
+        def requeue():
+            self._timers.discard(timer)
+            self._queue.put_nowait(job)
+        timer = asyncio.get_running_loop().call_later(delay, requeue)
+        self._timers.add(timer)
+    
+    def _finish(self, job: Dict[str, Any]) -> None:
+        """Удалить задание из очереди и журнала"""
+        self._jobs.pop(job['id'], None)
+        self._append({'op': 'done', 'id': job['id']})
+        # Журнал переписывается, когда в нем накопилось много завершенных записей
+        if not self._jobs or self._journal_records > max(1000, 4 * len(self._jobs)):
+            self._compact()
+    
+    def _retry(self, job: Dict[str, Any], reason: str, delay: Optional[float] = None, count_attempt: bool = True) -> None:
+        """Отложить задание с экспоненциальной паузой или отказаться от него после max_attempts"""
+        if job['sent']:
+            # Сообщение уже доставлено: без ack алерты сработают снова и пользователь
+            # получит дубль, поэтому ack повторяется без ограничения числа попыток
+            job['ack_attempts'] = job.get('ack_attempts', 0) + 1
+            attempts = job['ack_attempts']
+        else:
+            if count_attempt:
+                job['attempts'] += 1
+            if job['attempts'] >= self.max_attempts:
+                # Без ack алерты сработают снова при следующей проверке
+                logger.error(f"Giving up on notification for {job['telegram_id']} after {job['attempts']} attempts: {reason}")
+                self.stats['dropped'] += 1
+                self._finish(job)
+                return
+            attempts = job['attempts']
+        if delay is None:
+            # Показатель ограничивается до возведения в степень: число попыток ack не ограничено
+            delay = random.uniform(0, 2.0 ** min(attempts, 6))
+        job['not_before'] = time.time() + delay
+        self.stats['retried'] += 1
+        logger.warning(f"Retrying notification for {job['telegram_id']} in {delay:.1f}s: {reason}")
+        self._schedule(job, delay)
+    
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._process(job)
+            except Exception as e:
+                logger.error(f"Unexpected error processing notification for {job['telegram_id']}: {e}")
+                try:
+                    self._retry(job, str(e))
+                except Exception as retry_error:
+                    # Воркер не должен завершиться: задание возвращается в очередь с максимальной паузой
+                    logger.error(f"Failed to reschedule notification for {job['telegram_id']}: {retry_error}")
+                    self._schedule(job, 60.0)
+            finally:
+                self._queue.task_done()
+    
+    async def _process(self, job: Dict[str, Any]) -> None:
+        """Отправить сообщение (если еще не отправлено) и подтвердить алерты"""
+        if job['id'] not in self._jobs:
+            return
+        
+        if not job['sent']:
+            telegram_id = job['telegram_id']
+            now = time.time()
+            wait = max(job['not_before'], self._chat_ready_at.get(telegram_id, 0.0)) - now
+            if wait > 0:
+                self._schedule(job, wait)
+                return
+            self._chat_ready_at[telegram_id] = now + self.chat_interval
+            
+            await self.bucket.acquire()
+            try:
+                await self.bot.send_message(
+                    telegram_id,
+                    job['text'],
+                    parse_mode='Markdown',
+                    disable_web_page_preview=True
+                )
+            except RetryAfter as e:
+                retry_after = e.retry_after
+                delay = retry_after.total_seconds() if isinstance(retry_after, timedelta) else float(retry_after)
+                self._chat_ready_at[telegram_id] = time.time() + delay
+                # RetryAfter относится ко всему боту: остальные воркеры тоже ждут
+                self.bucket.pause(delay)
+                # Ограничение Telegram - не ошибка доставки, попытка не расходуется
+                self._retry(job, f"flood control, retry after {delay:.0f}s", delay=delay, count_attempt=False)
+                return
+            except (Forbidden, BadRequest) as e:
+                # Бот заблокирован или сообщение некорректно - повтор не поможет
+                logger.error(f"Dropping notification for {telegram_id}: {e}")
+                self.stats['dropped'] += 1
+                self._finish(job)
+                return
+            except TelegramError as e:
+                self._retry(job, str(e))
+                return
+            
+            job['sent'] = True
+            self._append({'op': 'sent', 'id': job['id']})
+            self.stats['sent'] += 1
+            logger.info(f"Successfully notified subscriber {telegram_id}")
+        
+        if job['acks'] and not await self._api_service.ack_alerts(job['acks']):
+            self._retry(job, "failed to acknowledge alerts")
+            return
+        self._finish(job)
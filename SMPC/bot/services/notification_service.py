@@ -3,11 +3,12 @@
 """
 import logging
 import asyncio
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 from telegram import Bot
 from SMPC.bot.config import BotConstants
-from SMPC.bot.utils.formatters import format_alerts_message
+from SMPC.bot.utils.formatters import format_alerts_message, format_rule_alerts_message
+from SMPC.bot.services.notification_dispatcher import NotificationDispatcher
 
 logger = logging.getLogger(__name__)
 
@@ -15,37 +16,86 @@ logger = logging.getLogger(__name__)
 class NotificationService:
     """Сервис для отправки уведомлений пользователям"""
     
-    def __init__(self, bot: Bot):
+    def __init__(self, bot: Bot, price_events: Optional[asyncio.Queue] = None,
+                 dispatcher: Optional[NotificationDispatcher] = None):
         self.bot = bot
+        # Очередь событий изменения цен от PriceService (списки изменений цен предметов)
+        self.price_events = price_events
+        # Сообщения отправляются через очередь с пулом воркеров и лимитами Telegram
+        self.dispatcher = dispatcher or NotificationDispatcher(bot)
+        # Периодическая рассылка и рассылка по событиям не должны ставить один алерт в очередь дважды
+        self._delivery_lock = asyncio.Lock()
     
     async def notify_subscribers(self, api_service) -> None:
         """Уведомить всех подписчиков о сработавших алертах"""
         logger.info("Starting notification process")
         
         try:
-            subscribers = await api_service.get_subscribers()
-            logger.info(f"Found {len(subscribers)} subscribers")
-            
-            for subscriber in subscribers:
-                try:
-                    await self._notify_user(subscriber, api_service)
-                    # Небольшая задержка между уведомлениями
-                    await asyncio.sleep(1)
-                except Exception as e:
-                    logger.error(f"Error notifying subscriber {subscriber.get('telegram_id')}: {e}")
-                    continue
+            async with self._delivery_lock:
+                # Алерты всех подписчиков считаются одним запросом; поток дочитывается до постановки
+                # в очередь, чтобы не держать курсор БД открытым
+                alerts_by_user = [user_alerts async for user_alerts in api_service.iter_subscriber_alerts()]
+                logger.info(f"Found alerts for {len(alerts_by_user)} subscribers")
+                await self._deliver(alerts_by_user)
                     
         except Exception as e:
             logger.error(f"Error in notification process: {e}")
     
-    async def _notify_user(self, subscriber: Dict[str, Any], api_service) -> None:
-        """Уведомить конкретного пользователя"""
-        user_id = subscriber['id']
-        telegram_id = subscriber['telegram_id']
-        currency = subscriber['currency']
+    async def consume_price_events(self, api_service) -> None:
+        """Проверять алерты наблюдателей изменившихся предметов по мере поступления событий (до отмены задачи)"""
+        logger.info("Price event consumer started")
+        while True:
+            changes = self._merge_changes({}, await self.price_events.get())
+            # События, накопившиеся за время предыдущей рассылки, обрабатываются одним запросом
+            while not self.price_events.empty():
+                changes = self._merge_changes(changes, self.price_events.get_nowait())
+            
+            try:
+                async with self._delivery_lock:
+                    alerts_by_user = [
+                        user_alerts async for user_alerts in api_service.iter_item_alerts(list(changes.values()))
+                    ]
+                    logger.info(f"Price changes of {len(changes)} items triggered alerts for {len(alerts_by_user)} subscribers")
+                    await self._deliver(alerts_by_user)
+            except Exception as e:
+                logger.error(f"Error processing price events for {len(changes)} items: {e}")
+    
+    @staticmethod
+    def _merge_changes(merged: Dict[str, Dict[str, Any]], changes: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """Склеить изменения цен по предмету: старая цена - из первого события, новая - из последнего"""
+        for change in changes:
+            previous = merged.get(change['id'])
+            if previous is None:
+                merged[change['id']] = dict(change)
+            else:
+                previous.update(new_usd=change['new_usd'], new_rub=change['new_rub'])
+        return merged
+    
+    async def _deliver(self, alerts_by_user: List[Dict[str, Any]]) -> None:
+        """Поставить алерты пользователей в очередь отправки (ack - после доставки)"""
+        pending = self.dispatcher.pending_keys()
+        queued = 0
+        for user_alerts in alerts_by_user:
+            try:
+                # Алерты, которые уже ждут отправки, не дублируются
+                user_alerts = {
+                    **user_alerts,
+                    'buy': [alert for alert in user_alerts.get('buy') or [] if (str(alert['watchlist_id']), 'buy') not in pending],
+                    'sell': [alert for alert in user_alerts.get('sell') or [] if (str(alert['watchlist_id']), 'sell') not in pending],
+                    'rules': [alert for alert in user_alerts.get('rules') or [] if (str(alert['rule_id']), 'rule') not in pending],
+                }
+                if self._notify_user(user_alerts):
+                    queued += 1
+            except Exception as e:
+                logger.error(f"Error notifying subscriber {user_alerts.get('telegram_id')}: {e}")
+                continue
+        logger.info(f"Queued notifications for {queued} subscribers, {self.dispatcher.pending()} pending")
+    
+    def _notify_user(self, price_alerts: Dict[str, Any]) -> bool:
+        """Поставить в очередь сообщение пользователю о его алертах, вернуть True, если оно есть"""
+        telegram_id = price_alerts['telegram_id']
+        currency = price_alerts['currency']
         try:
-            price_alerts = await api_service.get_watchlist_alerts(user_id, currency)
-            print(123, price_alerts)
             # Формируем сообщения для разных типов алертов
             message_parts = []
             
@@ -67,19 +117,39 @@ class NotificationService:
                 )
                 message_parts.append(sell_message)
             
-            # Отправляем сообщение, если есть алерты
+            if price_alerts.get('rules'):
+                rules_message = format_rule_alerts_message(
+                    price_alerts['rules'],
+                    "📊 Price movement alerts:",
+                    currency
+                )
+                message_parts.append(rules_message)
+            
+            # Ставим сообщение в очередь, если есть алерты
             if message_parts:
                 full_message = "\n\n".join(message_parts)
-                await self.bot.send_message(
-                    telegram_id, 
-                    full_message, 
-                    parse_mode='Markdown',
-                    disable_web_page_preview=True
-                )
-                logger.info(f"Successfully notified subscriber {telegram_id}")
+                self.dispatcher.enqueue(telegram_id, full_message, self._build_acks(price_alerts, currency))
+                return True
             else:
                 logger.debug(f"No alerts for subscriber {telegram_id}")
+                return False
                 
         except Exception as e:
             logger.error(f"Error notifying user {telegram_id}: {e}")
             raise
+    
+    @staticmethod
+    def _build_acks(price_alerts: Dict[str, Any], currency: str) -> List[Dict[str, Any]]:
+        """Подтверждения отправки: алерт не повторится, пока цена не выйдет из зоны"""
+        price_key = 'current_price_rub' if currency == 'RUB' else 'current_price_usd'
+        acks = [
+            {'watchlist_id': alert['watchlist_id'], 'side': side, 'price': alert[price_key]}
+            for side in ('buy', 'sell')
+            for alert in price_alerts.get(side) or []
+        ]
+        # Правило не повторится, пока его условие не перестанет выполняться
+        acks.extend(
+            {'watchlist_id': alert['watchlist_id'], 'side': 'rule', 'price': alert[price_key], 'rule_id': alert['rule_id']}
+            for alert in price_alerts.get('rules') or []
+        )
+        return acks
@@ -1,12 +1,21 @@
 """
 Сервис для работы с ценами
 """
+import os
+import json
 import logging
 import asyncio
-from typing import Optional
+import time
+import random
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, List, Tuple
 
-from SMPC.price_parser import PriceParser, Currency
+from SMPC.price_parser import (
+    PriceParser, Currency, AdaptiveRateLimiter, RetryPolicy, RetryBudget,
+    PermanentParseError, CircuitOpenError
+)
 from SMPC.bot.config import BotConfig
+from SMPC.bot.services.fx_service import FxRateTable
 
 logger = logging.getLogger(__name__)
 
@@ -14,47 +23,394 @@ logger = logging.getLogger(__name__)
 class PriceService:
     """Сервис для парсинга и обновления цен"""
     
-    def __init__(self, config: BotConfig):
+    def __init__(self, config: BotConfig, price_events: Optional[asyncio.Queue] = None):
         self.config = config
-        self.price_parser = PriceParser()
+        # Очередь событий изменения цен (списки id предметов) для проверки алертов
+        self.price_events = price_events
+        self.price_parser = PriceParser(
+            nameid_cache_path=config.nameid_cache_path,
+            rate_limiter=AdaptiveRateLimiter(
+                rate=config.steam_rate,
+                min_rate=config.steam_min_rate,
+                max_rate=config.steam_max_rate
+            ),
+            result_ttl=config.price_cache_ttl,
+            retry_policy=RetryPolicy(
+                max_attempts=config.max_retries,
+                base_delay=config.retry_base_delay,
+                max_delay=config.retry_max_delay
+            ),
+            retry_budget=RetryBudget(config.retry_budget or None),
+            breaker_failure_threshold=config.breaker_failure_threshold,
+            breaker_recovery_timeout=config.breaker_recovery_timeout
+        )
+        self.fx_table = FxRateTable(max_age=config.fx_max_age)
+        # Предметы с постоянными ошибками (нет страницы, нет ордеров): ключ -> время следующей проверки
+        self.slow_lane: Dict[Tuple[int, str], float] = {}
+        # id предмета, с которого продолжить цикл, прерванный разомкнутой цепью
+        self.cursor: Optional[str] = None
+        # Спарсенные цены, ожидающие пакетного сохранения через API
+        self._price_buffer: List[Dict[str, Any]] = []
+        # Время (monotonic) постановки в буфер самой старой несохраненной цены
+        self._buffer_started = 0.0
+        self._load_state()
     
     async def parse_price(self, name: str, listing_id: str) -> Optional[float]:
         """Парсить цену предмета"""
         try:
             logger.info(f"Parsing price for item: {name}")
             current_price = await self.price_parser.parse_dual_currency_with_retries(
-                name=name, 
+                name=name,
                 listing_id=listing_id
             )
             logger.info(f"Successfully parsed price for {name}: ${current_price}")
+            self.slow_lane.pop(self._item_key(name, listing_id), None)
             return {'rub': round(float(current_price['rub']), 2), 'usd': round(float(current_price['usd']), 2)}
+        except PermanentParseError as e:
+            self._move_to_slow_lane(name, listing_id, e)
+            return None
+        except CircuitOpenError:
+            raise
         except Exception as e:
             logger.error(f"Error parsing price for {name}: {e}")
             return None
     
-    async def update_all_prices(self, api_service, items: list) -> None:
-        """Обновить цены всех предметов"""
-        logger.info(f"Updating prices for {len(items)} items")
+    async def parse_price_derived(self, name: str, listing_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Парсить только цену в USD и пересчитать RUB по таблице курсов.
+        Если актуального курса нет, цена запрашивается в обеих валютах.
+        """
+        if self.fx_table.is_stale(Currency.RUB.name):
+            return await self.parse_price(name, listing_id)
+        
+        try:
+            price_usd = await self.price_parser.parse_with_retries(name, listing_id, Currency.USD)
+        except PermanentParseError as e:
+            self._move_to_slow_lane(name, listing_id, e)
+            return None
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            logger.error(f"Error parsing USD price for {name}: {e}")
+            return None
+        self.slow_lane.pop(self._item_key(name, listing_id), None)
+        return self._derive_rub(price_usd)
+    
+    @staticmethod
+    def _item_key(name: str, listing_id) -> Tuple[int, str]:
+        return int(listing_id), name.strip()
+    
+    def _move_to_slow_lane(self, name: str, listing_id, error: Exception) -> None:
+        """Отложить проверку предмета с постоянной ошибкой на slow_lane_interval"""
+        self.slow_lane[self._item_key(name, listing_id)] = time.monotonic() + self.config.slow_lane_interval
+        logger.warning(f"Moved {name} to slow lane for {self.config.slow_lane_interval}s: {error}")
+    
+    def _split_slow_lane(self, items: list) -> Tuple[list, int]:
+        """Отделить предметы из медленной очереди, время проверки которых еще не пришло"""
+        now = time.monotonic()
+        due = [
+            item for item in items
+            if self.slow_lane.get(self._item_key(item['name'], item['listing_id']), 0) <= now
+        ]
+        return due, len(items) - len(due)
+    
+    def _derive_rub(self, price_usd: float) -> Optional[Dict[str, Any]]:
+        """Собрать цену с RUB, пересчитанным из USD, и метаданными курса"""
+        converted = self.fx_table.convert(price_usd, Currency.RUB.name)
+        if converted is None:
+            return None
+        price_rub, fx_rate = converted
+        return {
+            'rub': price_rub,
+            'usd': round(float(price_usd), 2),
+            'fx_calibrated_at': fx_rate.calibrated_at,
+            'fx_error': round(fx_rate.error, 6)
+        }
+    
+    async def _calibrate_fx(self, api_service, items: list, stats: Dict[str, Any]) -> list:
+        """
+        Перекалибровать курс RUB по случайной выборке предметов, спарсенных в обеих валютах.
+        Цены выборки сохраняются как обычные, возвращаются оставшиеся предметы.
+        """
+        sample = random.sample(items, min(self.config.fx_sample_size, len(items)))
+        results = await asyncio.gather(
+            *(self.parse_price(item['name'], item['listing_id']) for item in sample),
+            return_exceptions=True
+        )
+        prices = [None if isinstance(result, BaseException) else result for result in results]
         
+        pairs = []
+        for item, price in zip(sample, prices):
+            if price is None:
+                continue
+            pairs.append((price['usd'], price['rub']))
+            self._queue_price(item, price)
+            stats['done'] += 1
+        await self._flush_prices(api_service, stats)
+        
+        self.fx_table.calibrate(Currency.RUB.name, pairs)
+        sampled = {id(item) for item, price in zip(sample, prices) if price is not None}
+        return [item for item in items if id(item) not in sampled]
+    
+    async def update_all_prices(self, api_service, items: list) -> Dict[str, Any]:
+        """Обновить цены всех предметов: сначала пакетно, остальные параллельно ограниченным числом воркеров"""
+        items, deferred = self._split_slow_lane(self._resume_from_cursor(items))
+        total = len(items)
+        stats = {
+            'total': total, 'done': 0, 'updated': 0, 'changed': 0, 'failed': 0, 'timeouts': 0, 'bulk': 0,
+            'deferred': deferred, 'stopped': False
+        }
+        started = time.monotonic()
+        self.price_parser.retry_budget.reset()
+        
+        open_circuits = self._item_circuits_open()
+        if open_circuits:
+            logger.warning(f"Skipping price update, Steam circuits are open: {open_circuits}")
+            stats['stopped'] = True
+            self._save_state(stats)
+            return stats
+        
+        if self.config.fx_derive_enabled and items and self.fx_table.is_stale(Currency.RUB.name):
+            items = await self._calibrate_fx(api_service, items, stats)
+        
+        # Пакетный проход окупается только на многих предметах
+        if self.config.bulk_prices_enabled and len(items) >= self.config.bulk_min_items:
+            items = await self._update_bulk_prices(api_service, items, stats)
+            self._report_progress(stats, started)
+        
+        workers_count = max(1, min(self.config.price_workers, len(items)))
+        logger.info(f"Updating prices for {len(items)} items with {workers_count} workers")
+        
+        queue: asyncio.Queue = asyncio.Queue()
         for item in items:
-            try:
-                current_price = await self.parse_price(
-                    name=item['name'], 
-                    listing_id=item['listing_id']
-                )
-                
-                if current_price is not None:
-                    success = await api_service.update_item_price(item['name'], current_price['rub'], current_price['usd'])
-                    if success:
-                        logger.info(f"Successfully updated price for {item['name']}: ${current_price}")
-                    else:
-                        logger.error(f"Failed to update price for {item['name']}")
-                else:
-                    logger.warning(f"Could not parse price for {item['name']}")
-                
-                # Небольшая задержка между запросами
-                await asyncio.sleep(1)
-                
-            except Exception as e:
-                logger.error(f"Error updating price for {item['name']}: {e}")
+            queue.put_nowait(item)
+        stopped = asyncio.Event()
+        interrupted = []
+        
+        async def flusher() -> None:
+            # Пока воркеры ждут Steam, накопленные цены все равно уходят в API не позже price_flush_interval
+            while True:
+                await asyncio.sleep(self.config.price_flush_interval)
+                await self._flush_prices(api_service, stats)
+        
+        async def worker() -> None:
+            while not stopped.is_set():
+                try:
+                    item = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    parsed = await asyncio.wait_for(
+                        self._parse_item_price(item),
+                        timeout=self.config.price_item_timeout
+                    )
+                    if not parsed:
+                        stats['failed'] += 1
+                except CircuitOpenError as e:
+                    # Steam недоступен: остальные предметы этого цикла не трогаем
+                    interrupted.append(item)
+                    if not stopped.is_set():
+                        logger.warning(f"Stopping price update early: {e}")
+                    stopped.set()
+                    stats['done'] -= 1
+                except asyncio.TimeoutError:
+                    stats['timeouts'] += 1
+                    logger.warning(f"Timed out updating price for {item['name']}")
+                except Exception as e:
+                    stats['failed'] += 1
+                    logger.error(f"Error updating price for {item['name']}: {e}")
+                finally:
+                    stats['done'] += 1
+                    queue.task_done()
+                    self._report_progress(stats, started)
+                await self._flush_prices(api_service, stats)
+        
+        flush_task = asyncio.create_task(flusher())
+        try:
+            await asyncio.gather(*(worker() for _ in range(workers_count)))
+        finally:
+            flush_task.cancel()
+            await asyncio.gather(flush_task, return_exceptions=True)
+        await self._flush_prices(api_service, stats, force=True)
+        
+        if stopped.is_set():
+            remaining = interrupted + [queue.get_nowait() for _ in range(queue.qsize())]
+            order = {id(item): index for index, item in enumerate(items)}
+            self.cursor = min(remaining, key=lambda item: order[id(item)])['id']
+            stats['stopped'] = True
+        else:
+            self.cursor = None
+        
+        stats['elapsed'] = round(time.monotonic() - started, 2)
+        stats['steam'] = self.price_parser.metrics()
+        stats['retries'] = self.price_parser.retry_budget.spent
+        logger.info(
+            f"Price update finished: {stats['updated']}/{total} updated ({stats['bulk']} in bulk), "
+            f"{stats['failed']} failed, {stats['timeouts']} timed out in {stats['elapsed']}s, "
+            f"{stats['retries']} retries, {deferred} deferred in slow lane"
+            + (f", stopped early, will resume from item {self.cursor}" if stats['stopped'] else "")
+        )
+        self._save_state(stats)
+        return stats
+    
+    def _item_circuits_open(self) -> Dict[str, float]:
+        """Разомкнутые цепи endpoint'ов, без которых нельзя получить цену предмета"""
+        return {
+            endpoint: round(retry_in, 1)
+            for endpoint, retry_in in self.price_parser.open_circuits().items()
+            if endpoint in ('listing', 'histogram')
+        }
+    
+    def _resume_from_cursor(self, items: list) -> list:
+        """Упорядочить предметы по id, начиная с места, где остановился прерванный цикл"""
+        items = sorted(items, key=lambda item: item['id'])
+        if self.cursor is None:
+            return items
+        head = [item for item in items if item['id'] >= self.cursor]
+        tail = [item for item in items if item['id'] < self.cursor]
+        return head + tail
+    
+    def _load_state(self) -> None:
+        """Загрузить позицию цикла и состояние парсера, сохраненные прошлым запуском"""
+        path = self.config.parser_state_path
+        if not path or not os.path.exists(path):
+            return
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            self.cursor = state.get('cursor')
+            self.price_parser.restore_state(state)
+            logger.info(f"Loaded parser state from {path}, cursor: {self.cursor}")
+        except (OSError, ValueError, AttributeError, TypeError) as e:
+            logger.error(f"Failed to load parser state from {path}: {e}")
+    
+    def _save_state(self, stats: Dict[str, Any]) -> None:
+        """Атомарно сохранить позицию цикла и состояние парсера (читается API в /health)"""
+        path = self.config.parser_state_path
+        if not path:
+            return
+        state = {
+            'updated_at': datetime.now(timezone.utc).isoformat(),
+            'cursor': self.cursor,
+            'last_cycle': {key: value for key, value in stats.items() if key != 'steam'},
+            **self.price_parser.state()
+        }
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error(f"Failed to save parser state to {path}: {e}")
+    
+    async def _update_bulk_prices(self, api_service, items: list, stats: Dict[str, Any]) -> list:
+        """Обновить цены пакетно через поиск маркета, вернуть предметы, которые не удалось найти"""
+        names_by_listing: Dict[int, set] = {}
+        for item in items:
+            names_by_listing.setdefault(int(item['listing_id']), set()).add(item['name'])
+        
+        derive = self.config.fx_derive_enabled and not self.fx_table.is_stale(Currency.RUB.name)
+        limits = {'max_pages': self.config.bulk_max_pages, 'pages_per_item': self.config.bulk_pages_per_item}
+        if derive:
+            usd_prices = await self.price_parser.parse_bulk(names_by_listing, Currency.USD, **limits)
+            rub_prices = {}
+        else:
+            usd_prices, rub_prices = await asyncio.gather(
+                self.price_parser.parse_bulk(names_by_listing, Currency.USD, **limits),
+                self.price_parser.parse_bulk(names_by_listing, Currency.RUB, **limits)
+            )
+        
+        missed = []
+        for item in items:
+            key = (int(item['listing_id']), item['name'].strip())
+            if key not in usd_prices or (not derive and key not in rub_prices):
+                missed.append(item)
                 continue
+            
+            if derive:
+                price = self._derive_rub(usd_prices[key])
+                if price is None:
+                    missed.append(item)
+                    continue
+            else:
+                price = {'rub': round(rub_prices[key], 2), 'usd': round(usd_prices[key], 2)}
+            self.slow_lane.pop(key, None)
+            self._queue_price(item, price)
+            stats['done'] += 1
+            stats['bulk'] += 1
+            await self._flush_prices(api_service, stats)
+        
+        logger.info(f"Bulk price update: {stats['bulk']} found, {len(missed)} items left for per-item parsing")
+        return missed
+    
+    async def _parse_item_price(self, item: Dict[str, Any]) -> bool:
+        """Спарсить цену одного предмета и поставить ее в очередь на сохранение"""
+        parse = self.parse_price_derived if self.config.fx_derive_enabled else self.parse_price
+        current_price = await parse(
+            name=item['name'],
+            listing_id=item['listing_id']
+        )
+        
+        if current_price is None:
+            logger.warning(f"Could not parse price for {item['name']}")
+            return False
+        
+        self._queue_price(item, current_price)
+        return True
+    
+    def _queue_price(self, item: Dict[str, Any], price: Dict[str, Any]) -> None:
+        """Поставить цену в буфер пакетного сохранения вместе с метаданными курса, если RUB пересчитан"""
+        if not self._price_buffer:
+            self._buffer_started = time.monotonic()
+        self._price_buffer.append({
+            'id': item['id'],
+            'name': item['name'],
+            'new_price_usd': price['usd'],
+            'new_price_rub': price['rub'],
+            'price_rub_fx_calibrated_at': price.get('fx_calibrated_at'),
+            'price_rub_fx_error': price.get('fx_error')
+        })
+    
+    async def _flush_prices(self, api_service, stats: Dict[str, Any], force: bool = False) -> None:
+        """
+        Сохранить накопленные цены одним запросом, когда набралось price_batch_size,
+        самая старая цена ждет дольше price_flush_interval (или принудительно)
+        """
+        if not self._price_buffer:
+            return
+        full = len(self._price_buffer) >= self.config.price_batch_size
+        expired = time.monotonic() - self._buffer_started >= self.config.price_flush_interval
+        if not (force or full or expired):
+            return
+        batch, self._price_buffer = self._price_buffer, []
+        
+        result = await api_service.update_item_prices_batch(batch)
+        if result is None:
+            stats['failed'] += len(batch)
+            logger.error(f"Failed to save batch of {len(batch)} prices")
+            return
+        
+        not_found = result.get('not_found') or []
+        changes = result.get('changes') or []
+        stats['updated'] += len(batch) - len(not_found)
+        stats['changed'] += len(changes)
+        stats['failed'] += len(not_found)
+        logger.info(
+            f"Saved batch of {len(batch) - len(not_found)} prices ({len(changes)} changed), "
+            f"{len(not_found)} items not found"
+        )
+        if changes and self.price_events is not None:
+            self.price_events.put_nowait(changes)
+    
+    def _report_progress(self, stats: Dict[str, Any], started: float) -> None:
+        """Логировать прогресс обновления каждые price_progress_every предметов"""
+        done = stats['done']
+        if done != stats['total'] and done % self.config.price_progress_every:
+            return
+        elapsed = time.monotonic() - started
+        rate = done / elapsed if elapsed > 0 else 0.0
+        steam_rate = self.price_parser.metrics()['rate']
+        logger.info(
+            f"Price update progress: {done}/{stats['total']} items ({rate:.2f} items/s, "
+            f"Steam request rate {steam_rate:.2f}/s)"
+        )
@@ -48,6 +48,95 @@ def format_alerts_message(alerts: List[Dict[str, Any]], header: str, price_forma
     return f"{header}\n" + "\n".join(alert_lines)
 
 
+def format_window(minutes: int) -> str:
+    """Форматирование длины окна правила (30m, 4h, 7d)"""
+    if minutes % (24 * 60) == 0:
+        return f"{minutes // (24 * 60)}d"
+    if minutes % 60 == 0:
+        return f"{minutes // 60}h"
+    return f"{minutes}m"
+
+
+def format_rule_alerts_message(alerts: List[Dict[str, Any]], header: str, currency: str) -> str:
+    """Форматирование сообщения со сработавшими правилами (движение цены и отклонение от среднего)"""
+    if not alerts:
+        return ""
+    
+    alert_lines = []
+    for alert in alerts:
+        current_price = alert['current_price_rub'] if currency == 'RUB' else alert['current_price_usd']
+        window = format_window(alert['window_minutes'])
+        if alert['rule_type'] == 'pct_move':
+            rule_info = f"{alert['value']:+.2f}% in {window} ({alert['reference']:.2f} -> {current_price:.2f} {currency})"
+        else:
+            rule_info = f"{alert['value']:+.2f}σ from {window} mean ({alert['reference']:.2f} -> {current_price:.2f} {currency})"
+        alert_lines.append(f"{alert['item_name']}: {rule_info} [LINK]({alert['url']})")
+        alert_lines.append("-" * 50)
+    
+    return f"{header}\n" + "\n".join(alert_lines)
+
+
+def format_rule(rule: Dict[str, Any]) -> str:
+    """Форматирование условия правила алерта"""
+    window = format_window(rule['window_minutes'])
+    if rule['rule_type'] == 'pct_move':
+        return f"price moves {rule['threshold']:g}% in {window}"
+    return f"price deviates {rule['threshold']:g}σ from {window} mean"
+
+
+def format_rules(rules: List[Dict[str, Any]]) -> str:
+    """Форматирование пронумерованного списка правил алертов (номер - для /delete_rule)"""
+    if not rules:
+        return BotConstants.MESSAGES['NO_RULES']
+    
+    lines = []
+    for number, rule in enumerate(rules, start=1):
+        state = "" if rule['armed'] else " (notified, waiting for the condition to clear)"
+        lines.append(f"{number}. {rule['item_name']}: {format_rule(rule)}{state}")
+    return "\n".join(lines)
+
+
+def format_watchlist_numbers(watchlist: List[Dict[str, Any]]) -> str:
+    """Пронумерованный список предметов (номер - для /add_rule)"""
+    return "\n".join(f"{number}. {item['item']['name']}" for number, item in enumerate(watchlist, start=1))
+
+
+def format_stats_item(name: str, stats: Dict[str, Any], currency: str) -> str:
+    """Форматирование статистики цены одного предмета"""
+    series = stats['rub'] if currency == 'RUB' else stats['usd']
+    if series['points'] < 2:
+        return f"{name}:\n\tNot enough price history yet\n"
+    
+    def percent(value):
+        return f"{value * 100:+.2f}%" if value is not None else "n/a"
+    
+    zscore = f"{series['zscore']:+.2f}" if series['zscore'] is not None else "n/a"
+    anomaly = " ⚠️ unusual price" if series['anomaly'] else ""
+    return (
+        f"{name}:\n"
+        f"\tPrice: {series['last']:.2f} {currency}{anomaly}\n"
+        f"\tSMA/EMA ({stats['window']}h): {series['sma']:.2f} / {series['ema']:.2f} {currency}\n"
+        f"\tChange ({stats['pct_periods']}h): {percent(series['pct_change'])}\n"
+        f"\tVolatility ({stats['window']}h): {percent(series['volatility'])}\n"
+        f"\tZ-score: {zscore}\n"
+    )
+
+
+def format_stats(watchlist: List[Dict[str, Any]], stats: List[Dict[str, Any]], currency: str) -> str:
+    """Форматирование статистики цен предметов из списка отслеживания"""
+    if not watchlist:
+        return BotConstants.MESSAGES['EMPTY_WATCHLIST']
+    
+    stats_by_item = {str(item_stats['item_id']): item_stats for item_stats in stats}
+    response = ""
+    for item in watchlist:
+        item_stats = stats_by_item.get(str(item['item']['id']))
+        if item_stats is not None:
+            response += format_stats_item(item['item']['name'], item_stats, currency) + "\n"
+    
+    return response.strip()
+
+
 def format_help_message() -> str:
     """Форматирование справочного сообщения"""
     return """
@@ -56,7 +145,11 @@ def format_help_message() -> str:
 /subscribe - Subscribe to notifications, when price of item is reached to target prices (sell or buy)
 /unsubscribe - Unsubscribe from notifications
 /prices - Show the current prices of all items in the watchlist
+/stats - Show price statistics (moving averages, change, volatility) of the watchlist items
 /change_currency - Change your preferred currency (USD/RUB)
+/rules - Show your price movement alert rules
+/add_rule - Alert when an item's price moves by N% or N sigmas within a window
+/delete_rule - Delete an alert rule
 /help - Show this help message
     """.strip()
 
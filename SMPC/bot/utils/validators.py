@@ -2,7 +2,7 @@
 Валидаторы для бота
 """
 import re
-from typing import Tuple
+from typing import Optional, Tuple
 from SMPC.bot.config import BotConstants
 
 
@@ -53,3 +53,15 @@ def validate_listing_id(listing_id: str) -> bool:
     
     # Проверяем, что это числовая строка
     return listing_id.strip().isdigit() and len(listing_id.strip()) > 0
+
+
+def parse_window(window_str: str) -> Optional[int]:
+    """Разбор длины окна правила (30m, 4h, 7d) в минуты; None - неверный формат"""
+    if not window_str or not isinstance(window_str, str):
+        return None
+    
+    match = re.match(r'^(\d+)([mhd])$', window_str.strip().lower())
+    if not match:
+        return None
+    minutes = int(match.group(1)) * {'m': 1, 'h': 60, 'd': 24 * 60}[match.group(2)]
+    return minutes if minutes > 0 else None
@@ -17,7 +17,12 @@ CREATE TABLE items (
     name VARCHAR(255) NOT NULL,
     current_price_usd REAL NOT NULL,
     current_price_rub REAL NOT NULL,
-    url VARCHAR(500) NOT NULL
+    url VARCHAR(500) NOT NULL,
+    price_rub_fx_calibrated_at TIMESTAMP WITH TIME ZONE,
+    price_rub_fx_error REAL,
+    
+    -- One row per Steam item: target of the upsert in create_or_get_item
+    CONSTRAINT unique_items_listing_name UNIQUE (listing_id, name)
 );
 
 -- User item watchlist (many-to-many relationship)
@@ -35,18 +40,92 @@ CREATE TABLE user_item_watchlist (
     CONSTRAINT unique_user_item_watchlist UNIQUE (user_id, item_id)
 );
 
+-- Alert state per watchlist entry and side: alerts are sent only on threshold crossings
+CREATE TABLE watchlist_alert_state (
+    watchlist_id UUID NOT NULL REFERENCES user_item_watchlist(id) ON DELETE CASCADE,
+    side VARCHAR(4) NOT NULL CONSTRAINT alert_side_check CHECK (side IN ('buy', 'sell')),
+    armed BOOLEAN NOT NULL DEFAULT TRUE,
+    last_notified_price REAL,
+    last_notified_at TIMESTAMP WITH TIME ZONE,
+    
+    PRIMARY KEY (watchlist_id, side)
+);
+
+-- Relative alert rules (price move in a window, deviation from the window mean), evaluated by the API
+CREATE TABLE watchlist_alert_rules (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    watchlist_id UUID NOT NULL REFERENCES user_item_watchlist(id) ON DELETE CASCADE,
+    rule_type VARCHAR(16) NOT NULL CONSTRAINT alert_rule_type_check CHECK (rule_type IN ('pct_move', 'zscore')),
+    threshold REAL NOT NULL CONSTRAINT alert_rule_threshold_check CHECK (threshold > 0),
+    window_minutes INTEGER NOT NULL CONSTRAINT alert_rule_window_check CHECK (window_minutes > 0),
+    armed BOOLEAN NOT NULL DEFAULT TRUE,
+    last_triggered_value REAL,
+    last_triggered_at TIMESTAMP WITH TIME ZONE,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+);
+
+-- Append-only price history, range-partitioned by time (daily partitions are created by the API)
+CREATE TABLE item_price_history (
+    item_id UUID NOT NULL,
+    recorded_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+    price_usd REAL NOT NULL,
+    price_rub REAL NOT NULL,
+    
+    PRIMARY KEY (item_id, recorded_at)
+) PARTITION BY RANGE (recorded_at);
+
+-- Rows outside of the created partitions
+CREATE TABLE item_price_history_default PARTITION OF item_price_history DEFAULT;
+
+-- Hourly and daily OHLC rollups of the price history
+CREATE TABLE item_price_history_1h (
+    item_id UUID NOT NULL,
+    bucket TIMESTAMP WITH TIME ZONE NOT NULL,
+    open_usd REAL NOT NULL,
+    high_usd REAL NOT NULL,
+    low_usd REAL NOT NULL,
+    close_usd REAL NOT NULL,
+    open_rub REAL NOT NULL,
+    high_rub REAL NOT NULL,
+    low_rub REAL NOT NULL,
+    close_rub REAL NOT NULL,
+    samples INTEGER NOT NULL,
+    
+    PRIMARY KEY (item_id, bucket)
+);
+
+CREATE TABLE item_price_history_1d (
+    item_id UUID NOT NULL,
+    bucket TIMESTAMP WITH TIME ZONE NOT NULL,
+    open_usd REAL NOT NULL,
+    high_usd REAL NOT NULL,
+    low_usd REAL NOT NULL,
+    close_usd REAL NOT NULL,
+    open_rub REAL NOT NULL,
+    high_rub REAL NOT NULL,
+    low_rub REAL NOT NULL,
+    close_rub REAL NOT NULL,
+    samples INTEGER NOT NULL,
+    
+    PRIMARY KEY (item_id, bucket)
+);
+
 
 -- Create indexes for optimization
 -- Items table indexes
-CREATE INDEX idx_items_listing_id ON items(listing_id);
 CREATE INDEX idx_items_name ON items(name);
 CREATE INDEX idx_items_current_price_usd ON items(current_price_usd);
 CREATE INDEX idx_items_current_price_rub ON items(current_price_rub);
 
 -- Watchlist table indexes
-CREATE INDEX idx_watchlist_user_id ON user_item_watchlist(user_id);
+CREATE INDEX idx_watchlist_user_targets ON user_item_watchlist(user_id, buy_target_price, sell_target_price) INCLUDE (item_id);
 CREATE INDEX idx_watchlist_item_id ON user_item_watchlist(item_id);
 CREATE INDEX idx_watchlist_prices ON user_item_watchlist(buy_target_price, sell_target_price);
+CREATE INDEX idx_alert_rules_watchlist_id ON watchlist_alert_rules(watchlist_id);
+
+-- Price history indexes (BRIN: rows arrive in time order)
+CREATE INDEX idx_price_history_recorded_at ON item_price_history USING BRIN (recorded_at);
+CREATE INDEX idx_price_history_1h_bucket ON item_price_history_1h USING BRIN (bucket);
 
 
 
@@ -56,8 +135,15 @@ CREATE INDEX idx_watchlist_prices ON user_item_watchlist(buy_target_price, sell_
 COMMENT ON TABLE users IS 'Table of users in the system';
 COMMENT ON TABLE items IS 'Table of Steam items (normalized, no duplication)';
 COMMENT ON TABLE user_item_watchlist IS 'Many-to-many table linking users to items they want to track with their target prices';
+COMMENT ON TABLE item_price_history IS 'Append-only log of observed item prices, partitioned by day';
+COMMENT ON TABLE item_price_history_1h IS 'Hourly OHLC rollup of item_price_history';
+COMMENT ON TABLE item_price_history_1d IS 'Daily OHLC rollup of item_price_history_1h';
+COMMENT ON TABLE watchlist_alert_state IS 'Edge-triggered alert state: a disarmed alert is not re-sent until the price leaves the trigger zone';
+COMMENT ON TABLE watchlist_alert_rules IS 'Percentage-move and z-score alert rules of watchlist entries';
 
 COMMENT ON COLUMN items.listing_id IS 'ID item in Steam system (unique)';
 COMMENT ON COLUMN items.name IS 'Name of item (e.g. Fracture Case)';
 COMMENT ON COLUMN items.current_price_usd IS 'Current market price of the item in USD';
 COMMENT ON COLUMN items.current_price_rub IS 'Current market price of the item in RUB';
+COMMENT ON COLUMN items.price_rub_fx_calibrated_at IS 'Calibration time of the FX rate the RUB price was derived with (NULL if fetched directly)';
+COMMENT ON COLUMN items.price_rub_fx_error IS 'Relative error bound of the derived RUB price';
@@ -1,6 +1,7 @@
 from .crud import CRUD
-from .session import create_session_factory
+from .exceptions import NotFoundError
+from .session import create_session_factory, unit_of_work
 from . import models
 
 
-__all__ = ['CRUD', 'create_session_factory', 'models']
\ No newline at end of file
+__all__ = ['CRUD', 'NotFoundError', 'create_session_factory', 'unit_of_work', 'models']
\ No newline at end of file
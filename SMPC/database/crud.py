@@ -1,8 +1,17 @@
-from SMPC.database.session import get_session
-from SMPC.database.models import User, Item, UserItemWatchlist
-from sqlalchemy import select
-from sqlalchemy.orm import selectinload
-from uuid import UUID
+from SMPC.database.session import get_session, unit_of_work
+from SMPC.database.exceptions import NotFoundError
+from SMPC.database.models import (
+    User, Item, UserItemWatchlist, WatchlistAlertState, WatchlistAlertRule, ItemPriceHistory,
+    ItemPriceHistoryHourly, ItemPriceHistoryDaily
+)
+from sqlalchemy import select, update, delete, text, case, cast, func, literal, and_, or_, Numeric
+from sqlalchemy.orm import selectinload, aliased
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta, timezone
+from uuid import UUID, uuid4
 
 
 
@@ -14,81 +23,172 @@ class CRUD:
         cls.session_factory = session_factory
 
     @staticmethod
-    async def create_user(user: User):
-        async with get_session(CRUD.session_factory) as session:
+    def unit_of_work():
+        """Session shared by several CRUD calls (pass it as session=); committed on successful exit"""
+        return unit_of_work(CRUD.session_factory)
+
+    @staticmethod
+    @asynccontextmanager
+    async def _session(session: Optional[AsyncSession] = None) -> AsyncIterator[AsyncSession]:
+        """
+        Session for a single CRUD call: the caller's unit of work (not committed here, so its
+        changes are flushed and committed together with the rest of it) or a new session
+        committed when the call succeeds.
+        """
+        if session is not None:
+            yield session
+            return
+        async with get_session(CRUD.session_factory) as own_session:
+            yield own_session
+            await own_session.commit()
+
+    @staticmethod
+    async def create_user(user: User, session: Optional[AsyncSession] = None):
+        async with CRUD._session(session) as session:
             session.add(user)
-            await session.commit()
             return user.id
 
     @staticmethod
-    async def create_or_get_item(item: Item):
-        """Create item if it doesn't exist, or get existing one"""
-        async with get_session(CRUD.session_factory) as session:
-            # Try to find existing item
-            stmt = select(Item).where(Item.name == item.name)
-            result = await session.execute(stmt)
-            existing_item = result.scalar_one_or_none()
-            
-            if existing_item:
-                # Update price and URL if item exists, with rounding
-                existing_item.current_price_usd = round(float(item.current_price_usd), 2)
-                existing_item.current_price_rub = round(float(item.current_price_rub), 2)
-                existing_item.url = item.url
-                await session.commit()
-                return existing_item.id
-            else:
-                # Create new item with rounded prices
-                new_item = Item(
-                    listing_id=item.listing_id, 
-                    name=item.name, 
-                    current_price_usd=round(float(item.current_price_usd), 2), 
-                    current_price_rub=round(float(item.current_price_rub), 2), 
-                    url=item.url
-                )
-                
-                session.add(new_item)
-                await session.commit()
-                return new_item.id
+    async def create_or_get_item(item: Item, session: Optional[AsyncSession] = None):
+        """Create item if it doesn't exist, or update prices and URL of the existing one (by listing_id and name)"""
+        item_ids = await CRUD.create_or_get_items([item], session=session)
+        return item_ids[(int(item.listing_id), item.name)]
 
     @staticmethod
-    async def add_item_to_watchlist(watchlist_item: UserItemWatchlist):
-        """Add item to user's watchlist"""
-        async with get_session(CRUD.session_factory) as session:
-            # Проверяем, есть ли уже такая запись в watchlist
-            existing_item = await session.execute(
-                select(UserItemWatchlist).where(
-                    UserItemWatchlist.user_id == watchlist_item.user_id,
-                    UserItemWatchlist.item_id == watchlist_item.item_id
-                )
+    async def create_or_get_items(items: List[Item], session: Optional[AsyncSession] = None) -> Dict[Tuple[int, str], UUID]:
+        """
+        Create or update many items in a single INSERT ... SELECT FROM unnest(...) statement.
+
+        Conflicts on (listing_id, name) update prices and URL of the existing row, so concurrent
+        calls for the same item end up with one row. Duplicate (listing_id, name) pairs in the
+        input are collapsed (the last one wins). Returns item ids by (listing_id, name).
+        """
+        if not items:
+            return {}
+        
+        # ON CONFLICT DO UPDATE не может изменить одну строку дважды в одном запросе
+        unique_items = {(int(item.listing_id), item.name): item for item in items}
+        stmt = text("""
+            INSERT INTO items (id, listing_id, name, current_price_usd, current_price_rub, url)
+            SELECT *
+            FROM unnest(
+                CAST(:ids AS uuid[]), CAST(:listing_ids AS integer[]), CAST(:names AS varchar[]),
+                CAST(:usd AS real[]), CAST(:rub AS real[]), CAST(:urls AS varchar[])
             )
-            existing_item = existing_item.scalar_one_or_none()
-            
-            if existing_item:
-                # Если товар уже есть в watchlist, возвращаем его ID и флаг, что это существующая запись
-                return existing_item.id, False
-            
-            # Если товара нет, добавляем новый с округлением цен
-            watchlist_item = UserItemWatchlist(
-                user_id=watchlist_item.user_id,
-                item_id=watchlist_item.item_id,
-                buy_target_price=round(float(watchlist_item.buy_target_price), 2),
-                sell_target_price=round(float(watchlist_item.sell_target_price), 2),
-                url=watchlist_item.url
+            ON CONFLICT ON CONSTRAINT unique_items_listing_name DO UPDATE
+            SET current_price_usd = EXCLUDED.current_price_usd,
+                current_price_rub = EXCLUDED.current_price_rub,
+                url = EXCLUDED.url
+            RETURNING id, listing_id, name
+        """)
+        params = {
+            # id генерируется здесь: при создании таблиц через metadata.create_all у колонки нет DEFAULT
+            "ids": [uuid4() for _ in unique_items],
+            "listing_ids": [listing_id for listing_id, _ in unique_items],
+            "names": [name for _, name in unique_items],
+            # Округляем цены до 2 знаков после запятой
+            "usd": [round(float(item.current_price_usd), 2) for item in unique_items.values()],
+            "rub": [round(float(item.current_price_rub), 2) for item in unique_items.values()],
+            "urls": [item.url for item in unique_items.values()],
+        }
+        async with CRUD._session(session) as session:
+            result = await session.execute(stmt, params)
+            rows = result.all()
+            return {(row.listing_id, row.name): row.id for row in rows}
+
+    @staticmethod
+    async def add_item_to_watchlist(watchlist_item: UserItemWatchlist, session: Optional[AsyncSession] = None):
+        """
+        Add item to user's watchlist in a single INSERT ... ON CONFLICT DO NOTHING RETURNING statement.
+
+        A missing user or item is detected by the foreign keys and raised as NotFoundError.
+        Returns (watchlist_id, was_added, user currency); an existing entry comes back with was_added=False.
+        """
+        user_id = watchlist_item.user_id
+        item_id = watchlist_item.item_id
+        stmt = text("""
+            WITH inserted AS (
+                INSERT INTO user_item_watchlist (id, user_id, item_id, buy_target_price, sell_target_price, url)
+                VALUES (:id, :user_id, :item_id, :buy, :sell, :url)
+                ON CONFLICT ON CONSTRAINT unique_user_item_watchlist DO NOTHING
+                RETURNING id
+            ),
+            entry AS (
+                SELECT id, true AS added FROM inserted
+                UNION ALL
+                SELECT w.id, false AS added
+                FROM user_item_watchlist w
+                WHERE w.user_id = :user_id AND w.item_id = :item_id AND NOT EXISTS (SELECT 1 FROM inserted)
             )
-            session.add(watchlist_item)
-            await session.commit()
-            return watchlist_item.id, True
+            SELECT e.id, e.added, u.currency
+            FROM entry e JOIN users u ON u.id = :user_id
+        """)
+        params = {
+            "id": uuid4(),
+            "user_id": user_id,
+            "item_id": item_id,
+            # Округляем цены до 2 знаков после запятой
+            "buy": round(float(watchlist_item.buy_target_price), 2),
+            "sell": round(float(watchlist_item.sell_target_price), 2),
+            "url": watchlist_item.url,
+        }
+        async with CRUD._session(session) as session:
+            try:
+                row = (await session.execute(stmt, params)).one_or_none()
+            except IntegrityError as e:
+                # Нарушение внешнего ключа - нет пользователя или предмета
+                constraint = getattr(getattr(e.orig, '__cause__', None), 'constraint_name', None) or ''
+                if constraint.endswith('user_id_fkey'):
+                    raise NotFoundError(f"User with ID {user_id} not found") from e
+                if constraint.endswith('item_id_fkey'):
+                    raise NotFoundError(f"Item with ID {item_id} not found") from e
+                raise
+            if row is None:
+                # Параллельная вставка той же записи закоммичена после снимка запроса - читаем ее отдельно
+                result = await session.execute(
+                    select(UserItemWatchlist.id, User.currency)
+                    .join(User, User.id == UserItemWatchlist.user_id)
+                    .where(UserItemWatchlist.user_id == user_id, UserItemWatchlist.item_id == item_id)
+                )
+                existing = result.one()
+                return existing.id, False, existing.currency
+            return row.id, row.added, row.currency
 
     @staticmethod
-    async def read_user(user_id: UUID):
-        async with get_session(CRUD.session_factory) as session:
+    async def lookup_user_watchlist_item(user_id: UUID, listing_id: int, name: str,
+                                         session: Optional[AsyncSession] = None) -> Optional[Dict[str, Any]]:
+        """
+        Find the user's currency, an item by listing_id and name and the user's watchlist entry for it, in one query.
+        Returns {"currency", "item_id", "watchlist_id"}: item_id is None if the item does not exist,
+        watchlist_id is None if it is not watched. Raises NotFoundError if the user does not exist.
+        """
+        stmt = (
+            select(User.currency, Item.id.label('item_id'), UserItemWatchlist.id.label('watchlist_id'))
+            .select_from(User)
+            .outerjoin(Item, and_(Item.listing_id == listing_id, Item.name == name))
+            .outerjoin(UserItemWatchlist, and_(
+                UserItemWatchlist.item_id == Item.id,
+                UserItemWatchlist.user_id == User.id
+            ))
+            .where(User.id == user_id)
+        )
+        async with CRUD._session(session) as session:
+            result = await session.execute(stmt)
+            row = result.one_or_none()
+            if row is None:
+                raise NotFoundError(f"User with ID {user_id} not found")
+            return dict(row._mapping)
+
+    @staticmethod
+    async def read_user(user_id: UUID, session: Optional[AsyncSession] = None):
+        async with CRUD._session(session) as session:
             user = await session.get(User, user_id)
             return user
 
     @staticmethod
-    async def read_user_watchlist(user_id: UUID):
+    async def read_user_watchlist(user_id: UUID, session: Optional[AsyncSession] = None):
         """Get user's watchlist with item details"""
-        async with get_session(CRUD.session_factory) as session:
+        async with CRUD._session(session) as session:
             stmt = select(UserItemWatchlist).options(
                 selectinload(UserItemWatchlist.item)
             ).where(UserItemWatchlist.user_id == user_id)
@@ -96,31 +196,406 @@ class CRUD:
             return result.scalars().all()
 
     @staticmethod
-    async def read_item(item_id: UUID):
-        async with get_session(CRUD.session_factory) as session:
+    async def read_item(item_id: UUID, session: Optional[AsyncSession] = None):
+        async with CRUD._session(session) as session:
             item = await session.get(Item, item_id)
             return item
 
     @staticmethod
-    async def update_item_price(name: str, new_price_usd: float, new_price_rub: float):
-        """Update item prices by name"""
-        async with get_session(CRUD.session_factory) as session:
+    async def update_item_price(name: str, new_price_usd: float, new_price_rub: float,
+                                price_rub_fx_calibrated_at=None, price_rub_fx_error: float = None,
+                                listing_id: Optional[int] = None, session: Optional[AsyncSession] = None):
+        """
+        Update item prices by (listing_id, name), with FX metadata if the RUB price was derived.
+        Names are unique only together with listing_id: without listing_id the item with the lowest
+        listing_id is updated (same rule as check_item_exists_by_name).
+        Returns a dict in the update_item_prices_batch format (id, name, changed, old_usd, old_rub,
+        new_usd, new_rub) or None if the item does not exist.
+        """
+        async with CRUD._session(session) as session:
             stmt = select(Item).where(Item.name == name)
+            if listing_id is not None:
+                stmt = stmt.where(Item.listing_id == listing_id)
+            stmt = stmt.order_by(Item.listing_id).limit(1)
             result = await session.execute(stmt)
             item = result.scalar_one_or_none()
             
             if item:
+                old_usd, old_rub = item.current_price_usd, item.current_price_rub
                 # Округляем цены до 2 знаков после запятой
                 item.current_price_usd = round(float(new_price_usd), 2)
                 item.current_price_rub = round(float(new_price_rub), 2)
+                item.price_rub_fx_calibrated_at = price_rub_fx_calibrated_at
+                item.price_rub_fx_error = price_rub_fx_error
+                session.add(ItemPriceHistory(
+                    item_id=item.id, price_usd=item.current_price_usd, price_rub=item.current_price_rub
+                ))
+                return {
+                    'id': item.id,
+                    'name': item.name,
+                    # REAL читается с погрешностью float32 - сравниваем с точностью до копеек
+                    'changed': (round(old_usd, 2), round(old_rub, 2)) != (item.current_price_usd, item.current_price_rub),
+                    'old_usd': old_usd,
+                    'old_rub': old_rub,
+                    'new_usd': item.current_price_usd,
+                    'new_rub': item.current_price_rub,
+                }
+            return None
+
+    @staticmethod
+    async def update_item_prices_batch(updates: List[Dict[str, Any]], session: Optional[AsyncSession] = None) -> List[Dict[str, Any]]:
+        """
+        Update prices of many items in a single UPDATE ... FROM unnest(...) statement.
+
+        Each update is a dict with "id" or "name" (id wins if both are set), "new_price_usd",
+        "new_price_rub" and optional "price_rub_fx_calibrated_at" / "price_rub_fx_error".
+        Rows whose prices did not change are left untouched (IS DISTINCT FROM); every observed
+        price, changed or not, is appended to item_price_history in the same statement.
+        Returns a dict per matched item: id, name, changed, old_usd, old_rub, new_usd, new_rub.
+        """
+        if not updates:
+            return []
+        
+        stmt = text("""
+            WITH batch AS (
+                SELECT *
+                FROM unnest(
+                    CAST(:ids AS uuid[]), CAST(:names AS varchar[]),
+                    CAST(:usd AS real[]), CAST(:rub AS real[]),
+                    CAST(:fx_at AS timestamptz[]), CAST(:fx_error AS real[])
+                ) AS b(id, name, usd, rub, fx_at, fx_error)
+            ),
+            resolved AS (
+                SELECT i.id, i.name, i.current_price_usd AS old_usd, i.current_price_rub AS old_rub,
+                       b.usd, b.rub, b.fx_at, b.fx_error
+                FROM batch b JOIN items i ON i.id = b.id
+                UNION ALL
+                SELECT i.id, i.name, i.current_price_usd AS old_usd, i.current_price_rub AS old_rub,
+                       b.usd, b.rub, b.fx_at, b.fx_error
+                FROM batch b JOIN items i ON b.id IS NULL AND i.name = b.name
+            ),
+            changed AS (
+                UPDATE items AS i
+                SET current_price_usd = r.usd,
+                    current_price_rub = r.rub,
+                    price_rub_fx_calibrated_at = r.fx_at,
+                    price_rub_fx_error = r.fx_error
+                FROM resolved r
+                WHERE i.id = r.id
+                  AND (i.current_price_usd IS DISTINCT FROM r.usd OR i.current_price_rub IS DISTINCT FROM r.rub)
+                RETURNING i.id
+            ),
+            history AS (
+                INSERT INTO item_price_history (item_id, recorded_at, price_usd, price_rub)
+                SELECT DISTINCT ON (r.id) r.id, now(), r.usd, r.rub
+                FROM resolved r
+                ON CONFLICT DO NOTHING
+            )
+            SELECT DISTINCT ON (r.id) r.id, r.name, c.id IS NOT NULL AS changed,
+                   r.old_usd, r.old_rub, r.usd AS new_usd, r.rub AS new_rub
+            FROM resolved r LEFT JOIN changed c ON c.id = r.id
+        """)
+        params = {
+            "ids": [update.get("id") for update in updates],
+            "names": [update.get("name") for update in updates],
+            # Округляем цены до 2 знаков после запятой
+            "usd": [round(float(update["new_price_usd"]), 2) for update in updates],
+            "rub": [round(float(update["new_price_rub"]), 2) for update in updates],
+            "fx_at": [update.get("price_rub_fx_calibrated_at") for update in updates],
+            "fx_error": [update.get("price_rub_fx_error") for update in updates],
+        }
+        async with CRUD._session(session) as session:
+            result = await session.execute(stmt, params)
+            rows = result.all()
+            return [dict(row._mapping) for row in rows]
+
+    @staticmethod
+    @asynccontextmanager
+    async def advisory_lock(key: int) -> AsyncIterator[bool]:
+        """
+        Hold a session-level Postgres advisory lock for the duration of the block.
+        Yields False without waiting if another session holds it.
+        """
+        async with get_session(CRUD.session_factory) as session:
+            # Соединение держится весь блок, но в autocommit: без открытой транзакции ("idle in transaction")
+            await session.connection(execution_options={"isolation_level": "AUTOCOMMIT"})
+            result = await session.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": key})
+            acquired = bool(result.scalar())
+            try:
+                yield acquired
+            finally:
+                if acquired:
+                    await session.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": key})
+
+    @staticmethod
+    def _price_history_partition(day: date) -> str:
+        """Name of the daily item_price_history partition"""
+        return f"item_price_history_p{day:%Y%m%d}"
+
+    @staticmethod
+    async def ensure_price_history_partitions(start: date, days: int = 3) -> List[str]:
+        """
+        Create daily item_price_history partitions (UTC days) from start for the given number of days,
+        plus the default partition for rows outside of them. Returns names of created partitions.
+        
+        Rows of a day that landed in the default partition (maintenance did not run in time) are
+        moved into the new day partition. Each day is created in its own transaction.
+        """
+        async with get_session(CRUD.session_factory) as session:
+            result = await session.execute(text("""
+                SELECT c.relname
+                FROM pg_inherits i
+                JOIN pg_class c ON c.oid = i.inhrelid
+                JOIN pg_class p ON p.oid = i.inhparent
+                WHERE p.relname = 'item_price_history'
+            """))
+            existing = set(result.scalars().all())
+            if 'item_price_history_default' not in existing:
+                await session.execute(text(
+                    "CREATE TABLE IF NOT EXISTS item_price_history_default PARTITION OF item_price_history DEFAULT"
+                ))
                 await session.commit()
-                return True
-            return False
+        
+        created = []
+        for offset in range(days):
+            day = start + timedelta(days=offset)
+            name = CRUD._price_history_partition(day)
+            if name not in existing:
+                await CRUD._create_price_history_partition(name, day)
+                created.append(name)
+        return created
 
     @staticmethod
-    async def remove_from_watchlist(user_id: UUID, item_id: UUID):
-        """Remove item from user's watchlist"""
+    async def _create_price_history_partition(name: str, day: date) -> None:
+        """Create one daily partition, moving the day's rows out of the default partition if there are any"""
+        lower = datetime.combine(day, datetime.min.time(), tzinfo=timezone.utc)
+        upper = lower + timedelta(days=1)
+        # DDL не принимает параметры; имя и границы строятся из даты
+        bounds = f"FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')"
+        async with get_session(CRUD.session_factory) as session:
+            result = await session.execute(text("""
+                SELECT EXISTS (
+                    SELECT 1 FROM item_price_history_default
+                    WHERE recorded_at >= :lower AND recorded_at < :upper
+                )
+            """), {"lower": lower, "upper": upper})
+            if not result.scalar():
+                await session.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF item_price_history FOR VALUES {bounds}"
+                ))
+                await session.commit()
+                return
+            
+            # Postgres не создает партицию, пока ее строки лежат в default: отсоединяем default,
+            # переносим строки дня и подключаем обратно (DDL транзакционный, все или ничего)
+            await session.execute(text(
+                "ALTER TABLE item_price_history DETACH PARTITION item_price_history_default"
+            ))
+            await session.execute(text(
+                f"CREATE TABLE {name} PARTITION OF item_price_history FOR VALUES {bounds}"
+            ))
+            await session.execute(text(f"""
+                WITH moved AS (
+                    DELETE FROM item_price_history_default
+                    WHERE recorded_at >= :lower AND recorded_at < :upper
+                    RETURNING item_id, recorded_at, price_usd, price_rub
+                )
+                INSERT INTO {name} (item_id, recorded_at, price_usd, price_rub)
+                SELECT item_id, recorded_at, price_usd, price_rub FROM moved
+            """), {"lower": lower, "upper": upper})
+            await session.execute(text(
+                "ALTER TABLE item_price_history ATTACH PARTITION item_price_history_default DEFAULT"
+            ))
+            await session.commit()
+
+    @staticmethod
+    async def drop_price_history_partitions(before: date) -> List[str]:
+        """Drop daily item_price_history partitions of days before the given date (raw retention)"""
+        async with get_session(CRUD.session_factory) as session:
+            result = await session.execute(text("""
+                SELECT c.relname
+                FROM pg_inherits i
+                JOIN pg_class c ON c.oid = i.inhrelid
+                JOIN pg_class p ON p.oid = i.inhparent
+                WHERE p.relname = 'item_price_history' AND c.relname LIKE 'item\\_price\\_history\\_p%'
+            """))
+            dropped = []
+            for name in sorted(result.scalars().all()):
+                try:
+                    day = datetime.strptime(name[len('item_price_history_p'):], '%Y%m%d').date()
+                except ValueError:
+                    continue
+                if day < before:
+                    await session.execute(text(f"DROP TABLE IF EXISTS {name}"))
+                    dropped.append(name)
+            await session.commit()
+            return dropped
+
+    @staticmethod
+    def _price_rollup_table(granularity: str):
+        if granularity == '1h':
+            return ItemPriceHistoryHourly
+        if granularity == '1d':
+            return ItemPriceHistoryDaily
+        raise ValueError(f"Unknown price history granularity: {granularity}")
+
+    @staticmethod
+    def _floor_bucket(moment: datetime, granularity: str) -> datetime:
+        """Start of the UTC hour/day containing moment"""
+        moment = moment.astimezone(timezone.utc)
+        if granularity == '1h':
+            return moment.replace(minute=0, second=0, microsecond=0)
+        return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    @staticmethod
+    async def rollup_price_history(granularity: str, since: datetime, until: datetime) -> int:
+        """
+        Recompute OHLC buckets overlapping [since, until): hourly ('1h') from item_price_history,
+        daily ('1d') from the hourly rollup. Buckets are UTC-aligned and upserted, so repeated runs
+        over a partially filled bucket are safe. Returns the number of upserted buckets.
+        """
+        table = CRUD._price_rollup_table(granularity).__tablename__
+        if granularity == '1h':
+            source = """
+                SELECT item_id, date_trunc('hour', recorded_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' AS bucket,
+                       (array_agg(price_usd ORDER BY recorded_at))[1] AS open_usd,
+                       max(price_usd) AS high_usd, min(price_usd) AS low_usd,
+                       (array_agg(price_usd ORDER BY recorded_at DESC))[1] AS close_usd,
+                       (array_agg(price_rub ORDER BY recorded_at))[1] AS open_rub,
+                       max(price_rub) AS high_rub, min(price_rub) AS low_rub,
+                       (array_agg(price_rub ORDER BY recorded_at DESC))[1] AS close_rub,
+                       count(*) AS samples
+                FROM item_price_history
+                WHERE recorded_at >= :since AND recorded_at < :until
+                GROUP BY 1, 2
+            """
+        else:
+            source = """
+                SELECT item_id, date_trunc('day', bucket AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' AS bucket,
+                       (array_agg(open_usd ORDER BY bucket))[1] AS open_usd,
+                       max(high_usd) AS high_usd, min(low_usd) AS low_usd,
+                       (array_agg(close_usd ORDER BY bucket DESC))[1] AS close_usd,
+                       (array_agg(open_rub ORDER BY bucket))[1] AS open_rub,
+                       max(high_rub) AS high_rub, min(low_rub) AS low_rub,
+                       (array_agg(close_rub ORDER BY bucket DESC))[1] AS close_rub,
+                       sum(samples) AS samples
+                FROM item_price_history_1h
+                WHERE bucket >= :since AND bucket < :until
+                GROUP BY 1, 2
+            """
+        stmt = text(f"""
+            INSERT INTO {table} (item_id, bucket, open_usd, high_usd, low_usd, close_usd,
+                                 open_rub, high_rub, low_rub, close_rub, samples)
+            {source}
+            ON CONFLICT (item_id, bucket) DO UPDATE
+            SET open_usd = EXCLUDED.open_usd, high_usd = EXCLUDED.high_usd,
+                low_usd = EXCLUDED.low_usd, close_usd = EXCLUDED.close_usd,
+                open_rub = EXCLUDED.open_rub, high_rub = EXCLUDED.high_rub,
+                low_rub = EXCLUDED.low_rub, close_rub = EXCLUDED.close_rub,
+                samples = EXCLUDED.samples
+        """)
+        params = {"since": CRUD._floor_bucket(since, granularity), "until": until}
+        async with get_session(CRUD.session_factory) as session:
+            result = await session.execute(stmt, params)
+            await session.commit()
+            return result.rowcount
+
+    @staticmethod
+    async def latest_price_rollup(granularity: str, since: datetime) -> Optional[datetime]:
+        """Latest rolled-up bucket after since (None if there is none)"""
+        table = CRUD._price_rollup_table(granularity)
         async with get_session(CRUD.session_factory) as session:
+            result = await session.execute(select(func.max(table.bucket)).where(table.bucket >= since))
+            return result.scalar_one_or_none()
+
+    @staticmethod
+    async def delete_price_rollups(granularity: str, before: datetime) -> int:
+        """Delete rollup buckets older than before (retention)"""
+        table = CRUD._price_rollup_table(granularity)
+        async with get_session(CRUD.session_factory) as session:
+            result = await session.execute(delete(table).where(table.bucket < before))
+            await session.commit()
+            return result.rowcount
+
+    @staticmethod
+    async def get_item_price_history(item_id: UUID, start: datetime, end: datetime,
+                                     granularity: str = 'raw', session: Optional[AsyncSession] = None) -> List[Dict[str, Any]]:
+        """
+        Price history of an item in [start, end) ordered by time.
+
+        granularity is 'raw' (observed prices) or '1h'/'1d' (OHLC rollups). Every point has the
+        same shape: time, open/high/low/close in USD and RUB and samples; raw points have
+        open = high = low = close and samples = 1.
+        """
+        if granularity == 'raw':
+            stmt = (
+                select(ItemPriceHistory.recorded_at, ItemPriceHistory.price_usd, ItemPriceHistory.price_rub)
+                .where(
+                    ItemPriceHistory.item_id == item_id,
+                    ItemPriceHistory.recorded_at >= start,
+                    ItemPriceHistory.recorded_at < end
+                )
+                .order_by(ItemPriceHistory.recorded_at)
+            )
+            async with CRUD._session(session) as session:
+                result = await session.execute(stmt)
+                return [
+                    {
+                        'time': row.recorded_at,
+                        'open_usd': row.price_usd, 'high_usd': row.price_usd,
+                        'low_usd': row.price_usd, 'close_usd': row.price_usd,
+                        'open_rub': row.price_rub, 'high_rub': row.price_rub,
+                        'low_rub': row.price_rub, 'close_rub': row.price_rub,
+                        'samples': 1
+                    }
+                    for row in result.all()
+                ]
+        
+        table = CRUD._price_rollup_table(granularity)
+        stmt = (
+            select(table)
+            .where(table.item_id == item_id, table.bucket >= CRUD._floor_bucket(start, granularity), table.bucket < end)
+            .order_by(table.bucket)
+        )
+        async with CRUD._session(session) as session:
+            result = await session.execute(stmt)
+            return [
+                {
+                    'time': row.bucket,
+                    'open_usd': row.open_usd, 'high_usd': row.high_usd,
+                    'low_usd': row.low_usd, 'close_usd': row.close_usd,
+                    'open_rub': row.open_rub, 'high_rub': row.high_rub,
+                    'low_rub': row.low_rub, 'close_rub': row.close_rub,
+                    'samples': row.samples
+                }
+                for row in result.scalars().all()
+            ]
+
+    @staticmethod
+    async def get_price_history_closes(item_ids: Optional[List[UUID]], since: datetime,
+                                       session: Optional[AsyncSession] = None) -> List[Tuple[UUID, datetime, float, float]]:
+        """
+        Hourly close prices since the given moment as (item_id, bucket, close_usd, close_rub),
+        ordered by item_id and bucket. item_ids=None loads all items.
+        """
+        stmt = (
+            select(
+                ItemPriceHistoryHourly.item_id, ItemPriceHistoryHourly.bucket,
+                ItemPriceHistoryHourly.close_usd, ItemPriceHistoryHourly.close_rub
+            )
+            .where(ItemPriceHistoryHourly.bucket >= since)
+            .order_by(ItemPriceHistoryHourly.item_id, ItemPriceHistoryHourly.bucket)
+        )
+        if item_ids is not None:
+            stmt = stmt.where(ItemPriceHistoryHourly.item_id.in_(item_ids))
+        async with CRUD._session(session) as session:
+            result = await session.execute(stmt)
+            return [tuple(row) for row in result.all()]
+
+    @staticmethod
+    async def remove_from_watchlist(user_id: UUID, item_id: UUID, session: Optional[AsyncSession] = None):
+        """Remove item from user's watchlist"""
+        async with CRUD._session(session) as session:
             stmt = select(UserItemWatchlist).where(
                 UserItemWatchlist.user_id == user_id,
                 UserItemWatchlist.item_id == item_id
@@ -130,12 +605,11 @@ class CRUD:
             
             if watchlist_item:
                 await session.delete(watchlist_item)
-                await session.commit()
                 return True
             return False
 
     @staticmethod
-    async def get_watchlist_price_alerts(user_id: UUID, currency: str = 'usd'):
+    async def get_watchlist_price_alerts(user_id: UUID, currency: str = 'usd', session: Optional[AsyncSession] = None):
         """
         Get watchlist items where current price triggers buy/sell alerts
         Returns dict with 'buy' and 'sell' lists of items
@@ -146,94 +620,432 @@ class CRUD:
         
         Buy alert: current_price <= buy_target_price (good time to buy)
         Sell alert: current_price >= sell_target_price (good time to sell)
+        
+        Only triggered rows are selected: the thresholds are checked in SQL
+        against the price column of the requested currency.
         """
-        async with get_session(CRUD.session_factory) as session:
-            stmt = select(UserItemWatchlist).options(
-                selectinload(UserItemWatchlist.item)
-            ).where(UserItemWatchlist.user_id == user_id)
+        price, is_buy, is_sell, buy_difference, sell_difference = CRUD._price_alert_columns(literal(currency))
+        stmt = (
+            select(
+                UserItemWatchlist.id.label('watchlist_id'), UserItemWatchlist.url,
+                UserItemWatchlist.buy_target_price, UserItemWatchlist.sell_target_price,
+                Item.id.label('item_id'), Item.name.label('item_name'), Item.listing_id,
+                Item.current_price_usd, Item.current_price_rub,
+                is_buy.label('is_buy'), is_sell.label('is_sell'),
+                buy_difference.label('buy_difference'), sell_difference.label('sell_difference')
+            )
+            .join(Item, Item.id == UserItemWatchlist.item_id)
+            .where(UserItemWatchlist.user_id == user_id, or_(is_buy, is_sell))
+        )
+        
+        async with CRUD._session(session) as session:
             result = await session.execute(stmt)
-            watchlist_items = result.scalars().all()
-            
-            buy_alerts = []
-            sell_alerts = []
-            
-            for watchlist_item in watchlist_items:
-                current_price_usd = watchlist_item.item.current_price_usd
-                current_price_rub = watchlist_item.item.current_price_rub
-                buy_target = watchlist_item.buy_target_price
-                sell_target = watchlist_item.sell_target_price
-                
-                # Choose which price to use for comparison based on currency parameter
-                if currency.lower() == 'rub':
-                    current_price_for_comparison = current_price_rub
-                else:  # default to USD
-                    current_price_for_comparison = current_price_usd
-                print(123, current_price_for_comparison, buy_target)
-                # Buy alert: current price is at or below buy target
-                if round(current_price_for_comparison, 2) <= round(buy_target, 2):
-                    buy_alerts.append({
-                        'watchlist_id': watchlist_item.id,
-                        'item_id': watchlist_item.item.id,
-                        'item_name': watchlist_item.item.name,
-                        'listing_id': watchlist_item.item.listing_id,
-                        'current_price_usd': current_price_usd,
-                        'current_price_rub': current_price_rub,
-                        'target_price': buy_target,
-                        'difference': buy_target - current_price_for_comparison,
-                        'comparison_currency': currency.lower(),
-                        'url': watchlist_item.url
-                    })
-                
-                # Sell alert: current price is at or above sell target
-                if round(current_price_for_comparison, 2) >= round(sell_target, 2):
-                    sell_alerts.append({
-                        'watchlist_id': watchlist_item.id,
-                        'item_id': watchlist_item.item.id,
-                        'item_name': watchlist_item.item.name,
-                        'listing_id': watchlist_item.item.listing_id,
-                        'current_price_usd': current_price_usd,
-                        'current_price_rub': current_price_rub,
-                        'target_price': sell_target,
-                        'difference': current_price_for_comparison - sell_target,
-                        'comparison_currency': currency.lower(),
-                        'url': watchlist_item.url
-                    })
-            
-            print(buy_alerts, sell_alerts)
+            rows = result.all()
             return {
-                'buy': buy_alerts,
-                'sell': sell_alerts
+                'buy': [CRUD._price_alert(row, 'buy', currency) for row in rows if row.is_buy],
+                'sell': [CRUD._price_alert(row, 'sell', currency) for row in rows if row.is_sell]
             }
 
     @staticmethod
-    async def get_subscribers():
-        """Get all users who are subscribers"""
+    def _price_alert_columns(currency):
+        """
+        SQL expressions for alert evaluation against the price in the given currency.
+
+        currency is an SQL expression ('usd'/'rub', case-insensitive, anything else means USD).
+        Returns (price, is_buy, is_sell, buy_difference, sell_difference); prices are compared
+        rounded to 2 decimal places.
+        """
+        price = case((func.lower(currency) == 'rub', Item.current_price_rub), else_=Item.current_price_usd)
+        rounded_price = func.round(cast(price, Numeric), 2)
+        is_buy = rounded_price <= func.round(cast(UserItemWatchlist.buy_target_price, Numeric), 2)
+        is_sell = rounded_price >= func.round(cast(UserItemWatchlist.sell_target_price, Numeric), 2)
+        buy_difference = UserItemWatchlist.buy_target_price - price
+        sell_difference = price - UserItemWatchlist.sell_target_price
+        return price, is_buy, is_sell, buy_difference, sell_difference
+
+    @staticmethod
+    def _price_alert(row, side: str, currency: str) -> Dict[str, Any]:
+        """Build an alert dict from a row selected with _price_alert_columns"""
+        return {
+            'watchlist_id': row.watchlist_id,
+            'item_id': row.item_id,
+            'item_name': row.item_name,
+            'listing_id': row.listing_id,
+            'current_price_usd': row.current_price_usd,
+            'current_price_rub': row.current_price_rub,
+            'target_price': row.buy_target_price if side == 'buy' else row.sell_target_price,
+            'difference': row.buy_difference if side == 'buy' else row.sell_difference,
+            'comparison_currency': currency.lower(),
+            'url': row.url
+        }
+
+    @staticmethod
+    async def rearm_price_alerts(hysteresis: float = 0.0, item_ids: Optional[List[UUID]] = None,
+                                 session: Optional[AsyncSession] = None) -> int:
+        """
+        Re-arm notified alerts whose price has left the trigger zone by more than hysteresis
+        (relative): buy when price > buy_target * (1 + h), sell when price < sell_target * (1 - h).
+        If item_ids is given, only alerts on these items are checked.
+        Returns the number of re-armed alerts.
+        """
+        price = CRUD._price_alert_columns(User.currency)[0]
+        stmt = (
+            update(WatchlistAlertState)
+            .where(
+                WatchlistAlertState.watchlist_id == UserItemWatchlist.id,
+                UserItemWatchlist.item_id == Item.id,
+                UserItemWatchlist.user_id == User.id,
+                WatchlistAlertState.armed == False,
+                or_(
+                    and_(WatchlistAlertState.side == 'buy',
+                         price > UserItemWatchlist.buy_target_price * (1 + hysteresis)),
+                    and_(WatchlistAlertState.side == 'sell',
+                         price < UserItemWatchlist.sell_target_price * (1 - hysteresis))
+                )
+            )
+            .values(armed=True)
+            .execution_options(synchronize_session=False)
+        )
+        if item_ids is not None:
+            stmt = stmt.where(UserItemWatchlist.item_id.in_(item_ids))
+        async with CRUD._session(session) as session:
+            result = await session.execute(stmt)
+            return result.rowcount
+
+    @staticmethod
+    async def ack_price_alerts(acks: List[Dict[str, Any]], session: Optional[AsyncSession] = None) -> int:
+        """
+        Disarm alerts after a successful notification and remember the notified price.
+
+        Each ack is a dict with "watchlist_id", "side" ('buy'/'sell') and "price".
+        Acks for watchlist entries removed in the meantime are skipped.
+        Returns the number of stored states.
+        """
+        # ON CONFLICT DO UPDATE не может обновить одну строку дважды за запрос
+        latest = {(ack['watchlist_id'], ack['side']): ack['price'] for ack in acks}
+        if not latest:
+            return 0
+        
+        stmt = text("""
+            INSERT INTO watchlist_alert_state (watchlist_id, side, armed, last_notified_price, last_notified_at)
+            SELECT a.watchlist_id, a.side, FALSE, a.price, now()
+            FROM unnest(CAST(:ids AS uuid[]), CAST(:sides AS varchar[]), CAST(:prices AS real[]))
+                AS a(watchlist_id, side, price)
+            JOIN user_item_watchlist w ON w.id = a.watchlist_id
+            ON CONFLICT (watchlist_id, side) DO UPDATE
+            SET armed = FALSE,
+                last_notified_price = EXCLUDED.last_notified_price,
+                last_notified_at = EXCLUDED.last_notified_at
+        """)
+        params = {
+            "ids": [watchlist_id for watchlist_id, _ in latest],
+            "sides": [side for _, side in latest],
+            "prices": list(latest.values()),
+        }
+        async with CRUD._session(session) as session:
+            result = await session.execute(stmt, params)
+            return result.rowcount
+
+    @staticmethod
+    async def stream_subscriber_price_alerts(hysteresis: float = 0.0,
+                                             item_ids: Optional[List[UUID]] = None,
+                                             watchlist_ids: Optional[List[UUID]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Evaluate buy/sell alerts of all subscribers in a single query, each in their own currency.
+
+        Only armed alerts are returned (edge-triggered, see watchlist_alert_state): a disarmed
+        alert fires again only if the price has moved further in the alert direction by more than
+        hysteresis relative to the last notified price. Read-only: alerts are re-armed by the price
+        update path (rearm_price_alerts).
+
+        If item_ids is given, only watchers of these items are evaluated (price change events).
+        If watchlist_ids is given, only these watchlist entries are evaluated (e.g. candidates
+        found by the in-memory threshold index).
+
+        Rows are streamed from a server-side cursor ordered by telegram_id and yielded
+        one dict per user with triggered alerts:
+        {'user_id', 'telegram_id', 'currency', 'buy': [...], 'sell': [...]}
+        """
+        price, is_buy, is_sell, buy_difference, sell_difference = CRUD._price_alert_columns(User.currency)
+        buy_state = aliased(WatchlistAlertState)
+        sell_state = aliased(WatchlistAlertState)
+        buy_due = and_(is_buy, or_(
+            buy_state.armed.is_(None),
+            buy_state.armed == True,
+            price < buy_state.last_notified_price * (1 - hysteresis)
+        ))
+        sell_due = and_(is_sell, or_(
+            sell_state.armed.is_(None),
+            sell_state.armed == True,
+            price > sell_state.last_notified_price * (1 + hysteresis)
+        ))
+        stmt = (
+            select(
+                User.id.label('user_id'), User.telegram_id, User.currency,
+                UserItemWatchlist.id.label('watchlist_id'), UserItemWatchlist.url,
+                UserItemWatchlist.buy_target_price, UserItemWatchlist.sell_target_price,
+                Item.id.label('item_id'), Item.name.label('item_name'), Item.listing_id,
+                Item.current_price_usd, Item.current_price_rub,
+                buy_due.label('is_buy'), sell_due.label('is_sell'),
+                buy_difference.label('buy_difference'), sell_difference.label('sell_difference')
+            )
+            .join(UserItemWatchlist, UserItemWatchlist.user_id == User.id)
+            .join(Item, Item.id == UserItemWatchlist.item_id)
+            .outerjoin(buy_state, and_(buy_state.watchlist_id == UserItemWatchlist.id, buy_state.side == 'buy'))
+            .outerjoin(sell_state, and_(sell_state.watchlist_id == UserItemWatchlist.id, sell_state.side == 'sell'))
+            .where(User.subscriber == True, or_(buy_due, sell_due))
+            .order_by(User.telegram_id, User.id)
+        )
+        if item_ids is not None:
+            stmt = stmt.where(UserItemWatchlist.item_id.in_(item_ids))
+        if watchlist_ids is not None:
+            stmt = stmt.where(UserItemWatchlist.id.in_(watchlist_ids))
+        
+        async with get_session(CRUD.session_factory) as session:
+            result = await session.stream(stmt)
+            group = None
+            async for row in result:
+                if group is None or group['user_id'] != row.user_id:
+                    if group is not None:
+                        yield group
+                    group = {
+                        'user_id': row.user_id,
+                        'telegram_id': row.telegram_id,
+                        'currency': row.currency,
+                        'buy': [],
+                        'sell': []
+                    }
+                if row.is_buy:
+                    group['buy'].append(CRUD._price_alert(row, 'buy', row.currency))
+                if row.is_sell:
+                    group['sell'].append(CRUD._price_alert(row, 'sell', row.currency))
+            if group is not None:
+                yield group
+
+    @staticmethod
+    async def stream_watchlist_thresholds() -> AsyncIterator[Tuple[UUID, UUID, UUID, str, float, float]]:
+        """
+        Stream buy/sell targets of all watchlist entries with the owner's currency:
+        (watchlist_id, user_id, item_id, currency, buy_target_price, sell_target_price)
+        """
+        stmt = (
+            select(
+                UserItemWatchlist.id, UserItemWatchlist.user_id, UserItemWatchlist.item_id, User.currency,
+                UserItemWatchlist.buy_target_price, UserItemWatchlist.sell_target_price
+            )
+            .join(User, User.id == UserItemWatchlist.user_id)
+        )
+        async with get_session(CRUD.session_factory) as session:
+            result = await session.stream(stmt)
+            async for row in result:
+                yield tuple(row)
+
+    @staticmethod
+    async def get_price_history_points(item_ids: List[UUID], since: datetime,
+                                       session: Optional[AsyncSession] = None) -> List[Tuple[UUID, datetime, float, float]]:
+        """
+        Raw observed prices since the given moment as (item_id, recorded_at, price_usd, price_rub),
+        ordered by item_id and recorded_at.
+        """
+        stmt = (
+            select(
+                ItemPriceHistory.item_id, ItemPriceHistory.recorded_at,
+                ItemPriceHistory.price_usd, ItemPriceHistory.price_rub
+            )
+            .where(ItemPriceHistory.item_id.in_(item_ids), ItemPriceHistory.recorded_at >= since)
+            .order_by(ItemPriceHistory.item_id, ItemPriceHistory.recorded_at)
+        )
+        async with CRUD._session(session) as session:
+            result = await session.execute(stmt)
+            return [tuple(row) for row in result.all()]
+
+    @staticmethod
+    def _alert_rule(row) -> Dict[str, Any]:
+        """Build an alert rule dict from a row of _alert_rules_select"""
+        return {
+            'id': row.id,
+            'watchlist_id': row.watchlist_id,
+            'user_id': row.user_id,
+            'item_id': row.item_id,
+            'item_name': row.item_name,
+            'currency': row.currency,
+            'rule_type': row.rule_type,
+            'threshold': row.threshold,
+            'window_minutes': row.window_minutes,
+            'armed': row.armed,
+            'last_triggered_value': row.last_triggered_value,
+            'last_triggered_at': row.last_triggered_at
+        }
+
+    @staticmethod
+    def _alert_rules_select():
+        """Select of alert rules joined with their watchlist entry, owner and item"""
+        return (
+            select(
+                WatchlistAlertRule.id, WatchlistAlertRule.watchlist_id,
+                UserItemWatchlist.user_id, UserItemWatchlist.item_id, Item.name.label('item_name'), User.currency,
+                WatchlistAlertRule.rule_type, WatchlistAlertRule.threshold, WatchlistAlertRule.window_minutes,
+                WatchlistAlertRule.armed, WatchlistAlertRule.last_triggered_value, WatchlistAlertRule.last_triggered_at
+            )
+            .join(UserItemWatchlist, UserItemWatchlist.id == WatchlistAlertRule.watchlist_id)
+            .join(User, User.id == UserItemWatchlist.user_id)
+            .join(Item, Item.id == UserItemWatchlist.item_id)
+        )
+
+    @staticmethod
+    async def create_alert_rule(user_id: UUID, watchlist_id: UUID, rule_type: str,
+                                threshold: float, window_minutes: int, session: Optional[AsyncSession] = None) -> Optional[Dict[str, Any]]:
+        """
+        Create an alert rule for a watchlist entry of the user.
+        Returns the rule dict (see _alert_rule) or None if the entry does not belong to the user.
+        """
+        async with CRUD._session(session) as session:
+            stmt = select(UserItemWatchlist.id).where(
+                UserItemWatchlist.id == watchlist_id,
+                UserItemWatchlist.user_id == user_id
+            )
+            result = await session.execute(stmt)
+            if result.scalar_one_or_none() is None:
+                return None
+            
+            rule = WatchlistAlertRule(
+                watchlist_id=watchlist_id, rule_type=rule_type,
+                threshold=float(threshold), window_minutes=int(window_minutes), armed=True
+            )
+            session.add(rule)
+            await session.flush()
+            result = await session.execute(CRUD._alert_rules_select().where(WatchlistAlertRule.id == rule.id))
+            created = CRUD._alert_rule(result.one())
+            return created
+
+    @staticmethod
+    async def read_user_alert_rules(user_id: UUID, session: Optional[AsyncSession] = None) -> List[Dict[str, Any]]:
+        """Get all alert rules of the user's watchlist entries"""
+        stmt = (
+            CRUD._alert_rules_select()
+            .where(UserItemWatchlist.user_id == user_id)
+            .order_by(Item.name, WatchlistAlertRule.created_at)
+        )
+        async with CRUD._session(session) as session:
+            result = await session.execute(stmt)
+            return [CRUD._alert_rule(row) for row in result.all()]
+
+    @staticmethod
+    async def delete_alert_rule(user_id: UUID, rule_id: UUID, session: Optional[AsyncSession] = None) -> bool:
+        """Delete an alert rule of the user"""
+        stmt = (
+            delete(WatchlistAlertRule)
+            .where(
+                WatchlistAlertRule.id == rule_id,
+                WatchlistAlertRule.watchlist_id == UserItemWatchlist.id,
+                UserItemWatchlist.user_id == user_id
+            )
+            .execution_options(synchronize_session=False)
+        )
+        async with CRUD._session(session) as session:
+            result = await session.execute(stmt)
+            return result.rowcount > 0
+
+    @staticmethod
+    async def stream_alert_rules() -> AsyncIterator[Dict[str, Any]]:
+        """Stream all alert rules with the owner's currency (see _alert_rule)"""
         async with get_session(CRUD.session_factory) as session:
+            result = await session.stream(CRUD._alert_rules_select())
+            async for row in result:
+                yield CRUD._alert_rule(row)
+
+    @staticmethod
+    async def set_alert_rules_armed(rule_ids: List[UUID], armed: bool, session: Optional[AsyncSession] = None) -> int:
+        """Set the armed flag of alert rules, returns the number of updated rules"""
+        if not rule_ids:
+            return 0
+        stmt = (
+            update(WatchlistAlertRule)
+            .where(WatchlistAlertRule.id.in_(rule_ids))
+            .values(armed=armed)
+            .execution_options(synchronize_session=False)
+        )
+        async with CRUD._session(session) as session:
+            result = await session.execute(stmt)
+            return result.rowcount
+
+    @staticmethod
+    async def ack_alert_rules(acks: List[Dict[str, Any]], session: Optional[AsyncSession] = None) -> int:
+        """
+        Disarm alert rules after a successful notification and remember the triggering value.
+
+        Each ack is a dict with "rule_id" and "value". Returns the number of updated rules.
+        """
+        if not acks:
+            return 0
+        stmt = text("""
+            UPDATE watchlist_alert_rules AS r
+            SET armed = FALSE, last_triggered_value = a.value, last_triggered_at = now()
+            FROM unnest(CAST(:ids AS uuid[]), CAST(:values AS real[])) AS a(id, value)
+            WHERE r.id = a.id
+        """)
+        params = {
+            "ids": [ack['rule_id'] for ack in acks],
+            "values": [ack['value'] for ack in acks],
+        }
+        async with CRUD._session(session) as session:
+            result = await session.execute(stmt, params)
+            return result.rowcount
+
+    @staticmethod
+    async def get_alert_rule_targets(watchlist_ids: List[UUID], session: Optional[AsyncSession] = None) -> Dict[UUID, Dict[str, Any]]:
+        """
+        Recipients and item details of watchlist entries with triggered alert rules, subscribers only:
+        watchlist_id -> {'user_id', 'telegram_id', 'currency', 'item_id', 'item_name', 'listing_id',
+        'current_price_usd', 'current_price_rub', 'url'}
+        """
+        if not watchlist_ids:
+            return {}
+        stmt = (
+            select(
+                UserItemWatchlist.id.label('watchlist_id'), UserItemWatchlist.url,
+                User.id.label('user_id'), User.telegram_id, User.currency,
+                Item.id.label('item_id'), Item.name.label('item_name'), Item.listing_id,
+                Item.current_price_usd, Item.current_price_rub
+            )
+            .join(User, User.id == UserItemWatchlist.user_id)
+            .join(Item, Item.id == UserItemWatchlist.item_id)
+            .where(UserItemWatchlist.id.in_(watchlist_ids), User.subscriber == True)
+        )
+        async with CRUD._session(session) as session:
+            result = await session.execute(stmt)
+            return {row.watchlist_id: dict(row._mapping) for row in result.all()}
+
+    @staticmethod
+    async def get_subscribers(session: Optional[AsyncSession] = None):
+        """Get all users who are subscribers"""
+        async with CRUD._session(session) as session:
             stmt = select(User).where(User.subscriber == True)
             result = await session.execute(stmt)
             return result.scalars().all()
 
     @staticmethod
-    async def get_all_items():
+    async def get_all_items(session: Optional[AsyncSession] = None):
         """Get all items"""
-        async with get_session(CRUD.session_factory) as session:
+        async with CRUD._session(session) as session:
             stmt = select(Item)
             result = await session.execute(stmt)
             return result.scalars().all()
 
 
     @staticmethod
-    async def check_item_exists_by_name(name: str):
+    async def check_item_exists_by_name(name: str, session: Optional[AsyncSession] = None):
         """Check if item exists by name, returns item if found or None"""
-        async with get_session(CRUD.session_factory) as session:
-            stmt = select(Item).where(Item.name == name)
+        async with CRUD._session(session) as session:
+            # Имя уникально только вместе с listing_id
+            stmt = select(Item).where(Item.name == name).order_by(Item.listing_id).limit(1)
             result = await session.execute(stmt)
             return result.scalar_one_or_none()
 
     @staticmethod
-    async def check_item_in_user_watchlist(user_id: UUID, item_id: UUID):
+    async def check_item_in_user_watchlist(user_id: UUID, item_id: UUID, session: Optional[AsyncSession] = None):
         """Check if item exists in user's watchlist, returns watchlist item if found or None"""
-        async with get_session(CRUD.session_factory) as session:
+        async with CRUD._session(session) as session:
             stmt = select(UserItemWatchlist).where(
                 UserItemWatchlist.user_id == user_id,
                 UserItemWatchlist.item_id == item_id
@@ -242,9 +1054,9 @@ class CRUD:
             return result.scalar_one_or_none()
 
     @staticmethod
-    async def change_user_subscription(user_id: UUID, subscriber: bool):
+    async def change_user_subscription(user_id: UUID, subscriber: bool, session: Optional[AsyncSession] = None):
         """Change user's subscription status"""
-        async with get_session(CRUD.session_factory) as session:
+        async with CRUD._session(session) as session:
             stmt = select(User).where(User.id == user_id)
             result = await session.execute(stmt)
             user = result.scalar_one_or_none()
@@ -253,13 +1065,12 @@ class CRUD:
                 raise ValueError(f"User with ID {user_id} not found")
             
             user.subscriber = subscriber
-            await session.commit()
             return user.id
 
     @staticmethod
-    async def change_user_currency(user_id: UUID, currency: str):
+    async def change_user_currency(user_id: UUID, currency: str, session: Optional[AsyncSession] = None):
         """Change user's currency"""
-        async with get_session(CRUD.session_factory) as session:
+        async with CRUD._session(session) as session:
             stmt = select(User).where(User.id == user_id)
             result = await session.execute(stmt)
             user = result.scalar_one_or_none()
@@ -268,13 +1079,13 @@ class CRUD:
                 raise ValueError(f"User with ID {user_id} not found")
             
             user.currency = currency
-            await session.commit()
             return user.id
 
     @staticmethod
-    async def update_watchlist_item_prices(user_id: UUID, watchlist_id: UUID, buy_target_price: float, sell_target_price: float):
+    async def update_watchlist_item_prices(user_id: UUID, watchlist_id: UUID, buy_target_price: float, sell_target_price: float,
+                                           session: Optional[AsyncSession] = None):
         """Update buy and sell target prices for a watchlist item"""
-        async with get_session(CRUD.session_factory) as session:
+        async with CRUD._session(session) as session:
             stmt = select(UserItemWatchlist).where(
                 UserItemWatchlist.id == watchlist_id,
                 UserItemWatchlist.user_id == user_id
@@ -288,7 +1099,10 @@ class CRUD:
             # Округляем цены до 2 знаков после запятой
             watchlist_item.buy_target_price = round(float(buy_target_price), 2)
             watchlist_item.sell_target_price = round(float(sell_target_price), 2)
-            await session.commit()
+            # Новые пороги - алерты снова взведены
+            await session.execute(
+                delete(WatchlistAlertState).where(WatchlistAlertState.watchlist_id == watchlist_id)
+            )
             return True
 
 async def main():
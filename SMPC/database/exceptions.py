@@ -0,0 +1,2 @@
+class NotFoundError(LookupError):
+    """A record referenced by a CRUD operation (user, item) does not exist."""
@@ -35,13 +35,17 @@ class Item(Base):
     current_price_usd = Column(REAL, nullable=False)
     current_price_rub = Column(REAL, nullable=False)
     url = Column(String(500), nullable=False)  # URL to the item
+    # RUB price derived from USD via the FX table: calibration time and relative error bound (NULL if fetched directly)
+    price_rub_fx_calibrated_at = Column(DateTime(timezone=True), nullable=True)
+    price_rub_fx_error = Column(REAL, nullable=True)
     
     # Relationships
     user_watchlists = relationship("UserItemWatchlist", back_populates="item", cascade="all, delete-orphan")
     
     # Table constraints
     __table_args__ = (
-        Index('idx_items_listing_id', 'listing_id'),
+        # One row per Steam item; the unique index also serves lookups by listing_id
+        UniqueConstraint('listing_id', 'name', name='unique_items_listing_name'),
         Index('idx_items_name', 'name'),
         Index('idx_items_current_price_usd', 'current_price_usd'),
         Index('idx_items_current_price_rub', 'current_price_rub'),
@@ -72,7 +76,9 @@ class UserItemWatchlist(Base):
         CheckConstraint('sell_target_price >= 0', name='sell_target_price_check'),
         CheckConstraint('sell_target_price > buy_target_price', name='price_check'),
         UniqueConstraint('user_id', 'item_id', name='unique_user_item_watchlist'),
-        Index('idx_watchlist_user_id', 'user_id'),
+        # Covering index for per-user alert evaluation: thresholds and item_id without touching the heap
+        Index('idx_watchlist_user_targets', 'user_id', 'buy_target_price', 'sell_target_price',
+              postgresql_include=['item_id']),
         Index('idx_watchlist_item_id', 'item_id'),
         Index('idx_watchlist_prices', 'buy_target_price', 'sell_target_price'),
     )
@@ -80,3 +86,111 @@ class UserItemWatchlist(Base):
     def __repr__(self):
         return f"<UserItemWatchlist(id={self.id}, user_id={self.user_id}, item_id={self.item_id}, buy_target_price={self.buy_target_price}, sell_target_price={self.sell_target_price})>"
 
+
+class WatchlistAlertState(Base):
+    __tablename__ = 'watchlist_alert_state'
+    
+    watchlist_id = Column(UUID(as_uuid=True), ForeignKey('user_item_watchlist.id', ondelete='CASCADE'), primary_key=True)
+    side = Column(String(4), primary_key=True)  # 'buy' or 'sell'
+    armed = Column(Boolean, nullable=False, default=True)  # False after notification until the price leaves the trigger zone
+    last_notified_price = Column(REAL, nullable=True)
+    last_notified_at = Column(DateTime(timezone=True), nullable=True)
+    
+    # Table constraints
+    __table_args__ = (
+        CheckConstraint("side IN ('buy', 'sell')", name='alert_side_check'),
+    )
+    
+    def __repr__(self):
+        return f"<WatchlistAlertState(watchlist_id={self.watchlist_id}, side='{self.side}', armed={self.armed}, last_notified_price={self.last_notified_price}, last_notified_at={self.last_notified_at})>"
+
+
+class WatchlistAlertRule(Base):
+    __tablename__ = 'watchlist_alert_rules'
+    
+    # Relative alert rules evaluated from running window statistics in the API process (see SMPC.api.alert_rules)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4) # UUID
+    watchlist_id = Column(UUID(as_uuid=True), ForeignKey('user_item_watchlist.id', ondelete='CASCADE'), nullable=False)
+    rule_type = Column(String(16), nullable=False)  # 'pct_move' or 'zscore'
+    threshold = Column(REAL, nullable=False)  # percent for pct_move, sigmas for zscore
+    window_minutes = Column(Integer, nullable=False)
+    armed = Column(Boolean, nullable=False, default=True)  # False after notification until the condition clears
+    last_triggered_value = Column(REAL, nullable=True)
+    last_triggered_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    
+    # Table constraints
+    __table_args__ = (
+        CheckConstraint("rule_type IN ('pct_move', 'zscore')", name='alert_rule_type_check'),
+        CheckConstraint('threshold > 0', name='alert_rule_threshold_check'),
+        CheckConstraint('window_minutes > 0', name='alert_rule_window_check'),
+        Index('idx_alert_rules_watchlist_id', 'watchlist_id'),
+    )
+    
+    def __repr__(self):
+        return f"<WatchlistAlertRule(id={self.id}, watchlist_id={self.watchlist_id}, rule_type='{self.rule_type}', threshold={self.threshold}, window_minutes={self.window_minutes}, armed={self.armed})>"
+
+
+class ItemPriceHistory(Base):
+    __tablename__ = 'item_price_history'
+    
+    # Append-only log of observed prices, range-partitioned by recorded_at (daily partitions are created by
+    # CRUD.ensure_price_history_partitions and dropped by the retention policy)
+    item_id = Column(UUID(as_uuid=True), primary_key=True)
+    recorded_at = Column(DateTime(timezone=True), primary_key=True, server_default=func.now())
+    price_usd = Column(REAL, nullable=False)
+    price_rub = Column(REAL, nullable=False)
+    
+    # Table constraints
+    __table_args__ = (
+        Index('idx_price_history_recorded_at', 'recorded_at', postgresql_using='brin'),
+        {'postgresql_partition_by': 'RANGE (recorded_at)'},
+    )
+    
+    def __repr__(self):
+        return f"<ItemPriceHistory(item_id={self.item_id}, recorded_at={self.recorded_at}, price_usd={self.price_usd}, price_rub={self.price_rub})>"
+
+
+class ItemPriceHistoryHourly(Base):
+    __tablename__ = 'item_price_history_1h'
+    
+    # OHLC rollup of item_price_history per hour
+    item_id = Column(UUID(as_uuid=True), primary_key=True)
+    bucket = Column(DateTime(timezone=True), primary_key=True)
+    open_usd = Column(REAL, nullable=False)
+    high_usd = Column(REAL, nullable=False)
+    low_usd = Column(REAL, nullable=False)
+    close_usd = Column(REAL, nullable=False)
+    open_rub = Column(REAL, nullable=False)
+    high_rub = Column(REAL, nullable=False)
+    low_rub = Column(REAL, nullable=False)
+    close_rub = Column(REAL, nullable=False)
+    samples = Column(Integer, nullable=False)
+    
+    # Table constraints
+    __table_args__ = (
+        Index('idx_price_history_1h_bucket', 'bucket', postgresql_using='brin'),
+    )
+    
+    def __repr__(self):
+        return f"<ItemPriceHistoryHourly(item_id={self.item_id}, bucket={self.bucket}, close_usd={self.close_usd}, close_rub={self.close_rub})>"
+
+
+class ItemPriceHistoryDaily(Base):
+    __tablename__ = 'item_price_history_1d'
+    
+    # OHLC rollup of item_price_history_1h per day
+    item_id = Column(UUID(as_uuid=True), primary_key=True)
+    bucket = Column(DateTime(timezone=True), primary_key=True)
+    open_usd = Column(REAL, nullable=False)
+    high_usd = Column(REAL, nullable=False)
+    low_usd = Column(REAL, nullable=False)
+    close_usd = Column(REAL, nullable=False)
+    open_rub = Column(REAL, nullable=False)
+    high_rub = Column(REAL, nullable=False)
+    low_rub = Column(REAL, nullable=False)
+    close_rub = Column(REAL, nullable=False)
+    samples = Column(Integer, nullable=False)
+    
+    def __repr__(self):
+        return f"<ItemPriceHistoryDaily(item_id={self.item_id}, bucket={self.bucket}, close_usd={self.close_usd}, close_rub={self.close_rub})>"
@@ -31,4 +31,19 @@ def create_session_factory() -> sessionmaker:
 @asynccontextmanager
 async def get_session(session_factory: sessionmaker) -> AsyncSession:
     async with session_factory() as session:
-        yield session
\ No newline at end of file
+        yield session
+
+@asynccontextmanager
+async def unit_of_work(session_factory: sessionmaker) -> AsyncSession:
+    """
+    Одна сессия и одна транзакция на несколько операций CRUD (передается им в session=):
+    изменения ORM копятся и сбрасываются в БД одним flush перед запросом или при commit,
+    commit - при успешном выходе, rollback - при ошибке
+    """
+    async with session_factory() as session:
+        try:
+            yield session
+            await session.commit()
+        except BaseException:
+            await session.rollback()
+            raise
\ No newline at end of file
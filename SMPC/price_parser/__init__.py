@@ -1,3 +1,15 @@
 from .price_parser import PriceParser, Currency
+from .nameid_cache import NameIdCache
+from .rate_limiter import TokenBucket, AdaptiveRateLimiter
+from .retry import RetryPolicy, RetryBudget
+from .circuit_breaker import CircuitBreaker
+from .exceptions import (
+    ParseError, TransientParseError, RetryBudgetExhausted,
+    PermanentParseError, ItemNotFoundError, NoPriceError, CircuitOpenError
+)
 
-__all__ = ['PriceParser', 'Currency']
\ No newline at end of file
+__all__ = [
+    'PriceParser', 'Currency', 'NameIdCache', 'TokenBucket', 'AdaptiveRateLimiter',
+    'RetryPolicy', 'RetryBudget', 'CircuitBreaker', 'ParseError', 'TransientParseError', 'RetryBudgetExhausted',
+    'PermanentParseError', 'ItemNotFoundError', 'NoPriceError', 'CircuitOpenError'
+]
\ No newline at end of file
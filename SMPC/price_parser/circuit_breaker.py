@@ -0,0 +1,123 @@
+import time
+import logging
+from typing import Any, Dict, Optional
+
+from .exceptions import CircuitOpenError
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker для одного endpoint Steam.
+
+    closed - запросы идут как обычно, подряд идущие сбои считаются;
+    open - после failure_threshold сбоев запросы сразу отклоняются
+    с CircuitOpenError на recovery_timeout секунд;
+    half_open - после паузы пропускается один пробный запрос: успех
+    закрывает цепь, сбой снова открывает ее. Пробный запрос без результата
+    дольше probe_timeout считается потерянным, и пропускается следующий.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 60.0,
+                 probe_timeout: Optional[float] = None):
+        """
+        Args:
+            name: Имя endpoint (для логов и метрик)
+            failure_threshold: Количество сбоев подряд для размыкания цепи
+            recovery_timeout: Пауза в секундах перед пробным запросом
+            probe_timeout: Сколько секунд ждать результат пробного запроса (по умолчанию recovery_timeout)
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.probe_timeout = probe_timeout if probe_timeout is not None else recovery_timeout
+        self.logger = logging.getLogger(__name__)
+
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at: Optional[float] = None  # time.time(), чтобы состояние переживало рестарт
+        self._probe_in_flight = False
+        self._probe_started_at = 0.0
+
+    def _probe_pending(self) -> bool:
+        """Идет ли пробный запрос (потерянный после probe_timeout не считается)."""
+        return self._probe_in_flight and time.monotonic() - self._probe_started_at < self.probe_timeout
+
+    def retry_in(self) -> float:
+        """Сколько секунд цепь еще будет разомкнута."""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self.opened_at + self.recovery_timeout - time.time())
+
+    def is_open(self) -> bool:
+        """Отклоняет ли breaker запросы прямо сейчас."""
+        if self.state == self.OPEN:
+            return self.retry_in() > 0
+        return self.state == self.HALF_OPEN and self._probe_pending()
+
+    def before_call(self):
+        """Проверяет, можно ли выполнить запрос, иначе бросает CircuitOpenError."""
+        if self.state == self.OPEN:
+            retry_in = self.retry_in()
+            if retry_in > 0:
+                raise CircuitOpenError(f"Цепь '{self.name}' разомкнута, повтор через {retry_in:.0f}с",
+                                       self.name, retry_in)
+            self.state = self.HALF_OPEN
+            self.logger.info(f"Цепь '{self.name}' полуоткрыта, пробный запрос")
+        if self.state == self.HALF_OPEN:
+            if self._probe_pending():
+                raise CircuitOpenError(f"Цепь '{self.name}' ждет результат пробного запроса",
+                                       self.name, self.recovery_timeout)
+            if self._probe_in_flight:
+                self.logger.warning(f"Пробный запрос цепи '{self.name}' без результата дольше "
+                                    f"{self.probe_timeout:.0f}с, пропускается новый")
+            self._probe_in_flight = True
+            self._probe_started_at = time.monotonic()
+
+    def on_success(self):
+        """Учесть успешный ответ."""
+        if self.state != self.CLOSED:
+            self.logger.info(f"Цепь '{self.name}' замкнута")
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+
+    def on_failure(self):
+        """Учесть сбой (429/5xx, таймаут, ошибка соединения)."""
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.logger.warning(f"Цепь '{self.name}' разомкнута после {self.failures} сбоев "
+                                    f"на {self.recovery_timeout:.0f}с")
+            self.state = self.OPEN
+            self.opened_at = time.time()
+
+    def release(self):
+        """Отпустить пробный запрос, завершившийся без ответа сервера (например, отмененный)."""
+        self._probe_in_flight = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Состояние breaker для сохранения и метрик."""
+        return {
+            'state': self.state,
+            'failures': self.failures,
+            'opened_at': self.opened_at,
+            'retry_in': round(self.retry_in(), 1),
+        }
+
+    def restore(self, snapshot: Dict[str, Any]):
+        """Восстанавливает состояние, сохраненное snapshot()."""
+        state = snapshot.get('state', self.CLOSED)
+        if state == self.HALF_OPEN:
+            state = self.OPEN
+        if state == self.OPEN and snapshot.get('opened_at') is None:
+            state = self.CLOSED
+        self.state = state
+        self.failures = int(snapshot.get('failures', 0))
+        self.opened_at = snapshot.get('opened_at')
+        self._probe_in_flight = False
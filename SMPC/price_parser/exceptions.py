@@ -0,0 +1,46 @@
+class ParseError(Exception):
+    """
+    Базовая ошибка парсинга цены.
+
+    transient=True - ошибка временная (таймаут, 429/5xx, обрыв соединения)
+    и запрос имеет смысл повторить; False - повтор ничего не изменит.
+    """
+
+    transient = True
+
+    def __init__(self, message: str, name: str = None):
+        super().__init__(message)
+        self.name = name
+
+
+class TransientParseError(ParseError):
+    """Временная ошибка: запрос можно повторить."""
+
+    transient = True
+
+
+class RetryBudgetExhausted(TransientParseError):
+    """Бюджет повторов на текущий цикл исчерпан."""
+
+
+class PermanentParseError(ParseError):
+    """Постоянная ошибка: повторять запрос в этом цикле бессмысленно."""
+
+    transient = False
+
+
+class ItemNotFoundError(PermanentParseError):
+    """Страница товара не найдена или на ней нет item_nameid."""
+
+
+class NoPriceError(PermanentParseError):
+    """У товара нет ордеров на продажу."""
+
+
+class CircuitOpenError(TransientParseError):
+    """Запросы к endpoint Steam временно остановлены circuit breaker."""
+
+    def __init__(self, message: str, endpoint: str, retry_in: float, name: str = None):
+        super().__init__(message, name)
+        self.endpoint = endpoint
+        self.retry_in = retry_in
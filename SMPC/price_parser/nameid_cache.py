@@ -0,0 +1,125 @@
+import os
+import json
+import logging
+from typing import Dict, Optional
+
+
+class NameIdCache:
+    """
+    Постоянный кэш item_nameid товаров Steam Market.
+
+    item_nameid для market_hash_name никогда не меняется, поэтому его
+    достаточно один раз получить со страницы товара и сохранить на диск.
+    Ключ кэша - пара (listing_id, name).
+
+    На диске кэш хранится журналом JSON строк: новая запись дописывается
+    в конец файла, а файл целиком переписывается только при сжатии.
+    Файл старого формата (один JSON объект) читается и дополняется журналом.
+    """
+
+    def __init__(self, path: Optional[str] = 'nameid_cache.json'):
+        """
+        Args:
+            path: Путь к файлу журнала кэша. None - хранить только в памяти
+        """
+        self.path = path
+        self.logger = logging.getLogger(__name__)
+        self._ids: Dict[str, str] = {}
+        # Число строк в журнале на диске, включая устаревшие
+        self._records = 0
+        self._load()
+
+    @staticmethod
+    def _key(listing_id: int, name: str) -> str:
+        return f"{int(listing_id)}/{name.strip()}"
+
+    def _load(self):
+        """Загружает кэш с диска, применяя записи журнала по порядку."""
+        if not self.path or not os.path.exists(self.path):
+            return
+        # Журнал без перевода строки в конце (старый формат, оборванная запись)
+        # переписывается сразу, иначе следующая запись склеится с последней строкой
+        rewrite = False
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    rewrite = not line.endswith("\n")
+                    if not line.strip():
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Оборванная последняя строка после падения
+                        self.logger.warning(f"Пропущена поврежденная запись в {self.path}")
+                        continue
+                    self._records += 1
+                    if not isinstance(record, dict):
+                        continue
+                    if 'key' not in record:
+                        # Старый формат: весь кэш одним JSON объектом
+                        self._ids.update({str(k): str(v) for k, v in record.items()})
+                    elif record.get('id') is None:
+                        self._ids.pop(str(record['key']), None)
+                    else:
+                        self._ids[str(record['key'])] = str(record['id'])
+            self.logger.info(f"Загружено {len(self._ids)} item_nameid из {self.path}")
+        except OSError as e:
+            self.logger.error(f"Не удалось загрузить кэш item_nameid из {self.path}: {e}")
+            self._ids = {}
+            return
+        if rewrite:
+            self._compact()
+        else:
+            self._maybe_compact()
+
+    def _compact(self):
+        """Атомарно переписывает журнал, оставляя по одной записи на товар."""
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for key, name_id in self._ids.items():
+                    f.write(json.dumps({'key': key, 'id': name_id}, ensure_ascii=False) + "\n")
+            os.replace(tmp_path, self.path)
+            self._records = len(self._ids)
+        except OSError as e:
+            self.logger.error(f"Не удалось сжать кэш item_nameid в {self.path}: {e}")
+
+    def _maybe_compact(self):
+        """Сжимает журнал, когда устаревших записей в нем заметно больше актуальных."""
+        if self._records > max(1000, 4 * len(self._ids)):
+            self._compact()
+
+    def _append(self, key: str, name_id: Optional[str]):
+        """Дописывает запись в журнал (name_id None - удаление)."""
+        if not self.path:
+            return
+        try:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'key': key, 'id': name_id}, ensure_ascii=False) + "\n")
+            self._records += 1
+        except OSError as e:
+            self.logger.error(f"Не удалось сохранить item_nameid в {self.path}: {e}")
+        self._maybe_compact()
+
+    def get(self, listing_id: int, name: str) -> Optional[str]:
+        """Возвращает item_nameid из кэша или None."""
+        return self._ids.get(self._key(listing_id, name))
+
+    def set(self, listing_id: int, name: str, name_id: str):
+        """Сохраняет item_nameid в кэш."""
+        key = self._key(listing_id, name)
+        if self._ids.get(key) == name_id:
+            return
+        self._ids[key] = name_id
+        self._append(key, name_id)
+
+    def discard(self, listing_id: int, name: str):
+        """Удаляет запись из кэша."""
+        key = self._key(listing_id, name)
+        if self._ids.pop(key, None) is not None:
+            self._append(key, None)
+
+    def __len__(self) -> int:
+        return len(self._ids)
@@ -1,12 +1,24 @@
 import re
+import math
+import time
 import asyncio
 import logging
-from typing import Dict, Optional, Union, Tuple
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Optional, Union, Tuple, Iterable
 
 import aiohttp
 import yaml
 from enum import Enum
 
+from .nameid_cache import NameIdCache
+from .rate_limiter import AdaptiveRateLimiter
+from .retry import RetryPolicy, RetryBudget
+from .circuit_breaker import CircuitBreaker
+from .exceptions import (
+    ParseError, TransientParseError, RetryBudgetExhausted,
+    PermanentParseError, ItemNotFoundError, NoPriceError, CircuitOpenError
+)
+
 
 class Currency(Enum):
     USD = 1
@@ -16,16 +28,45 @@ class Currency(Enum):
 
 class PriceParser:
     
-    def __init__(self,  max_retries: int = 5, request_timeout: int = 10):
+    SEARCH_PAGE_SIZE = 100
+    NAME_ID_PATTERN = re.compile(rb"Market_LoadOrderSpread\(\s*(\d+)\s*\)")
+    NAME_ID_CHUNK_SIZE = 16 * 1024
+    # Перекрытие между чанками, чтобы не потерять токен на границе
+    NAME_ID_OVERLAP = 64
+    # Endpoint'ы Steam, для каждого из которых ведется свой circuit breaker
+    ENDPOINTS = ('listing', 'histogram', 'search')
+    
+    def __init__(self,  max_retries: int = 5, request_timeout: int = 10,
+                 nameid_cache_path: Optional[str] = 'nameid_cache.json',
+                 rate_limiter: Optional[AdaptiveRateLimiter] = None, result_ttl: float = 30,
+                 retry_policy: Optional[RetryPolicy] = None, retry_budget: Optional[RetryBudget] = None,
+                 breaker_failure_threshold: int = 5, breaker_recovery_timeout: float = 60):
         """
         Инициализация парсера цен Steam Market.
         
         Args:
             max_retries: Максимальное количество попыток повтора
             request_timeout: Таймаут для HTTP запросов в секундах
+            nameid_cache_path: Путь к файлу кэша item_nameid (None - только в памяти)
+            rate_limiter: Общий лимитер запросов к steamcommunity.com
+            result_ttl: Время жизни кэша результатов в секундах
+            retry_policy: Политика задержек между повторами (по умолчанию max_retries попыток)
+            retry_budget: Общий бюджет повторов на цикл обновления
+            breaker_failure_threshold: Сбоев подряд, после которых endpoint отключается
+            breaker_recovery_timeout: Пауза в секундах перед пробным запросом к отключенному endpoint
         """
         self.max_retries = max_retries
         self.request_timeout = request_timeout
+        self.rate_limiter = rate_limiter or AdaptiveRateLimiter()
+        self.result_ttl = result_ttl
+        self.retry_policy = retry_policy or RetryPolicy(max_attempts=max_retries)
+        self.retry_budget = retry_budget or RetryBudget()
+        self.breakers = {
+            endpoint: CircuitBreaker(endpoint, breaker_failure_threshold, breaker_recovery_timeout)
+            for endpoint in self.ENDPOINTS
+        }
+        self._inflight: Dict[Tuple, asyncio.Task] = {}
+        self._results: Dict[Tuple, Tuple[float, object]] = {}
         
         logging.basicConfig(
             level=logging.INFO,
@@ -36,6 +77,7 @@ class PriceParser:
             ]
         )
         self.logger = logging.getLogger(__name__)
+        self.nameid_cache = NameIdCache(nameid_cache_path)
         
         self.session = None
         self._connector = None
@@ -54,174 +96,391 @@ class PriceParser:
                 headers=headers
             )
 
-    async def parse_with_retries(self, name: str, listing_id: int = 730, currency: Currency = Currency.RUB) -> Optional[float]:
-        """Парсит цену товара с несколькими попытками."""
-        for _ in range(self.max_retries):
-            price = await self.parse(name, listing_id, currency)
-            if price is not None:
-                return price
-            await asyncio.sleep(1)
-        return None
-
-    async def parse_dual_currency_with_retries(self, name: str, listing_id: int = 730) -> Optional[Dict[str, float]]:
-        """Парсит цены товара в USD и RUB с несколькими попытками."""
-        for _ in range(self.max_retries):
-            prices = await self.parse_dual_currency(name, listing_id)
-            if prices is not None:
-                return prices
-            await asyncio.sleep(1)
-        return None
-
-    async def parse_dual_currency(self, name: str, listing_id: int = 730) -> Optional[Dict[str, float]]:
-        """Парсит цены товара в USD и RUB за один запрос."""
+    @asynccontextmanager
+    async def _get(self, url: str, endpoint: str):
+        """
+        GET запрос к Steam через общий лимитер и circuit breaker endpoint'а
+        с учетом 429/5xx и Retry-After.
+        """
+        breaker = self.breakers[endpoint]
+        breaker.before_call()
+        recorded = False
         try:
-            await self._ensure_session()
-            encoded_name = self.fix_name(name)
-            
-            # Получение ID товара
-            listing_url = f"https://steamcommunity.com/market/listings/{listing_id}/{encoded_name}"
-            self.logger.debug(f"Запрос страницы товара: {listing_url}")
-            
-            async with self.session.get(listing_url) as name_id_response:
-                name_id_response.raise_for_status()
-                html_text = await name_id_response.text()
-            
-            # Поиск ID товара в HTML
-            match = re.search(r"Market_LoadOrderSpread\(\s*(\d+)\s*\)", html_text)
-            if not match:
-                self.logger.warning(f"Не найден ID товара для '{name}' на странице")
-                return None
-                
-            name_id = match.group(1)
-            self.logger.debug(f"Найден ID товара: {name_id}")
-            
-            # Небольшая пауза между запросами
-            await asyncio.sleep(1)
-            
-            # Получение цен в обеих валютах
-            prices = {}
-            
-            # Получение цены в USD
-            usd_price = await self._get_price_for_currency(name, name_id, Currency.USD)
-            if usd_price is not None:
-                prices['usd'] = usd_price
-            
-            # Небольшая пауза между запросами
-            await asyncio.sleep(0.5)
-            
-            # Получение цены в RUB
-            rub_price = await self._get_price_for_currency(name, name_id, Currency.RUB)
-            if rub_price is not None:
-                prices['rub'] = rub_price
-            
-            if len(prices) == 2:
-                self.logger.debug(f"Получены цены для '{name}': USD={prices['usd']}, RUB={prices['rub']}")
-                return prices
-            else:
-                self.logger.warning(f"Не удалось получить цены в обеих валютах для '{name}'")
-                return None
-                
+            # Ожидание лимитера внутри try: отмена во время ожидания тоже отпускает пробный запрос
+            await self.rate_limiter.acquire()
+            async with self.session.get(url) as response:
+                if response.status == 429 or response.status >= 500:
+                    retry_after = self.rate_limiter.parse_retry_after(response.headers.get('Retry-After'))
+                    self.rate_limiter.on_throttle(retry_after)
+                    breaker.on_failure()
+                else:
+                    if response.status < 400:
+                        self.rate_limiter.on_success()
+                    # 4xx - сервер отвечает, endpoint работоспособен
+                    breaker.on_success()
+                recorded = True
+                response.raise_for_status()
+                yield response
         except asyncio.TimeoutError:
-            self.logger.error(f"Таймаут запроса для '{name}'")
-            return None
+            self.rate_limiter.on_throttle()
+            if not recorded:
+                breaker.on_failure()
+            raise
         except aiohttp.ClientConnectionError:
-            self.logger.error(f"Ошибка соединения для '{name}'")
-            return None
+            if not recorded:
+                breaker.on_failure()
+            raise
+        except BaseException:
+            # Ответа не было (например, отмена) - пробный запрос нужно отпустить
+            if not recorded:
+                breaker.release()
+            raise
+
+    @contextmanager
+    def _classify_errors(self, name: str):
+        """Переводит ошибки запроса в ParseError с признаком временной/постоянной ошибки."""
+        try:
+            yield
+        except ParseError:
+            raise
+        except asyncio.TimeoutError as e:
+            raise TransientParseError(f"Таймаут запроса для '{name}'", name) from e
         except aiohttp.ClientResponseError as e:
-            self.logger.error(f"HTTP ошибка для '{name}': {e}")
-            return None
+            if e.status == 404:
+                raise ItemNotFoundError(f"Товар '{name}' не найден (HTTP 404)", name) from e
+            raise TransientParseError(f"HTTP ошибка для '{name}': {e}", name) from e
+        except aiohttp.ClientConnectionError as e:
+            raise TransientParseError(f"Ошибка соединения для '{name}': {e}", name) from e
         except aiohttp.ClientError as e:
-            self.logger.error(f"Ошибка клиента для '{name}': {e}")
-            return None
+            raise TransientParseError(f"Ошибка клиента для '{name}': {e}", name) from e
         except Exception as e:
-            self.logger.error(f"Неожиданная ошибка при парсинге '{name}': {e}")
-            return None
+            raise TransientParseError(f"Неожиданная ошибка при парсинге '{name}': {e}", name) from e
 
-    async def _get_price_for_currency(self, name: str, name_id: str, currency: Currency) -> Optional[float]:
-        """Получает цену товара для конкретной валюты."""
-        try:
-            # Получение данных о ценах
-            price_url = (f"https://steamcommunity.com/market/itemordershistogram"
-                        f"?country=US&language=russian&currency={currency.value}&item_nameid={name_id}&two_factor=0")
+    def metrics(self) -> Dict[str, float]:
+        """Метрики лимитера запросов."""
+        return self.rate_limiter.metrics()
+
+    def open_circuits(self) -> Dict[str, float]:
+        """Разомкнутые endpoint'ы и сколько секунд до пробного запроса."""
+        return {
+            endpoint: breaker.retry_in()
+            for endpoint, breaker in self.breakers.items()
+            if breaker.is_open()
+        }
+
+    def state(self) -> Dict:
+        """Состояние лимитера и circuit breaker'ов для сохранения между запусками."""
+        return {
+            'limiter': self.rate_limiter.metrics(),
+            'breakers': {endpoint: breaker.snapshot() for endpoint, breaker in self.breakers.items()},
+        }
+
+    def restore_state(self, state: Dict):
+        """Восстанавливает состояние, сохраненное state()."""
+        rate = (state.get('limiter') or {}).get('rate')
+        if rate:
+            self.rate_limiter.rate = min(self.rate_limiter.max_rate, max(self.rate_limiter.min_rate, float(rate)))
+        for endpoint, snapshot in (state.get('breakers') or {}).items():
+            if endpoint in self.breakers:
+                self.breakers[endpoint].restore(snapshot)
+
+    async def _single_flight(self, key: Tuple, factory):
+        """
+        Объединяет одновременные запросы с одинаковым ключом в один.
+
+        Пока запрос выполняется, остальные вызовы ждут его результат,
+        успешный результат затем хранится result_ttl секунд.
+        """
+        cached = self._results.get(key)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+        
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finish_flight(key, t))
+        return await asyncio.shield(task)
+
+    def _finish_flight(self, key: Tuple, task: asyncio.Task):
+        """Снимает запрос с учета и кэширует успешный результат."""
+        self._inflight.pop(key, None)
+        if task.cancelled() or task.exception() is not None or task.result() is None:
+            return
+        now = time.monotonic()
+        if len(self._results) > 1024:
+            self._results = {k: v for k, v in self._results.items() if v[0] > now}
+        self._results[key] = (now + self.result_ttl, task.result())
+
+    @staticmethod
+    def _flight_key(name: str, listing_id: int, currency: str) -> Tuple:
+        return int(listing_id), name.strip(), currency
+
+    async def parse_with_retries(self, name: str, listing_id: int = 730, currency: Currency = Currency.RUB) -> float:
+        """
+        Парсит цену товара с повторами по retry_policy.
+
+        Raises:
+            PermanentParseError: Товар не найден или у него нет цены - без повторов
+            TransientParseError: Попытки или бюджет повторов исчерпаны
+        """
+        return await self._single_flight(
+            self._flight_key(name, listing_id, currency.name),
+            lambda: self._parse_with_retries(name, listing_id, currency)
+        )
+
+    async def _parse_with_retries(self, name: str, listing_id: int, currency: Currency) -> float:
+        prices = await self._parse_multi_currency_with_retries(name, listing_id, (currency,))
+        return prices[currency.name.lower()]
+
+    async def parse_dual_currency_with_retries(self, name: str, listing_id: int = 730) -> Dict[str, float]:
+        """Парсит цены товара в USD и RUB с повторами (ошибки как у parse_with_retries)."""
+        return await self.parse_multi_currency_with_retries(name, listing_id, (Currency.USD, Currency.RUB))
+
+    async def parse_multi_currency_with_retries(self, name: str, listing_id: int = 730,
+                                                currencies: Iterable[Currency] = (Currency.USD, Currency.RUB)) -> Dict[str, float]:
+        """Парсит цены товара в нескольких валютах с повторами (ошибки как у parse_with_retries)."""
+        currencies = tuple(currencies)
+        return await self._single_flight(
+            self._flight_key(name, listing_id, '+'.join(currency.name for currency in currencies)),
+            lambda: self._parse_multi_currency_with_retries(name, listing_id, currencies)
+        )
+
+    async def _parse_multi_currency_with_retries(self, name: str, listing_id: int,
+                                                 currencies: Tuple[Currency, ...]) -> Dict[str, float]:
+        # Полученные цены сохраняются между попытками, повторно запрашиваются только недостающие валюты
+        prices: Dict[str, float] = {}
+        attempt = 0
+        while True:
+            missing = [currency for currency in currencies if currency.name.lower() not in prices]
+            try:
+                prices.update(await self.fetch_multi_currency(name, listing_id, missing))
+            except (PermanentParseError, CircuitOpenError):
+                raise
+            except TransientParseError as e:
+                error = e
+            else:
+                if len(prices) == len(currencies):
+                    return prices
+                error = TransientParseError(f"Получены не все валюты для '{name}'", name)
             
-            self.logger.debug(f"Запрос данных о ценах в {currency.name}: {price_url}")
+            attempt += 1
+            if attempt >= self.retry_policy.max_attempts:
+                raise error
+            if not self.retry_budget.try_spend():
+                raise RetryBudgetExhausted(f"Бюджет повторов исчерпан, '{name}' пропущен", name) from error
+            delay = self.retry_policy.delay(attempt)
+            self.logger.warning(f"Попытка {attempt} для '{name}' не удалась: {error}. Повтор через {delay:.1f}с")
+            await asyncio.sleep(delay)
+
+    async def parse_dual_currency(self, name: str, listing_id: int = 730) -> Optional[Dict[str, float]]:
+        """Парсит цены товара в USD и RUB за один запрос."""
+        prices = await self.parse_multi_currency(name, listing_id, (Currency.USD, Currency.RUB))
+        if len(prices) == 2:
+            self.logger.debug(f"Получены цены для '{name}': USD={prices['usd']}, RUB={prices['rub']}")
+            return prices
+        self.logger.warning(f"Не удалось получить цены в обеих валютах для '{name}'")
+        return None
+
+    async def parse_multi_currency(self, name: str, listing_id: int = 730,
+                                   currencies: Iterable[Currency] = (Currency.USD, Currency.RUB)) -> Dict[str, float]:
+        """
+        Парсит цены товара в нескольких валютах, запрашивая валюты параллельно.
+
+        Returns:
+            Словарь {код валюты в нижнем регистре: цена} только для полученных валют
+        """
+        try:
+            return await self.fetch_multi_currency(name, listing_id, currencies)
+        except PermanentParseError as e:
+            self.logger.warning(str(e))
+            return {}
+        except ParseError as e:
+            self.logger.error(str(e))
+            return {}
+
+    async def fetch_multi_currency(self, name: str, listing_id: int = 730,
+                                   currencies: Iterable[Currency] = (Currency.USD, Currency.RUB)) -> Dict[str, float]:
+        """
+        Одна попытка получить цены товара в нескольких валютах.
+
+        Returns:
+            Словарь {код валюты в нижнем регистре: цена}, в котором есть хотя бы одна валюта
+
+        Raises:
+            PermanentParseError: Товар не найден или у него нет цены
+            TransientParseError: Не получено ни одной цены из-за временной ошибки
+        """
+        await self._ensure_session()
+        
+        # Получение ID товара (из кэша или со страницы товара)
+        name_id = await self._get_name_id(name, listing_id)
+        
+        currencies = tuple(currencies)
+        results = await asyncio.gather(
+            *(self._get_price_for_currency(name, name_id, currency) for currency in currencies),
+            return_exceptions=True
+        )
+        prices = {
+            currency.name.lower(): result
+            for currency, result in zip(currencies, results)
+            if not isinstance(result, BaseException)
+        }
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if prices or not errors:
+            for error in errors:
+                self.logger.warning(str(error))
+            return prices
+        # Постоянная ошибка и разомкнутая цепь важнее временной: повторять такой запрос бессмысленно
+        raise next(
+            (error for error in errors if isinstance(error, (PermanentParseError, CircuitOpenError))),
+            errors[0]
+        )
+
+    async def _get_name_id(self, name: str, listing_id: int) -> str:
+        """Возвращает item_nameid товара, загружая страницу товара только при промахе кэша."""
+        name_id = self.nameid_cache.get(listing_id, name)
+        if name_id is not None:
+            self.logger.debug(f"ID товара '{name}' взят из кэша: {name_id}")
+            return name_id
+        
+        encoded_name = self.fix_name(name)
+        listing_url = f"https://steamcommunity.com/market/listings/{listing_id}/{encoded_name}"
+        self.logger.debug(f"Запрос страницы товара: {listing_url}")
+        
+        with self._classify_errors(name):
+            async with self._get(listing_url, 'listing') as name_id_response:
+                name_id = await self._scan_name_id(name_id_response)
+        
+        if name_id is None:
+            raise ItemNotFoundError(f"Не найден ID товара для '{name}' на странице", name)
+        
+        self.logger.debug(f"Найден ID товара: {name_id}")
+        self.nameid_cache.set(listing_id, name, name_id)
+        return name_id
+
+    async def _scan_name_id(self, response) -> Optional[str]:
+        """
+        Ищет Market_LoadOrderSpread(<id>) в теле страницы по мере чтения чанков.
+
+        Как только токен найден, соединение закрывается без дочитывания страницы.
+        """
+        tail = b''
+        async for chunk in response.content.iter_chunked(self.NAME_ID_CHUNK_SIZE):
+            buffer = tail + chunk
+            match = self.NAME_ID_PATTERN.search(buffer)
+            if match:
+                response.close()
+                return match.group(1).decode('ascii')
+            tail = buffer[-self.NAME_ID_OVERLAP:]
+        return None
+
+    async def _get_price_for_currency(self, name: str, name_id: str, currency: Currency) -> float:
+        """Получает цену товара для конкретной валюты."""
+        # Получение данных о ценах
+        price_url = (f"https://steamcommunity.com/market/itemordershistogram"
+                    f"?country=US&language=russian&currency={currency.value}&item_nameid={name_id}&two_factor=0")
+        
+        self.logger.debug(f"Запрос данных о ценах в {currency.name}: {price_url}")
+        
+        with self._classify_errors(name):
+            async with self._get(price_url, 'histogram') as response:
+                data = await response.json()
             
-            async with self.session.get(price_url) as response:
-                response.raise_for_status()
-                
-                try:
-                    data = await response.json()
-                except aiohttp.ContentTypeError as e:
-                    self.logger.error(f"Не удалось декодировать JSON ответ для '{name}' в {currency.name}: {e}")
-                    return None
+            # success != 1 - Steam не смог отдать данные, это временная ошибка
+            if data.get("success") != 1:
+                raise TransientParseError(
+                    f"Steam вернул success={data.get('success')} для '{name}' в {currency.name}", name
+                )
             
             # Проверка наличия данных о цене
-            if "lowest_sell_order" not in data:
-                self.logger.warning(f"Отсутствует информация о минимальной цене для '{name}' в {currency.name}")
-                return None
-                
-            if data["lowest_sell_order"] is None:
-                self.logger.warning(f"Минимальная цена для '{name}' в {currency.name} равна null")
-                return None
+            if data.get("lowest_sell_order") is None:
+                raise NoPriceError(f"Нет ордеров на продажу для '{name}' в {currency.name}", name)
             
             try:
                 lowest_sell_order = int(data["lowest_sell_order"])
-                price = lowest_sell_order / 100
-                self.logger.debug(f"Получена цена для '{name}' в {currency.name}: {price}")
-                return price
-                
             except (ValueError, TypeError) as e:
-                self.logger.error(f"Не удалось преобразовать цену для '{name}' в {currency.name}: {data['lowest_sell_order']}, ошибка: {e}")
-                return None
-                
-        except Exception as e:
-            self.logger.error(f"Ошибка при получении цены для '{name}' в {currency.name}: {e}")
-            return None
+                raise TransientParseError(
+                    f"Не удалось преобразовать цену для '{name}' в {currency.name}: {data['lowest_sell_order']}, ошибка: {e}",
+                    name
+                ) from e
+        
+        price = lowest_sell_order / 100
+        self.logger.debug(f"Получена цена для '{name}' в {currency.name}: {price}")
+        return price
     
     async def parse(self, name: str, listing_id: int = 730, currency: Currency = Currency.RUB) -> Optional[float]:
         """Парсит цену товара с одной попытки в указанной валюте."""
-        try:
-            await self._ensure_session()
-            encoded_name = self.fix_name(name)
-            
-            # Получение ID товара
-            listing_url = f"https://steamcommunity.com/market/listings/{listing_id}/{encoded_name}"
-            self.logger.debug(f"Запрос страницы товара: {listing_url}")
-            
-            async with self.session.get(listing_url) as name_id_response:
-                name_id_response.raise_for_status()
-                html_text = await name_id_response.text()
-            
-            # Поиск ID товара в HTML
-            match = re.search(r"Market_LoadOrderSpread\(\s*(\d+)\s*\)", html_text)
-            if not match:
-                self.logger.warning(f"Не найден ID товара для '{name}' на странице")
-                return None
-                
-            name_id = match.group(1)
-            self.logger.debug(f"Найден ID товара: {name_id}")
+        prices = await self.parse_multi_currency(name, listing_id, (currency,))
+        return prices.get(currency.name.lower())
+
+    async def parse_bulk(self, names_by_listing: Dict[int, Iterable[str]], currency: Currency = Currency.USD,
+                         max_pages: int = 300, pages_per_item: float = 1.0) -> Dict[Tuple[int, str], float]:
+        """
+        Получает минимальные цены продажи пачками до 100 товаров за запрос
+        через JSON поиска маркета (/market/search/render/?norender=1).
+
+        Страницы приложения перебираются, пока не найдены все запрошенные товары,
+        не кончилась выдача (total_count) или не исчерпан лимит страниц. По алфавиту
+        проход не останавливается: порядок sort_column=name у Steam не совпадает
+        с сортировкой строк Python (★, знаки препинания, не-ASCII). Лимит зависит от
+        числа запрошенных товаров: поштучный запрос стоит одну страницу на товар,
+        поэтому больше страниц пакетный проход не окупает. Если цепь endpoint'а поиска
+        разомкнута, проход прекращается: остальные приложения тоже не ответят.
+
+        Args:
+            names_by_listing: Названия товаров (market_hash_name) по appid
+            currency: Валюта цен
+            max_pages: Максимум страниц на одно приложение
+            pages_per_item: Максимум страниц на один запрошенный товар
+
+        Returns:
+            Словарь {(listing_id, name): цена} для найденных товаров
+        """
+        await self._ensure_session()
+        prices: Dict[Tuple[int, str], float] = {}
+        
+        for listing_id, names in names_by_listing.items():
+            listing_id = int(listing_id)
+            wanted = {name.strip() for name in names}
+            requested = len(wanted)
+            page_limit = min(max_pages, max(1, math.ceil(requested * pages_per_item)))
+            start = 0
+            pages = 0
             
-            # Небольшая пауза между запросами
-            await asyncio.sleep(1)
+            try:
+                while wanted and pages < page_limit:
+                    search_url = (f"https://steamcommunity.com/market/search/render/"
+                                  f"?norender=1&appid={listing_id}&start={start}&count={self.SEARCH_PAGE_SIZE}"
+                                  f"&sort_column=name&sort_dir=asc&currency={currency.value}")
+                    self.logger.debug(f"Запрос страницы поиска: {search_url}")
+                    
+                    async with self._get(search_url, 'search') as response:
+                        data = await response.json(content_type=None)
+                    pages += 1
+                    
+                    results = data.get('results') or []
+                    for result in results:
+                        hash_name = result.get('hash_name')
+                        sell_price = result.get('sell_price')
+                        if hash_name in wanted and sell_price:
+                            prices[(listing_id, hash_name)] = int(sell_price) / 100
+                            wanted.discard(hash_name)
+                    
+                    start += len(results)
+                    if not results or start >= int(data.get('total_count') or 0):
+                        break
+            except CircuitOpenError as e:
+                self.logger.warning(f"Пакетное получение цен в {currency.name} остановлено на appid {listing_id}: "
+                                    f"{e}, остальные товары будут получены поштучно")
+                break
+            except Exception as e:
+                self.logger.error(f"Ошибка пакетного получения цен для appid {listing_id} в {currency.name}: {e}")
             
-            # Получение цены в указанной валюте
-            return await self._get_price_for_currency(name, name_id, currency)
-                
-        except asyncio.TimeoutError:
-            self.logger.error(f"Таймаут запроса для '{name}'")
-            return None
-        except aiohttp.ClientConnectionError:
-            self.logger.error(f"Ошибка соединения для '{name}'")
-            return None
-        except aiohttp.ClientResponseError as e:
-            self.logger.error(f"HTTP ошибка для '{name}': {e}")
-            return None
-        except aiohttp.ClientError as e:
-            self.logger.error(f"Ошибка клиента для '{name}': {e}")
-            return None
-        except Exception as e:
-            self.logger.error(f"Неожиданная ошибка при парсинге '{name}': {e}")
-            return None
+            self.logger.info(f"Пакетно получено цен для appid {listing_id} в {currency.name}: "
+                             f"{requested - len(wanted)} из {requested}, {pages} страниц")
+        
+        return prices
 
     def fix_name(self, name: str) -> str:
         """Кодирует название товара для URL."""
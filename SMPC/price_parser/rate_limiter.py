@@ -0,0 +1,134 @@
+import time
+import asyncio
+import logging
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+
+class TokenBucket:
+    """
+    Асинхронный token bucket.
+
+    Токены пополняются со скоростью rate в секунду до capacity,
+    каждый acquire() забирает один токен или ждет его появления.
+    pause() останавливает выдачу токенов на заданное время.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        """
+        Args:
+            rate: Скорость пополнения (токенов в секунду)
+            capacity: Максимальное число накопленных токенов (по умолчанию max(1, rate))
+        """
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity is not None else max(1.0, self.rate)
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _delay(self) -> float:
+        """Сколько ждать до появления токена."""
+        blocked = self._blocked_until - time.monotonic()
+        if blocked > 0:
+            return blocked
+        self._refill()
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(self):
+        """Дождаться и забрать один токен."""
+        async with self._lock:
+            delay = self._delay()
+            while delay > 0:
+                await asyncio.sleep(delay)
+                delay = self._delay()
+            self.tokens -= 1
+
+    def pause(self, delay: float):
+        """Не выдавать токены delay секунд (накопленный запас сгорает)."""
+        self._refill()
+        self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+        self.tokens = min(self.tokens, 0.0)
+
+
+class AdaptiveRateLimiter(TokenBucket):
+    """
+    Token bucket с AIMD-подстройкой скорости под ответы сервера.
+
+    Успешные ответы увеличивают скорость аддитивно (примерно на increase
+    запросов в секунду за секунду работы), ответы 429/5xx уменьшают ее
+    мультипликативно и приостанавливают запросы на Retry-After.
+    """
+
+    def __init__(self, rate: float = 2.0, min_rate: float = 0.2, max_rate: float = 10.0,
+                 increase: float = 0.05, decrease: float = 0.5, default_backoff: float = 5.0):
+        """
+        Args:
+            rate: Начальная скорость (запросов в секунду)
+            min_rate: Минимальная скорость
+            max_rate: Максимальная скорость
+            increase: Аддитивный прирост скорости
+            decrease: Множитель скорости при троттлинге
+            default_backoff: Пауза в секундах, если сервер не прислал Retry-After
+        """
+        super().__init__(rate, capacity=1)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.default_backoff = default_backoff
+        self.logger = logging.getLogger(__name__)
+
+        self.successes = 0
+        self.throttles = 0
+
+    def on_success(self):
+        """Учесть успешный ответ."""
+        self.successes += 1
+        self._refill()
+        self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+
+    def on_throttle(self, retry_after: Optional[float] = None):
+        """Учесть ответ 429/5xx или таймаут."""
+        self.throttles += 1
+        self._refill()
+        self.rate = max(self.min_rate, self.rate * self.decrease)
+        pause = retry_after if retry_after is not None else self.default_backoff
+        self.pause(pause)
+        self.logger.warning(f"Steam ограничивает запросы: скорость снижена до {self.rate:.2f}/с, пауза {pause:.1f}с")
+
+    @staticmethod
+    def parse_retry_after(value: Optional[str]) -> Optional[float]:
+        """Разбирает заголовок Retry-After (секунды или HTTP-дата)."""
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+    def metrics(self) -> Dict[str, float]:
+        """Текущее состояние лимитера."""
+        return {
+            'rate': round(self.rate, 3),
+            'min_rate': self.min_rate,
+            'max_rate': self.max_rate,
+            'blocked_for': round(max(0.0, self._blocked_until - time.monotonic()), 3),
+            'successes': self.successes,
+            'throttles': self.throttles,
+        }
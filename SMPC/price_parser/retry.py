@@ -0,0 +1,67 @@
+import random
+from typing import Optional
+
+
+class RetryPolicy:
+    """
+    Экспоненциальная задержка между попытками с полным джиттером.
+
+    Задержка перед попыткой n выбирается случайно из
+    [0, min(max_delay, base_delay * multiplier ** (n - 1))], чтобы
+    одновременные повторы не приходили в Steam синхронной волной.
+    """
+
+    def __init__(self, max_attempts: int = 5, base_delay: float = 0.5,
+                 max_delay: float = 30.0, multiplier: float = 2.0):
+        """
+        Args:
+            max_attempts: Максимальное количество попыток (включая первую)
+            base_delay: Задержка перед первым повтором в секундах
+            max_delay: Верхняя граница задержки в секундах
+            multiplier: Множитель задержки для каждой следующей попытки
+        """
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+
+    def delay(self, attempt: int) -> float:
+        """Задержка перед повтором после attempt неудачных попыток."""
+        ceiling = min(self.max_delay, self.base_delay * self.multiplier ** max(0, attempt - 1))
+        return random.uniform(0, ceiling)
+
+
+class RetryBudget:
+    """
+    Общий бюджет повторов на один цикл обновления цен.
+
+    Каждый повтор любого товара расходует одну единицу, после исчерпания
+    бюджета запросы больше не повторяются до reset().
+    """
+
+    def __init__(self, limit: Optional[int] = None):
+        """
+        Args:
+            limit: Количество повторов на цикл (None - без ограничения)
+        """
+        self.limit = limit
+        self.spent = 0
+
+    def try_spend(self) -> bool:
+        """Забирает один повтор из бюджета, если он еще есть."""
+        if self.limit is not None and self.spent >= self.limit:
+            return False
+        self.spent += 1
+        return True
+
+    @property
+    def remaining(self) -> Optional[int]:
+        if self.limit is None:
+            return None
+        return max(0, self.limit - self.spent)
+
+    def reset(self, limit: Optional[int] = None):
+        """Начинает новый цикл, при необходимости с новым лимитом."""
+        if limit is not None:
+            self.limit = limit
+        self.spent = 0
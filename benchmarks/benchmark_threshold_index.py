@@ -0,0 +1,130 @@
+"""
+Бенчмарк индекса порогов против перебора строк watchlist в стиле get_watchlist_price_alerts
+
+Запуск из корня репозитория: python -m benchmarks.benchmark_threshold_index [--rows 1000000] [--items 10000] [--changes 1000]
+"""
+import argparse
+import random
+import time
+import uuid
+
+from SMPC.api.threshold_index import ThresholdIndex, WatchlistThreshold
+
+
+def generate_rows(rows: int, items: int, seed: int):
+    """Случайный watchlist: пороги вокруг базовой цены предмета, треть пользователей в RUB"""
+    rng = random.Random(seed)
+    item_ids = [uuid.UUID(int=rng.getrandbits(128)) for _ in range(items)]
+    prices = {item_id: round(rng.uniform(0.03, 500), 2) for item_id in item_ids}
+    user_ids = [uuid.UUID(int=rng.getrandbits(128)) for _ in range(max(1, rows // 20))]
+    currencies = {user_id: 'RUB' if rng.random() < 1 / 3 else 'USD' for user_id in user_ids}
+    
+    watchlist = []
+    for _ in range(rows):
+        item_id = rng.choice(item_ids)
+        user_id = rng.choice(user_ids)
+        rate = 90.0 if currencies[user_id] == 'RUB' else 1.0
+        price = prices[item_id] * rate
+        watchlist.append(WatchlistThreshold(
+            watchlist_id=uuid.UUID(int=rng.getrandbits(128)),
+            user_id=user_id,
+            item_id=item_id,
+            currency=currencies[user_id],
+            buy_target_price=round(price * rng.uniform(0.7, 1.0), 2),
+            sell_target_price=round(price * rng.uniform(1.0, 1.3), 2),
+        ))
+    return watchlist, prices
+
+
+def generate_changes(prices, count: int, seed: int):
+    """Изменения цен в пределах ±10%"""
+    rng = random.Random(seed + 1)
+    changes = []
+    for item_id in rng.sample(list(prices), min(count, len(prices))):
+        old_usd = prices[item_id]
+        new_usd = round(old_usd * rng.uniform(0.9, 1.1), 2)
+        changes.append({
+            'id': item_id,
+            'old_usd': old_usd, 'old_rub': round(old_usd * 90.0, 2),
+            'new_usd': new_usd, 'new_rub': round(new_usd * 90.0, 2),
+        })
+    return changes
+
+
+def scan_crossed(watchlist, changes):
+    """
+    Перебор всех строк, как в цикле get_watchlist_price_alerts: для каждой строки выбирается цена
+    в валюте пользователя и сравнивается с порогами (до и после изменения)
+    """
+    by_item = {change['id']: change for change in changes}
+    crossed = set()
+    for row in watchlist:
+        change = by_item.get(row.item_id)
+        if change is None:
+            continue
+        if row.currency.lower() == 'rub':
+            old_price, new_price = change['old_rub'], change['new_rub']
+        else:
+            old_price, new_price = change['old_usd'], change['new_usd']
+        buy_target = round(row.buy_target_price, 2)
+        sell_target = round(row.sell_target_price, 2)
+        was_buy = round(old_price, 2) <= buy_target
+        is_buy = round(new_price, 2) <= buy_target
+        was_sell = round(old_price, 2) >= sell_target
+        is_sell = round(new_price, 2) >= sell_target
+        if (is_buy and not was_buy) or (is_sell and not was_sell):
+            crossed.add(row.watchlist_id)
+    return crossed
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000, help='Строк watchlist')
+    parser.add_argument('--items', type=int, default=10_000, help='Различных предметов')
+    parser.add_argument('--changes', type=int, default=1_000, help='Изменений цен в одном цикле')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    
+    print(f"Generating {args.rows} watchlist rows over {args.items} items...")
+    watchlist, prices = generate_rows(args.rows, args.items, args.seed)
+    changes = generate_changes(prices, args.changes, args.seed)
+    
+    index = ThresholdIndex()
+    _, build_time = timed(index.build, watchlist)
+    print(f"Index build: {build_time:.2f}s")
+    
+    # Одно изменение цены: перебор всех строк против поиска в индексе
+    single = changes[:1]
+    scan_single, scan_single_time = timed(scan_crossed, watchlist, single)
+    index_single, index_single_time = timed(index.crossed_by_changes, single)
+    assert scan_single == index_single, "index and scan disagree"
+    
+    # Цикл обновления цен: все изменения сразу, перебор строк один раз
+    scan_all, scan_all_time = timed(scan_crossed, watchlist, changes)
+    index_all, index_all_time = timed(index.crossed_by_changes, changes)
+    assert scan_all == index_all, "index and scan disagree"
+    
+    print(f"1 price change:     scan {scan_single_time * 1000:9.2f} ms, "
+          f"index {index_single_time * 1000:9.3f} ms, {len(index_single)} crossed")
+    print(f"{len(changes)} price changes: scan {scan_all_time * 1000:9.2f} ms, "
+          f"index {index_all_time * 1000:9.3f} ms, {len(index_all)} crossed")
+    print(f"Speedup: x{scan_single_time / max(index_single_time, 1e-9):.0f} per change, "
+          f"x{scan_all_time / max(index_all_time, 1e-9):.0f} per cycle")
+    
+    # Обновление порогов через эндпоинты: вставка/удаление в отсортированные массивы
+    sample = random.Random(args.seed + 2).sample(watchlist, min(1000, len(watchlist)))
+    started = time.perf_counter()
+    for row in sample:
+        index.update_targets(row.watchlist_id, row.buy_target_price * 0.99, row.sell_target_price * 1.01)
+    update_time = time.perf_counter() - started
+    print(f"Target update: {update_time / len(sample) * 1e6:.1f} us per entry")
+
+
+if __name__ == '__main__':
+    main()